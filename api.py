@@ -1,10 +1,18 @@
 from flask import Flask, request, jsonify
 import json
 import os
+import sys
 from datetime import datetime, timedelta, UTC
 from jose import JWTError, jwt
 from functools import wraps
 
+from utils.special_limits import (
+    parse_rows,
+    save_special_limits,
+    set_row_statuses,
+    validate_rows,
+)
+
 # Constants
 CONFIG_FILE = 'config.json'
 LOG_FILE = 'cronjob_log.log'
@@ -25,11 +33,6 @@ SECRET_KEY = _config["SECRET_KEY"]
 API_USERNAME = _config["API_USERNAME"]
 API_PASSWORD = _config["API_PASSWORD"]
 
-def save_config(config):
-    """Save configuration to config file"""
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4)
-
 def log(message):
     """Write log to file"""
     with open(LOG_FILE, 'a', encoding='utf-8') as f:
@@ -106,22 +109,30 @@ def update_special_limit(username):
     if limit < 0:
         return jsonify({'error': 'Limit must be a positive number'}), 400
 
-    config = load_config()
-
-    # Check if user exists in SPECIAL_LIMIT
-    special_limit = config.get('SPECIAL_LIMIT', [])
-    for i, (existing_user, existing_limit) in enumerate(special_limit):
-        if existing_user == user:
-            special_limit[i] = [user, limit]
-            config['SPECIAL_LIMIT'] = special_limit
-            save_config(config)
-            return jsonify({'status': 'updated', 'user': user, 'limit': limit}), 200
-
-    # If user doesn't exist, add it
-    special_limit.append([user, limit])
-    config['SPECIAL_LIMIT'] = special_limit
-    save_config(config)
+    previous = save_special_limits(load_config(), {user: limit})
+    if user in previous:
+        return jsonify({'status': 'updated', 'user': user, 'limit': limit}), 200
     return jsonify({'status': 'added', 'user': user, 'limit': limit}), 201
 
+@app.route('/update_special_limits', methods=['POST'])
+@token_required
+def update_special_limits(username):
+    """Update the special limits of many users (JSON or CSV body) with one write"""
+    if username != API_USERNAME:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        rows = parse_rows(request.get_data(as_text=True), request.content_type or '')
+    except ValueError as error:
+        return jsonify({'error': f'Invalid body: {error}'}), 400
+
+    limits, results = validate_rows(rows)
+    previous = save_special_limits(load_config(), limits) if limits else {}
+    summary = set_row_statuses(results, previous)
+    return jsonify({**summary, 'results': results}), 200 if limits else 400
+
 if __name__ == '__main__':
+    if _config.get("API_EMBEDDED"):
+        print("API_EMBEDDED is enabled, the API is served by marzneshiniplimit.py")
+        sys.exit()
     app.run(host="0.0.0.0" ,port=int(os.environ.get('PORT', 6284)))
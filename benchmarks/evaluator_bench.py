@@ -0,0 +1,61 @@
+"""
+Benchmark of the pure-Python and NumPy evaluators of the usage check.
+
+Run it from the project root (NumPy must be installed):
+    python -m benchmarks.evaluator_bench
+"""
+
+import random
+import time
+
+from utils.evaluator import evaluate_numpy, evaluate_python, load_numpy
+
+
+def build_active_users(users: int, seed: int = 7) -> dict[str, list[str]]:
+    """
+    Build the observations of a check interval: each user has 1-4 IPs
+    seen 1-8 times each, IPs are shared between a few users.
+    """
+    rng = random.Random(seed)
+    active_users = {}
+    for number in range(users):
+        ips = []
+        for _ in range(rng.randint(1, 4)):
+            ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(64)}"
+            ips.extend([ip] * rng.randint(1, 8))
+        rng.shuffle(ips)
+        active_users[f"{number}.user_{number}"] = ips
+    return active_users
+
+
+def measure(func, active_users: dict[str, list[str]], rounds: int = 3) -> float:
+    """Return the best seconds per run of 'func'."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(active_users)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Print the time of both evaluators for a few numbers of users."""
+    if not load_numpy():
+        print("NumPy is not installed, use: 'pip install numpy'")
+        return
+    for users in (10_000, 50_000, 200_000):
+        active_users = build_active_users(users)
+        observations = sum(len(ips) for ips in active_users.values())
+        python_result = evaluate_python(active_users)
+        numpy_result = evaluate_numpy(active_users)
+        same = list(python_result) == list(numpy_result) and all(
+            sorted(python_result[user]) == sorted(numpy_result[user]) for user in python_result
+        )
+        print(f"users: {users}, observations: {observations}, same result: {same}")
+        for name, func in (("python", evaluate_python), ("numpy", evaluate_numpy)):
+            seconds = measure(func, active_users)
+            print(f"  {name:<8} time: {seconds * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
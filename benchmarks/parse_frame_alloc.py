@@ -0,0 +1,68 @@
+"""
+Allocation benchmark of the text and bytes log parsing paths.
+
+Run it from the project root (it needs 'config.json'):
+    python -m benchmarks.parse_frame_alloc
+"""
+
+import time
+import tracemalloc
+
+from utils.parse_logs import extract_log_entries, extract_log_entries_bytes
+
+NOISE_LINE = (
+    "2023/07/07 03:09:00 [Info] [3858357221] proxy/freedom: connection opened to "
+    "tcp:gateway.instagram.com:443, local endpoint 2.56.98.255:32906, "
+    "remote endpoint 157.240.0.1:443"
+)
+ACCEPTED_LINE = (
+    "2023/07/07 03:09:00 151.232.190.{n}:57288 accepted tcp:gateway.instagram.com:443 "
+    "[REALITY TCP 4 -> IPv4] email: {n}.user_{n}"
+)
+
+
+def build_frame(lines: int = 5000, accepted_ratio: int = 5) -> bytes:
+    """Build a websocket frame with one accepted line every 'accepted_ratio' lines."""
+    rows = [
+        ACCEPTED_LINE.format(n=i % 250) if i % accepted_ratio == 0 else NOISE_LINE
+        for i in range(lines)
+    ]
+    return "\n".join(rows).encode()
+
+
+def old_path(frame: bytes) -> int:
+    """The old path: str(frame), splitlines() and per-line str regexes."""
+    return sum(1 for _ in extract_log_entries(frame.decode()))
+
+
+def new_path(frame: bytes) -> int:
+    """The new path: byte patterns against a memoryview, decode only the fragments."""
+    return sum(
+        1 for ip, email in extract_log_entries_bytes(frame) if ip.decode() and email.decode()
+    )
+
+
+def measure(func, frame: bytes, rounds: int = 20) -> tuple[int, float]:
+    """Return (peak allocated bytes, seconds per frame) of 'func'."""
+    tracemalloc.start()
+    func(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(frame)
+    return peak, (time.perf_counter() - start) / rounds
+
+
+def main():
+    """Print the allocation and time of both paths for a few frame sizes."""
+    for lines in (500, 5000, 50000):
+        frame = build_frame(lines)
+        print(f"frame: {lines} lines, {len(frame) / 1024:.0f} KiB")
+        for name, func in (("str + splitlines", old_path), ("bytes + memoryview", new_path)):
+            peak, seconds = measure(func, frame)
+            print(f"  {name:<20} peak: {peak / 1024:>8.0f} KiB  time: {seconds * 1000:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,10 @@ import argparse
 import asyncio
 
 from run_telegram import run_telegram_bot
-from utils.check_usage import run_check_users_usage
+from utils.check_usage import run_check_users_usage, run_violation_handler
+from utils.data_dir import prepare_data_dir
+from utils.detector import DETECTOR
+from utils.enforcement import ENFORCEMENT
 from utils.get_logs import (
     TASKS,
     check_and_add_new_nodes,
@@ -16,22 +19,32 @@ from utils.get_logs import (
     handle_cancel_all,
 )
 from utils.handel_dis_users import DisabledUsers
+from utils.log_ingest import run_log_ingest
 from utils.logs import logger
+from utils.node_cache import NODE_CACHE
 from utils.panel_api import (
     enable_dis_user,
-    enable_selected_users,
     get_nodes,
 )
 from utils.read_config import read_config
+from utils.startup_profile import print_startup_profile
 from utils.types import PanelType
+from utils.user_directory import USER_DIRECTORY
+from utils.webhook import WEBHOOK
 
 VERSION = "1.0.6"
 
 parser = argparse.ArgumentParser(description="Help message")
 parser.add_argument("--version", action="version", version=VERSION)
+parser.add_argument(
+    "--profile-startup",
+    action="store_true",
+    help="print the import time of the program by package and exit",
+)
 args = parser.parse_args()
 
 TASKS = {}
+prepare_data_dir()
 dis_obj = DisabledUsers()
 config_file = None
 
@@ -53,9 +66,9 @@ async def main():
     """Main function to run the code."""
     global config_file
     print("Telegram Bot running...")
-    asyncio.create_task(run_telegram_bot())  # Start Telegram bot in a separate task
-    await asyncio.sleep(2)
-    
+    # Start Telegram bot in a separate task, it is loaded in the background
+    asyncio.create_task(run_telegram_bot())
+
     # Load initial config
     config_file = await read_config(check_required_elements=True)
 
@@ -69,13 +82,6 @@ async def main():
     # Start periodic config reload
     asyncio.create_task(reload_config())
 
-    # Enable disabled users initially
-    dis_users = await dis_obj.read_and_clear_users()
-    await enable_selected_users(panel_data, dis_users)
-
-    # Fetch and process nodes
-    await get_nodes(panel_data)
-
     async with asyncio.TaskGroup() as tg:
         nodes_list = await get_nodes(panel_data)
         if nodes_list and not isinstance(nodes_list, ValueError):
@@ -107,10 +113,49 @@ async def main():
             handle_cancel_all(TASKS, panel_data),
             name="cancel_all",
         )
+        tg.create_task(
+            ENFORCEMENT.run(panel_data),
+            name="enforcement",
+        )
+        tg.create_task(
+            NODE_CACHE.run(panel_data),
+            name="node_cache",
+        )
+        tg.create_task(
+            USER_DIRECTORY.run(panel_data),
+            name="user_directory",
+        )
+        tg.create_task(
+            WEBHOOK.run(),
+            name="webhook",
+        )
         tg.create_task(
             enable_dis_user(panel_data),
             name="enable_dis_user",
         )
+        tg.create_task(
+            DETECTOR.run(),
+            name="detector",
+        )
+        tg.create_task(
+            run_violation_handler(panel_data),
+            name="violation_handler",
+        )
+        if config_file.get("API_EMBEDDED"):
+            # Imported here so the API dependencies are only loaded when it is enabled
+            from utils.api_server import (  # pylint: disable=import-outside-toplevel
+                run_api_server,
+            )
+
+            tg.create_task(
+                run_api_server(),
+                name="api_server",
+            )
+        if config_file.get("SYSLOG_UDP_PORT") or config_file.get("SYSLOG_TCP_PORT"):
+            tg.create_task(
+                run_log_ingest(panel_data),
+                name="log_ingest",
+            )
 
         # Run usage checking
         while True:
@@ -119,6 +164,9 @@ async def main():
 
 
 if __name__ == "__main__":
+    if args.profile_startup:
+        print_startup_profile("marzneshiniplimit")
+        raise SystemExit
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -1,24 +1,92 @@
-"""Run the telegram bot."""
+"""
+Run the telegram bot.
+
+By default the bot uses long polling. If 'TELEGRAM_WEBHOOK_URL' is set,
+Telegram pushes the updates to that URL instead, which is served by the
+in-process HTTP server on 'TELEGRAM_WEBHOOK_LISTEN':'TELEGRAM_WEBHOOK_PORT'
+(usually behind a reverse proxy that terminates TLS).
+"""
 
 import asyncio
+import hmac
+import importlib
+import secrets
+from urllib.parse import urlsplit
+
+from telegram_bot.bot import get_application
+from utils.http_server import HTTPServer, Request, Response, get_http_server
 from utils.logs import logger
+from utils.read_config import read_config
+
+
+async def load_bot():
+    """Build the bot application and register its handlers."""
+    # Imported in a thread so loading the bot does not delay the node tasks
+    handlers = await asyncio.to_thread(importlib.import_module, "telegram_bot.main")
+    application = await get_application()
+    handlers.register_handlers(application)
+    return application
+
 
-from telegram_bot.main import application
+async def start_webhook(application, config_data: dict) -> HTTPServer:
+    """Register the webhook route and the webhook URL on Telegram, returns the server."""
+    from telegram import Update  # pylint: disable=import-outside-toplevel
+
+    url = config_data["TELEGRAM_WEBHOOK_URL"]
+    secret = config_data.get("TELEGRAM_WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+    path = urlsplit(url).path or "/"
+    server = get_http_server(
+        config_data.get("TELEGRAM_WEBHOOK_LISTEN", "127.0.0.1"),
+        config_data.get("TELEGRAM_WEBHOOK_PORT", 8443),
+    )
+
+    async def handle_update(request: Request) -> Response:
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), secret.encode()):
+            return Response(403, b"Invalid secret token")
+        try:
+            update = Update.de_json(request.json(), application.bot)
+        except ValueError:
+            return Response(400, b"Invalid update")
+        if update is not None:
+            await application.update_queue.put(update)
+        return Response(200)
+
+    server.route("POST", path, handle_update)
+    await server.start()
+    await application.bot.set_webhook(
+        url=url, secret_token=secret, allowed_updates=Update.ALL_TYPES
+    )
+    logger.info(f"Telegram bot receives updates on {url}")
+    return server
 
 
 async def run_telegram_bot():
     """Run the telegram bot."""
     retry_delay = 5
     max_retry_delay = 300  # حداکثر 5 دقیقه تاخیر / Max 5 minutes delay
-    
+    application = None
+
     while True:
         try:
             logger.info("Starting Telegram bot...")
+            if application is None:
+                application = await load_bot()
+            config_data = await read_config()
             async with application:
                 await application.start()
-                await application.updater.start_polling()
+                if config_data.get("TELEGRAM_WEBHOOK_URL"):
+                    server = await start_webhook(application, config_data)
+                else:
+                    server = None
+                    await application.updater.start_polling()
                 logger.info("Telegram bot started successfully!")
                 retry_delay = 5  # ریست تاخیر پس از اتصال موفق / Reset delay after successful connection
+                if server is not None:
+                    try:
+                        await server.serve_forever()
+                    finally:
+                        await application.stop()
                 while True:
                     await asyncio.sleep(40)
         except Exception as e:  # pylint: disable=broad-except
@@ -140,6 +140,10 @@ install_marzneshin_ip_limit() {
     mkdir -p "$CONFIG_DIR/logs"
     colorized_echo green "Logs directory created in $CONFIG_DIR/logs"
 
+    colorized_echo blue "Creating data directory"
+    mkdir -p "$CONFIG_DIR/data"
+    colorized_echo green "Data directory created in $CONFIG_DIR/data"
+
     colorized_echo green "MarzneshinIpLimit files downloaded successfully"
 }
 
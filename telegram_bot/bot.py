@@ -1,24 +1,54 @@
+"""
+Build the telegram bot application.
+
+The application is built on first use inside the running event loop,
+so importing this module does not load 'python-telegram-bot'.
+"""
+
 import asyncio
-from telegram.ext import ApplicationBuilder
+import importlib
+
 from utils.read_config import read_config
 
-data = asyncio.run(read_config())
-try:
-    bot_token = data["BOT_TOKEN"]
-except KeyError as exc:
-    raise ValueError("BOT_TOKEN is missing in the config file.") from exc
-
-# سازنده برنامه با تنظیمات اتصال بهبود یافته
-# Application builder with improved connection settings
-app_builder = ApplicationBuilder().token(bot_token)
-
-# پیکربندی پروکسی در صورت وجود در فایل تنظیمات
-# Configure proxy if available in config file
-if "PROXY_URL" in data and data["PROXY_URL"]:
-    app_builder = app_builder.proxy_url(data["PROXY_URL"])
-    
-# افزایش تایم اوت برای اتصال بهتر
-# Increase timeout for better connection
-app_builder = app_builder.connect_timeout(30.0).read_timeout(30.0)
-
-application = app_builder.build()
+application = None
+BUILD_LOCK = asyncio.Lock()
+
+
+async def get_application():
+    """Return the bot application, it is built the first time it is needed."""
+    global application  # pylint: disable=global-statement
+    async with BUILD_LOCK:
+        if application is not None:
+            return application
+        # Imported in a thread so loading the library does not block the loop
+        ext = await asyncio.to_thread(importlib.import_module, "telegram.ext")
+
+        data = await read_config()
+        try:
+            bot_token = data["BOT_TOKEN"]
+        except KeyError as exc:
+            raise ValueError("BOT_TOKEN is missing in the config file.") from exc
+
+        # سازنده برنامه با تنظیمات اتصال بهبود یافته
+        # Application builder with improved connection settings
+        app_builder = ext.ApplicationBuilder().token(bot_token)
+
+        # پیکربندی پروکسی در صورت وجود در فایل تنظیمات
+        # Configure proxy if available in config file
+        if "PROXY_URL" in data and data["PROXY_URL"]:
+            app_builder = app_builder.proxy_url(data["PROXY_URL"])
+
+        # آدرس سرور Bot API (مثلا یک سرور محلی برای تست)
+        # Bot API server URL (e.g. a local Bot API server or a fake one for tests)
+        if data.get("TELEGRAM_API_BASE_URL"):
+            base_url = data["TELEGRAM_API_BASE_URL"].rstrip("/")
+            app_builder = app_builder.base_url(f"{base_url}/bot").base_file_url(
+                f"{base_url}/file/bot"
+            )
+
+        # افزایش تایم اوت برای اتصال بهتر
+        # Increase timeout for better connection
+        app_builder = app_builder.connect_timeout(30.0).read_timeout(30.0)
+
+        application = app_builder.build()
+        return application
@@ -11,6 +11,7 @@ import sys
 try:
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
     from telegram.ext import (
+        Application,
         ApplicationBuilder,
         CallbackQueryHandler,
         CommandHandler,
@@ -32,6 +33,7 @@ from telegram_bot.utils import (
     add_except_user,
     check_admin,
     get_special_limit_message,
+    get_state_database,
     handel_special_limit,
     read_json_file,
     remove_admin_from_config,
@@ -44,8 +46,10 @@ from telegram_bot.utils import (
     show_except_users_handler,
     write_country_code_json,
 )
-from utils.panel_api import get_nodes
+from utils.node_cache import NODE_CACHE
 from utils.read_config import read_config
+from utils.report import LAST_REPORT, build_report_file
+from utils.top_offenders import TOP_OFFENDERS, top_users
 from utils.types import PanelType
 
 (
@@ -68,8 +72,6 @@ from utils.types import PanelType
     SELECT_SERVER,
 ) = range(17)
 
-from telegram_bot.bot import application
-
 START_MESSAGE = """
 ✨<b>BP Commands List:</b>\n<b>/start</b> \n<code>start the bot</code>
 <b>/create_config</b>
@@ -92,7 +94,9 @@ are counted (to increase accuracy)</code>
 <b>/set_time_to_active_users</b>\n<code>Set the time to active users</code>
 <b>/set_telegram_message_mode</b>\n<code>Set the telegram message mode</code>
 <b>/check_servers</b>\n<code>Select servers to check</code>
-<b>/backup</b> \n<code>Sends 'config.json' file</code>"""
+<b>/top_offenders</b>\n<code>Show the users with the most active IPs</code>
+<b>/full_report</b>\n<code>Sends the full report of the last check as a file</code>
+<b>/backup</b> \n<code>Sends 'config.json' file (and the state database)</code>"""
 
 
 async def select_servers(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -104,15 +108,16 @@ async def select_servers(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return check
     config_data = await read_config(check_required_elements=True)
 
-    nodes = await get_nodes(
-        PanelType(
-            panel_domain=config_data["PANEL_DOMAIN"],
-            panel_password=config_data["PANEL_PASSWORD"],
-            panel_username=config_data["PANEL_USERNAME"],
+    try:
+        nodes = await NODE_CACHE.get(
+            PanelType(
+                panel_domain=config_data["PANEL_DOMAIN"],
+                panel_password=config_data["PANEL_PASSWORD"],
+                panel_username=config_data["PANEL_USERNAME"],
+            )
         )
-    )
-    if isinstance(nodes, ValueError):
-        await update.message.reply_html(text=str(nodes))
+    except ValueError as error:
+        await update.message.reply_html(text=str(error))
         return ConversationHandler.END
     if not nodes:
         await update.message.reply_html(text="No servers found.")
@@ -151,14 +156,8 @@ async def server_button_callback(update: Update, context: ContextTypes.DEFAULT_T
     else:
         context.user_data["servers"].append(server_name)
 
-    config_data = await read_config(check_required_elements=True)
-    nodes = await get_nodes(
-        PanelType(
-            panel_domain=config_data["PANEL_DOMAIN"],
-            panel_password=config_data["PANEL_PASSWORD"],
-            panel_username=config_data["PANEL_USERNAME"],
-        )
-    )
+    # Served from memory, the cache is kept fresh by the monitor
+    nodes = NODE_CACHE.nodes
     keyboard = []
     for node in nodes:
         is_selected = "✅" if node.node_name in context.user_data["servers"] else "❌"
@@ -507,7 +506,7 @@ async def write_country_code(update: Update, _context: ContextTypes.DEFAULT_TYPE
 
 
 async def send_backup(update: Update, _context: ContextTypes.DEFAULT_TYPE):
-    """Send the backup file to the user"""
+    """Send the backup files to the user"""
     check = await check_admin_privilege(update)
     if check:
         return check
@@ -516,6 +515,57 @@ async def send_backup(update: Update, _context: ContextTypes.DEFAULT_TYPE):
             document=config_file,
             caption="Here is the backup file!",
         )
+    # With 'STATE_BACKEND': "sqlite" the limits and the user state are not in config.json
+    state_db = await get_state_database()
+    if state_db:
+        await update.message.reply_document(
+            document=await asyncio.to_thread(state_db.dump),
+            filename="state.db",
+            caption="Here is the state database backup!",
+        )
+
+
+async def top_offenders(update: Update, _context: ContextTypes.DEFAULT_TYPE):
+    """Show the users with the most active IPs right now."""
+    check = await check_admin_privilege(update)
+    if check:
+        return check
+    config_data = await read_config()
+    top_n = int(config_data.get("TOP_OFFENDERS", 20)) or 20
+    offenders = TOP_OFFENDERS.top(top_n)
+    if not offenders:
+        # Nothing live yet, use the last check
+        offenders = [(user, len(ips)) for user, ips in top_users(LAST_REPORT, top_n)]
+    if not offenders:
+        await update.message.reply_html(text="No active user found!")
+        return ConversationHandler.END
+    await update.message.reply_html(
+        text="<b>Top offenders:</b>\n"
+        + "\n".join(
+            f"<code>{user}</code>: <code>{count}</code> ips" for user, count in offenders
+        )
+    )
+    return ConversationHandler.END
+
+
+async def full_report(update: Update, _context: ContextTypes.DEFAULT_TYPE):
+    """Send the full report of the last check as a file."""
+    check = await check_admin_privilege(update)
+    if check:
+        return check
+    if not LAST_REPORT:
+        await update.message.reply_html(text="No report yet, wait for the next check.")
+        return ConversationHandler.END
+    config_data = await read_config()
+    filename, document = await asyncio.to_thread(
+        build_report_file, LAST_REPORT, config_data.get("REPORT_FORMAT", "txt")
+    )
+    await update.message.reply_document(
+        document=document,
+        filename=filename,
+        caption="Full report of the last check (user, number of ips, ips)",
+    )
+    return ConversationHandler.END
 
 
 async def set_except_users(update: Update, _context: ContextTypes.DEFAULT_TYPE):
@@ -673,6 +723,7 @@ async def set_telegram_message_mode(update: Update, _context: ContextTypes.DEFAU
         + "1. <code>always</code> (send all messages)\n"
         + "2. <code>on_ban</code> (only send message when user is banned)\n"
         + "3. <code>silent</code> (never send messages)\n"
+        + "4. <code>digest</code> (send a summary of the messages every few minutes)\n"
         + "<b>just send the number of the mode like: <code>1</code> or <code>2</code></b>"
     )
     return SET_TELEGRAM_MESSAGE_MODE
@@ -683,7 +734,7 @@ async def set_telegram_message_mode_handler(
 ):
     """Write the telegram message mode to the config file."""
     mode = update.message.text.strip()
-    modes = {"1": "always", "2": "on_ban", "3": "silent"}
+    modes = {"1": "always", "2": "on_ban", "3": "silent", "4": "digest"}
     selected_mode = modes.get(mode, "always")
     await save_telegram_message_mode(selected_mode)
     await update.message.reply_html(
@@ -692,185 +743,189 @@ async def set_telegram_message_mode_handler(
     return ConversationHandler.END
 
 
-application.add_handler(CommandHandler("start", start))
-application.add_handler(
-    ConversationHandler(
-        entry_points=[CommandHandler("create_config", create_config)],
-        states={
-            GET_CONFIRMATION: [MessageHandler(filters.TEXT, get_confirmation)],
-            GET_DOMAIN: [MessageHandler(filters.TEXT, get_domain)],
-            GET_USERNAME: [MessageHandler(filters.TEXT, get_username)],
-            GET_PASSWORD: [MessageHandler(filters.TEXT, get_password)],
-        },
-        fallbacks=[],
+def register_handlers(application: Application) -> None:
+    """Add the command and conversation handlers of the bot to the application."""
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[CommandHandler("create_config", create_config)],
+            states={
+                GET_CONFIRMATION: [MessageHandler(filters.TEXT, get_confirmation)],
+                GET_DOMAIN: [MessageHandler(filters.TEXT, get_domain)],
+                GET_USERNAME: [MessageHandler(filters.TEXT, get_username)],
+                GET_PASSWORD: [MessageHandler(filters.TEXT, get_password)],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("set_special_limit", set_special_limit),
-        ],
-        states={
-            GET_SPECIAL_LIMIT: [MessageHandler(filters.TEXT, get_special_limit)],
-            GET_LIMIT_NUMBER: [MessageHandler(filters.TEXT, get_limit_number)],
-        },
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("set_special_limit", set_special_limit),
+            ],
+            states={
+                GET_SPECIAL_LIMIT: [MessageHandler(filters.TEXT, get_special_limit)],
+                GET_LIMIT_NUMBER: [MessageHandler(filters.TEXT, get_limit_number)],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("set_time_to_active_users", get_time_to_active_users),
-        ],
-        states={
-            GET_TIME_TO_ACTIVE_USERS: [
-                MessageHandler(filters.TEXT, get_time_to_active_users_handler)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("set_time_to_active_users", get_time_to_active_users),
             ],
-        },
-        fallbacks=[],
+            states={
+                GET_TIME_TO_ACTIVE_USERS: [
+                    MessageHandler(filters.TEXT, get_time_to_active_users_handler)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("set_check_interval", get_check_interval),
-        ],
-        states={
-            GET_CHECK_INTERVAL: [
-                MessageHandler(filters.TEXT, get_check_interval_handler)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("set_check_interval", get_check_interval),
             ],
-        },
-        fallbacks=[],
+            states={
+                GET_CHECK_INTERVAL: [
+                    MessageHandler(filters.TEXT, get_check_interval_handler)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("set_general_limit_number", get_general_limit_number),
-        ],
-        states={
-            GET_GENERAL_LIMIT_NUMBER: [
-                MessageHandler(filters.TEXT, get_general_limit_number_handler)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("set_general_limit_number", get_general_limit_number),
             ],
-        },
-        fallbacks=[],
+            states={
+                GET_GENERAL_LIMIT_NUMBER: [
+                    MessageHandler(filters.TEXT, get_general_limit_number_handler)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("remove_except_user", remove_except_user),
-        ],
-        states={
-            REMOVE_EXCEPT_USER: [
-                MessageHandler(filters.TEXT, remove_except_user_handler)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("remove_except_user", remove_except_user),
             ],
-        },
-        fallbacks=[],
+            states={
+                REMOVE_EXCEPT_USER: [
+                    MessageHandler(filters.TEXT, remove_except_user_handler)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("check_servers", select_servers),
-        ],
-        states={
-            SELECT_SERVER: [
-                CallbackQueryHandler(
-                    server_button_callback, pattern="^server_"
-                ),
-                CallbackQueryHandler(
-                    done_selecting_servers, pattern="^done_selecting_server"
-                ),
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("check_servers", select_servers),
             ],
-        },
-        fallbacks=[],
+            states={
+                SELECT_SERVER: [
+                    CallbackQueryHandler(
+                        server_button_callback, pattern="^server_"
+                    ),
+                    CallbackQueryHandler(
+                        done_selecting_servers, pattern="^done_selecting_server"
+                    ),
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
 
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("country_code", set_country_code),
-        ],
-        states={
-            SET_COUNTRY_CODE: [MessageHandler(filters.TEXT, write_country_code)],
-        },
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("country_code", set_country_code),
+            ],
+            states={
+                SET_COUNTRY_CODE: [MessageHandler(filters.TEXT, write_country_code)],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("set_except_user", set_except_users),
-        ],
-        states={
-            SET_EXCEPT_USERS: [MessageHandler(filters.TEXT, set_except_users_handler)],
-        },
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("set_except_user", set_except_users),
+            ],
+            states={
+                SET_EXCEPT_USERS: [MessageHandler(filters.TEXT, set_except_users_handler)],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler(
-                "set_telegram_message_mode", set_telegram_message_mode
-            ),
-        ],
-        states={
-            SET_TELEGRAM_MESSAGE_MODE: [
-                MessageHandler(filters.TEXT, set_telegram_message_mode_handler)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler(
+                    "set_telegram_message_mode", set_telegram_message_mode
+                ),
             ],
-        },
-        fallbacks=[],
+            states={
+                SET_TELEGRAM_MESSAGE_MODE: [
+                    MessageHandler(filters.TEXT, set_telegram_message_mode_handler)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
 
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("show_special_limit", show_special_limit_function),
-        ],
-        states={},
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("show_special_limit", show_special_limit_function),
+            ],
+            states={},
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("add_admin", add_admin),
-        ],
-        states={
-            GET_CHAT_ID: [MessageHandler(filters.TEXT, get_chat_id)],
-        },
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("add_admin", add_admin),
+            ],
+            states={
+                GET_CHAT_ID: [MessageHandler(filters.TEXT, get_chat_id)],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("remove_admin", remove_admin),
-        ],
-        states={
-            GET_CHAT_ID_TO_REMOVE: [
-                MessageHandler(filters.TEXT, get_chat_id_to_remove)
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("remove_admin", remove_admin),
             ],
-        },
-        fallbacks=[],
+            states={
+                GET_CHAT_ID_TO_REMOVE: [
+                    MessageHandler(filters.TEXT, get_chat_id_to_remove)
+                ],
+            },
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(
-    ConversationHandler(
-        entry_points=[
-            CommandHandler("backup", send_backup),
-        ],
-        states={},
-        fallbacks=[],
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[
+                CommandHandler("backup", send_backup),
+            ],
+            states={},
+            fallbacks=[],
+        )
     )
-)
-application.add_handler(CommandHandler("admins_list", admins_list))
-application.add_handler(CommandHandler("show_except_users", show_except_users))
-unknown_handler = MessageHandler(filters.TEXT, start)
-application.add_handler(unknown_handler)
-unknown_handler_command = MessageHandler(filters.COMMAND, start)
-application.add_handler(unknown_handler_command)
+    application.add_handler(CommandHandler("admins_list", admins_list))
+    application.add_handler(CommandHandler("show_except_users", show_except_users))
+    application.add_handler(CommandHandler("top_offenders", top_offenders))
+    application.add_handler(CommandHandler("full_report", full_report))
+    unknown_handler = MessageHandler(filters.TEXT, start)
+    application.add_handler(unknown_handler)
+    unknown_handler_command = MessageHandler(filters.COMMAND, start)
+    application.add_handler(unknown_handler_command)
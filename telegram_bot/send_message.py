@@ -1,13 +1,348 @@
 """
 Send logs to telegram bot.
+
+'send_logs' only queues the message and returns, a single sender task
+delivers the queued messages to the admins within the Telegram rate limits.
+Identical messages queued before they are sent are merged into one.
+
+In the "digest" message mode the messages are counted by category and node
+and a single summary is sent every 'TELEGRAM_DIGEST_INTERVAL' seconds.
 """
+
+import asyncio
+import re
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+
+from utils.logs import logger
 from utils.read_config import read_config
-from telegram_bot.bot import application
-from telegram_bot.utils import check_admin
+from telegram_bot.bot import get_application
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+NOTIFIER_QUEUE_SIZE = 1000
+# Telegram rejects longer messages
+MESSAGE_LIMIT = 4096
+# The pieces a line is cut between: tags, entities, words and spaces
+HTML_ATOM_REGEX = re.compile(r"<[^>]*>|&#?\w+;|[^<&\s]+|\s+|[<&]")
+HTML_TAG_REGEX = re.compile(r"<(/?)(\w+)[^>]*>")
+# category -> label of the digest line
+DIGEST_LABELS = {
+    "enabled": "users enabled",
+    "disabled": "users disabled",
+    "warning": "users over their limit",
+    "node_connected": "node (re)connected",
+    "node_error": "node connection failed",
+    "node_cancelled": "node check cancelled",
+    "node_added": "node added",
+    "panel_error": "panel errors",
+    "enforcement_error": "failed enforcement actions",
+}
+# Categories that are already periodic, they are never digested
+DIGEST_PASSTHROUGH = {"report"}
+
+
+def split_line(line: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Split a line longer than 'limit' between its tags, entities and words.
+    The tags still open at a cut are closed at the end of the part and
+    opened again at the start of the next one.
+    """
+    # An opening tag stays with what follows it, so a part never ends with it
+    pieces: list[list[str]] = [[]]
+    for atom in HTML_ATOM_REGEX.findall(line):
+        # A word that can't fit in a part is cut anywhere
+        for piece in atom if len(atom) > limit // 2 else [atom]:
+            pieces[-1].append(piece)
+            tag = HTML_TAG_REGEX.fullmatch(piece)
+            if tag is None or tag[1]:
+                pieces.append([])
+    parts = []
+    current = ""
+    # (tag name, opening tag) of the open tags
+    open_tags: list[tuple[str, str]] = []
+    for piece in pieces:
+        next_tags = open_tags
+        for atom in piece:
+            tag = HTML_TAG_REGEX.fullmatch(atom)
+            if tag is None:
+                continue
+            if not tag[1]:
+                next_tags = [*next_tags, (tag[2], atom)]
+            elif next_tags and next_tags[-1][0] == tag[2]:
+                next_tags = next_tags[:-1]
+        text = "".join(piece)
+        closing = "".join(f"</{name}>" for name, _ in reversed(next_tags))
+        reopened = "".join(opening for _, opening in open_tags)
+        if len(current) + len(text) + len(closing) > limit and current != reopened:
+            parts.append(current + "".join(f"</{name}>" for name, _ in reversed(open_tags)))
+            current = reopened
+        current += text
+        open_tags = next_tags
+    parts.append(current)
+    return parts
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Split a message into parts of at most 'limit' characters, on line breaks
+    when possible so the HTML tags of a line stay together.
+    """
+    parts = []
+    current = ""
+    for line in text.split("\n"):
+        if len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            *full_parts, line = split_line(line, limit)
+            parts.extend(full_parts)
+        if current and len(current) + 1 + len(line) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
+
+
+class TelegramNotifier:
+    """
+    A class used to send the queued messages to every admin.
+    """
+
+    def __init__(self):
+        # message -> number of times it was queued, in queue order
+        self.pending: dict[str, int] = {}
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        # chat id -> earliest time the next message can be sent to it
+        self.chat_next: dict[int, float] = {}
+        self.global_next = 0.0
+        self.global_lock = asyncio.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.document_tasks: set[asyncio.Task] = set()
+
+    def enqueue(self, msg: str) -> bool:
+        """
+        Queue a message, never blocks. Returns False if the queue is full
+        and the message was dropped.
+        """
+        if msg in self.pending:
+            self.pending[msg] += 1
+            self.coalesced += 1
+            return True
+        if len(self.pending) >= NOTIFIER_QUEUE_SIZE:
+            self.dropped += 1
+            return False
+        self.pending[msg] = 1
+        self.ready.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(
+                self.run(), name="telegram_notifier"
+            )
+        return True
+
+    async def wait_turn(self, chat_id: int) -> None:
+        """
+        Wait until a message can be sent to the chat without hitting the rate limits.
+        """
+        now = time.monotonic()
+        chat_delay = self.chat_next.get(chat_id, 0.0) - now
+        self.chat_next[chat_id] = max(now, self.chat_next.get(chat_id, 0.0)) + 1 / CHAT_RATE
+        if chat_delay > 0:
+            await asyncio.sleep(chat_delay)
+        async with self.global_lock:
+            now = time.monotonic()
+            global_delay = self.global_next - now
+            self.global_next = max(now, self.global_next) + 1 / GLOBAL_RATE
+        if global_delay > 0:
+            await asyncio.sleep(global_delay)
+
+    async def deliver(
+        self, chat_id: int, send: Callable[[], Awaitable], retries: int = 2
+    ) -> None:
+        """
+        Send something to one admin, waiting when Telegram asks to slow down.
+        """
+        # Imported here so 'python-telegram-bot' is only loaded when a message is sent
+        from telegram.error import RetryAfter  # pylint: disable=import-outside-toplevel
+
+        attempt = 0
+        while True:
+            await self.wait_turn(chat_id)
+            try:
+                await send()
+                self.sent += 1
+                return
+            except RetryAfter as error:
+                delay = error.retry_after
+                if hasattr(delay, "total_seconds"):
+                    delay = delay.total_seconds()
+                self.chat_next[chat_id] = time.monotonic() + float(delay)
+            except Exception as error:  # pylint: disable=broad-except
+                attempt += 1
+                if attempt >= retries:
+                    self.failed += 1
+                    print(f"Failed to send message to admin {chat_id}: {error}")
+                    return
+
+    async def run(self) -> None:
+        """
+        Send the queued messages to all admins in parallel.
+        """
+        while True:
+            if not self.pending:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            msg = next(iter(self.pending))
+            count = self.pending.pop(msg)
+            text = msg if count == 1 else f"{msg}\n<i>(x{count})</i>"
+            config_data = await read_config()
+            admins = config_data.get("ADMINS", [])
+            if not admins:
+                print("No admins found.")
+                continue
+            application = await get_application()
+            for part in split_message(text):
+                await asyncio.gather(
+                    *(
+                        self.deliver(
+                            admin,
+                            lambda admin=admin, part=part: application.bot.sendMessage(
+                                chat_id=admin, text=part, parse_mode="HTML"
+                            ),
+                        )
+                        for admin in admins
+                    )
+                )
+
+    def enqueue_document(self, document: bytes, filename: str, caption: str) -> None:
+        """
+        Send a file to all admins in the background.
+        """
+        task = asyncio.get_running_loop().create_task(
+            self.send_document(document, filename, caption), name="telegram_document"
+        )
+        self.document_tasks.add(task)
+        task.add_done_callback(self.document_tasks.discard)
 
+    async def send_document(self, document: bytes, filename: str, caption: str) -> None:
+        """
+        Send a file to all admins in parallel, one 'sendDocument' per admin.
+        """
+        config_data = await read_config()
+        application = await get_application()
+        await asyncio.gather(
+            *(
+                self.deliver(
+                    admin,
+                    lambda admin=admin: application.bot.send_document(
+                        chat_id=admin,
+                        document=document,
+                        filename=filename,
+                        caption=caption[:1024],
+                        parse_mode="HTML",
+                    ),
+                )
+                for admin in config_data.get("ADMINS", [])
+            )
+        )
 
-async def send_logs(msg, on_ban=False):
-    """Send logs to all admins."""
+    def stats_message(self) -> str:
+        """
+        Return the notifier metrics as a single line for the logs.
+        """
+        return (
+            f"depth={len(self.pending)} sent={self.sent} failed={self.failed} "
+            + f"dropped={self.dropped} coalesced={self.coalesced}"
+        )
+
+
+NOTIFIER = TelegramNotifier()
+
+
+class Digest:
+    """
+    A class used to count the messages by category and node and
+    send them as one summary every 'TELEGRAM_DIGEST_INTERVAL' seconds.
+    """
+
+    def __init__(self):
+        # category -> node (None if the message has no node) -> count
+        self.events: dict[str, Counter] = {}
+        # category -> latest message, shown for the categories without a label
+        self.latest: dict[str, str] = {}
+        self.started_at = time.time()
+        self.task: asyncio.Task | None = None
+
+    def add(self, msg: str, category: str, node: str | None) -> None:
+        """
+        Count a message.
+        """
+        self.events.setdefault(category, Counter())[node] += 1
+        self.latest[category] = msg
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(
+                self.run(), name="telegram_digest"
+            )
+
+    def render(self) -> str | None:
+        """
+        Return the summary of the counted messages and reset the counters.
+        """
+        if not self.events:
+            return None
+        minutes = (time.time() - self.started_at) / 60
+        lines = [f"📋 <b>Digest of the last {minutes:.0f} minutes</b>"]
+        for category, nodes in self.events.items():
+            total = sum(nodes.values())
+            label = DIGEST_LABELS.get(category)
+            per_node = ", ".join(
+                f"{node} ×{count}" for node, count in nodes.most_common(10) if node
+            )
+            if label is None:
+                lines.append(
+                    f"• {total} {category} messages, latest:\n{self.latest[category]}"
+                )
+            elif per_node:
+                lines.append(f"• {label}: {per_node}")
+            else:
+                lines.append(f"• {total} {label}")
+        self.events.clear()
+        self.latest.clear()
+        self.started_at = time.time()
+        return "\n".join(lines)
+
+    async def run(self) -> None:
+        """
+        Send the summary every 'TELEGRAM_DIGEST_INTERVAL' seconds.
+        """
+        while True:
+            config_data = await read_config()
+            await asyncio.sleep(int(config_data.get("TELEGRAM_DIGEST_INTERVAL", 300)))
+            summary = self.render()
+            if summary:
+                NOTIFIER.enqueue(summary)
+
+
+DIGEST = Digest()
+
+
+async def send_logs(msg, on_ban=False, category=None, node=None):
+    """
+    Queue logs for all admins.
+
+    'category' and 'node' group the message in the "digest" mode,
+    ban messages bypass the digest unless 'TELEGRAM_DIGEST_BANS' is true.
+    """
     config_data = await read_config()
     telegram_message_mode = config_data.get("TELEGRAM_MESSAGE_MODE", "always")
 
@@ -15,18 +350,20 @@ async def send_logs(msg, on_ban=False):
         return
     if telegram_message_mode == "on_ban" and not on_ban:
         return
+    if (
+        telegram_message_mode == "digest"
+        and category not in DIGEST_PASSTHROUGH
+        and not (on_ban and not config_data.get("TELEGRAM_DIGEST_BANS", False))
+    ):
+        DIGEST.add(msg, category or "other", node)
+        return
+    if not NOTIFIER.enqueue(msg) and NOTIFIER.dropped % 100 == 1:
+        logger.warning(f"Telegram notifier queue is full: {NOTIFIER.stats_message()}")
 
-    admins = await check_admin()
-    retries = 2
-    if admins:
-        for admin in admins:
-            for _ in range(retries):
-                try:
-                    await application.bot.sendMessage(
-                        chat_id=admin, text=msg, parse_mode="HTML"
-                    )
-                    break
-                except Exception as e:  # pylint: disable=broad-except
-                    print(f"Failed to send message to admin {admin}: {e}")
-    else:
-        print("No admins found.")
+
+async def send_report_file(document: bytes, filename: str, caption: str):
+    """Send a report file to all admins (unless the message mode is silent or on_ban)."""
+    config_data = await read_config()
+    if config_data.get("TELEGRAM_MESSAGE_MODE", "always") in ("silent", "on_ban"):
+        return
+    NOTIFIER.enqueue_document(document, filename, caption)
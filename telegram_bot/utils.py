@@ -7,6 +7,8 @@ import json
 import os
 import sys
 
+from utils.read_config import read_config
+from utils.state_db import StateDB, get_state_db
 from utils.types import PanelType
 
 try:
@@ -43,6 +45,15 @@ async def get_token(panel_data: PanelType) -> PanelType | ValueError:
     raise ValueError(message)
 
 
+async def get_state_database() -> StateDB | None:
+    """
+    Returns the state database if 'STATE_BACKEND' is "sqlite" in the config.json file.
+    """
+    if not os.path.exists("config.json"):
+        return None
+    return get_state_db(await read_config())
+
+
 async def read_json_file() -> dict:
     """
     Reads and returns the content of the config.json file.
@@ -115,6 +126,11 @@ async def handel_special_limit(username: str, limit: int) -> list:
         and the second element is the updated limit.
     """
     set_before = 0  # Default previous limit
+    state_db = await get_state_database()
+    if state_db:
+        set_before = state_db.get_special_limit(username) or 0
+        state_db.set_special_limit(username, limit)
+        return [set_before, [username, limit]]
     if os.path.exists("config.json"):
         # Read the existing data
         data = await read_json_file()
@@ -198,6 +214,12 @@ async def get_special_limit_message() -> list | None:
     Returns:
         list
     """
+    state_db = await get_state_database()
+    if state_db:
+        special_limits = state_db.get_special_limits()
+        if not special_limits:
+            return None
+        return "".join(f"{user} : {limit}\n" for user, limit in special_limits.items())
     if os.path.exists("config.json"):
         data = await read_json_file()
         special_list = data.get('SPECIAL_LIMIT', [])
@@ -227,6 +249,9 @@ async def add_except_user(except_user: str) -> str | None:
     Add a user to the exception list in the config file.
     If the config file does not exist, it creates one.
     """
+    state_db = await get_state_database()
+    if state_db:
+        return except_user if state_db.add_except_user(except_user) else None
     if os.path.exists("config.json"):
         data = await read_json_file()
         user = data.get("EXCEPT_USERS", [])
@@ -247,6 +272,12 @@ async def show_except_users_handler() -> list | None:
     Retrieve the list of exception users from the config file.
     If the list is too long, it splits the list into shorter messages.
     """
+    state_db = await get_state_database()
+    if state_db:
+        messages = state_db.get_except_users()
+        if not messages:
+            return None
+        return ["\n".join(messages[i : i + 100]) for i in range(0, len(messages), 100)]
     if os.path.exists("config.json"):
         data = await read_json_file()
         except_users = data.get("EXCEPT_USERS", None)
@@ -265,6 +296,9 @@ async def remove_except_user_from_config(user: str) -> str | None:
     """
     Remove a user from the exception list in the config file.
     """
+    state_db = await get_state_database()
+    if state_db:
+        return user if state_db.remove_except_user(user) else None
     data = await read_json_file()
     except_user = data.get("EXCEPT_USERS", [])
     if user in except_user:
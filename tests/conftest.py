@@ -0,0 +1,84 @@
+"""
+Shared fixtures: each test runs in a temporary directory with its own config.json.
+"""
+
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 'utils.logs' opens logs/app.log relative to the working directory on import,
+# import it first from a temporary directory so the tests never write to the repo
+LOG_DIR = tempfile.mkdtemp(prefix="iplimit-test-logs-")
+atexit.register(shutil.rmtree, LOG_DIR, True)
+_cwd = os.getcwd()
+os.chdir(LOG_DIR)
+try:
+    import utils.logs  # noqa: E402,F401  pylint: disable=wrong-import-position,unused-import
+finally:
+    os.chdir(_cwd)
+
+from utils import read_config  # noqa: E402  pylint: disable=wrong-import-position
+from utils.data_dir import prepare_data_dir  # noqa: E402  pylint: disable=wrong-import-position
+
+BASE_CONFIG = {
+    "BOT_TOKEN": "123456:TEST",
+    "ADMINS": [1],
+    "PANEL_DOMAIN": "panel.example.com",
+    "PANEL_USERNAME": "admin",
+    "PANEL_PASSWORD": "admin",
+    "CHECK_INTERVAL": 240,
+    "TIME_TO_ACTIVE_USERS": 900,
+    "IP_LOCATION": "IR",
+    "GENERAL_LIMIT": 2,
+    "outOfLimitNumber": 3,
+    "SPECIAL_LIMIT": [["alice", 5]],
+    "EXCEPT_USERS": [],
+    "SECRET_KEY": "test-secret",
+    "API_USERNAME": "api",
+    "API_PASSWORD": "api",
+}
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    """
+    Write BASE_CONFIG to a temporary directory and run the test in it,
+    the cached config of 'utils.read_config' is reset.
+    """
+    (tmp_path / "config.json").write_text(json.dumps(BASE_CONFIG), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    prepare_data_dir()
+    monkeypatch.setattr(read_config, "CONFIG_DATA", None)
+    monkeypatch.setattr(read_config, "LAST_READ_TIME", 0)
+    return tmp_path
+
+
+@pytest.fixture
+def bind_mounted_config(config_dir, tmp_path_factory):
+    """
+    Bind-mount config.json from another directory like docker-compose.yml
+    does, so it can't be replaced by a rename (skipped without mount rights).
+    """
+    source = tmp_path_factory.mktemp("host") / "config.json"
+    source.write_text(json.dumps(BASE_CONFIG), encoding="utf-8")
+    target = config_dir / "config.json"
+    try:
+        result = subprocess.run(
+            ["mount", "--bind", str(source), str(target)], capture_output=True, check=False
+        )
+    except OSError:
+        result = None
+    if result is None or result.returncode:
+        pytest.skip("bind mounts are not available")
+    try:
+        yield source
+    finally:
+        subprocess.run(["umount", str(target)], capture_output=True, check=False)
@@ -0,0 +1,40 @@
+"""
+Tests of the data directory (utils/data_dir.py) and the state database backup.
+"""
+
+import json
+import sqlite3
+
+from utils.data_dir import DATA_DIR, prepare_data_dir
+from utils.state_db import get_state_db
+
+
+def test_legacy_state_files_are_moved_to_the_data_dir(config_dir):
+    (config_dir / ".disable_users.json").write_text('{"disable_user": ["alice"]}')
+    (config_dir / ".disable_users.json.journal").write_text('{"op": "add", "user": "bob"}\n')
+    (config_dir / DATA_DIR / "detected_users.json").write_text('{"detectedUsers": []}')
+    (config_dir / "detected_users.json").write_text('{"detectedUsers": [{"user": "old"}]}')
+
+    prepare_data_dir()
+
+    assert json.loads((config_dir / DATA_DIR / ".disable_users.json").read_text()) == {
+        "disable_user": ["alice"]
+    }
+    assert (config_dir / DATA_DIR / ".disable_users.json.journal").exists()
+    assert not (config_dir / ".disable_users.json").exists()
+    # The file in the data directory wins, the old one is left alone
+    assert (config_dir / DATA_DIR / "detected_users.json").read_text() == '{"detectedUsers": []}'
+    assert (config_dir / "detected_users.json").exists()
+
+
+def test_state_db_is_created_in_the_data_dir_and_dumped(config_dir, monkeypatch):
+    monkeypatch.setattr("utils.state_db.STATE_DBS", {})
+    state_db = get_state_db({"STATE_BACKEND": "sqlite", "SPECIAL_LIMIT": [["alice", 5]]})
+    assert state_db.path == f"{DATA_DIR}/state.db"
+
+    (config_dir / "backup.db").write_bytes(state_db.dump())
+    with sqlite3.connect(config_dir / "backup.db") as backup:
+        assert backup.execute("SELECT user, ip_limit FROM special_limits").fetchall() == [
+            ("alice", 5)
+        ]
+    state_db.conn.close()
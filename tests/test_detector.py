@@ -0,0 +1,120 @@
+"""
+Tests of the incremental detector (utils/detector.py).
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from utils import detector, policy, read_config
+from utils.detector import IP_MIN_HITS, IncrementalDetector
+
+
+@pytest.fixture
+def fresh_policy(config_dir, monkeypatch):
+    """Use an empty policy index, as on startup."""
+    index = policy.PolicyIndex()
+    monkeypatch.setattr(policy, "POLICY", index)
+    monkeypatch.setattr(detector, "POLICY", index)
+    return index
+
+
+def see(instance: IncrementalDetector, user: str, ips: int) -> None:
+    """Make 'ips' IPs of the user count toward its limit."""
+    for number in range(ips):
+        for _ in range(IP_MIN_HITS + 1):
+            instance.observe(user, f"10.0.0.{number}")
+
+
+def load_config() -> dict:
+    """Return the content of config.json."""
+    with open("config.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_config(**changes) -> None:
+    """Change config.json, it is read again on the next 'read_config'."""
+    config_data = {**load_config(), **changes}
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+    read_config.CONFIG_DATA = None
+
+
+def test_user_is_flagged_when_an_ip_starts_to_count(fresh_policy):
+    asyncio.run(policy.get_policy())
+    instance = IncrementalDetector()
+    see(instance, "bob", 2)
+    assert not instance.over_limit
+    see(instance, "bob", 3)
+    assert instance.over_limit == {"bob": 0}
+    # alice has a special limit of 5
+    see(instance, "alice", 3)
+    assert "alice" not in instance.over_limit
+
+
+def test_violation_event_after_the_confirmations(fresh_policy):
+    config_data = {**load_config(), "EVENT_DETECTION": True}
+    instance = IncrementalDetector()
+
+    async def run() -> list:
+        await policy.get_policy()
+        see(instance, "bob", 3)
+        for _ in range(config_data["outOfLimitNumber"] + 1):
+            await instance.tick(config_data)
+        events = []
+        while not instance.events.empty():
+            events.append(instance.events.get_nowait())
+        return events
+
+    events = asyncio.run(run())
+    assert [(event.user, event.limit, len(event.ips)) for event in events] == [("bob", 2, 3)]
+
+
+def test_user_is_cleared_once_its_ips_expire(fresh_policy):
+    asyncio.run(policy.get_policy())
+    instance = IncrementalDetector()
+    see(instance, "bob", 3)
+    for entry in instance.hits["bob"].values():
+        entry[1] = 0  # not seen for a long time
+    asyncio.run(instance.tick(load_config()))
+    assert not instance.over_limit
+    assert "bob" not in instance.distinct
+
+
+def test_excepted_user_is_not_flagged(fresh_policy):
+    write_config(EXCEPT_USERS=["bob"])
+    asyncio.run(policy.get_policy())
+    instance = IncrementalDetector()
+    see(instance, "bob", 4)
+    asyncio.run(instance.tick(load_config()))
+    assert not instance.over_limit
+
+
+def test_users_over_their_limit_before_the_first_tick(fresh_policy):
+    instance = IncrementalDetector()
+    see(instance, "bob", 4)
+    assert not instance.over_limit  # the limits are not loaded yet
+    asyncio.run(instance.tick(load_config()))
+    assert instance.over_limit == {"bob": 1}
+
+
+def test_lowered_limit_flags_users(fresh_policy):
+    instance = IncrementalDetector()
+    see(instance, "alice", 4)
+    asyncio.run(instance.tick(load_config()))
+    assert "alice" not in instance.over_limit  # special limit of 5
+    write_config(SPECIAL_LIMIT=[["alice", 3]])
+    asyncio.run(instance.tick(load_config()))
+    assert instance.over_limit == {"alice": 1}
+
+
+def test_user_removed_from_except_users_is_flagged(fresh_policy):
+    write_config(EXCEPT_USERS=["bob"])
+    instance = IncrementalDetector()
+    see(instance, "bob", 4)
+    asyncio.run(instance.tick(load_config()))
+    assert not instance.over_limit
+    write_config(EXCEPT_USERS=[])
+    asyncio.run(instance.tick(load_config()))
+    assert instance.over_limit == {"bob": 1}
@@ -0,0 +1,114 @@
+"""
+Tests of the disabled users (utils/handel_dis_users.py).
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from utils import handel_dis_users, read_config
+from utils.handel_dis_users import DisabledUsers, ReEnableScheduler
+
+
+@pytest.fixture(autouse=True)
+def disabled_users_state(config_dir, monkeypatch):
+    """Every test starts without disabled users, as after a fresh start."""
+    monkeypatch.setattr(handel_dis_users, "DISABLED_USERS", set())
+    monkeypatch.setattr(handel_dis_users, "DISABLED_AT", {})
+    monkeypatch.setattr(
+        handel_dis_users, "REENABLE_SCHEDULER", handel_dis_users.ReEnableScheduler()
+    )
+    monkeypatch.setattr(DisabledUsers, "loaded", False)
+    monkeypatch.setattr(DisabledUsers, "journal_entries", 0)
+    monkeypatch.setattr(DisabledUsers, "io_lock", asyncio.Lock())
+
+
+def restart(monkeypatch) -> DisabledUsers:
+    """Forget the in-memory state and load it again from disk."""
+    monkeypatch.setattr(handel_dis_users, "DISABLED_USERS", set())
+    monkeypatch.setattr(handel_dis_users, "DISABLED_AT", {})
+    monkeypatch.setattr(DisabledUsers, "loaded", False)
+    monkeypatch.setattr(DisabledUsers, "journal_entries", 0)
+    return DisabledUsers()
+
+
+def test_journal_writes_run_off_the_event_loop(monkeypatch):
+    threads = []
+    write_entry = DisabledUsers.write_entry
+
+    def recorded_write_entry(self, entry, snapshot):
+        threads.append(threading.get_ident())
+        write_entry(self, entry, snapshot)
+
+    monkeypatch.setattr(DisabledUsers, "write_entry", recorded_write_entry)
+    monkeypatch.setattr(handel_dis_users, "COMPACT_EVERY", 5)
+    disabled_users = DisabledUsers()
+
+    async def run() -> None:
+        await asyncio.gather(*(disabled_users.add_user(f"user{number}") for number in range(12)))
+        await disabled_users.remove_user("user3")
+
+    asyncio.run(run())
+    assert len(threads) == 13 and threading.get_ident() not in threads
+
+    restarted = restart(monkeypatch)
+    assert restarted.disabled_users == {f"user{number}" for number in range(12)} - {"user3"}
+
+
+def write_config(**changes) -> None:
+    """Change config.json, it is read again on the next 'read_config'."""
+    with open("config.json", encoding="utf-8") as f:
+        config_data = {**json.load(f), **changes}
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+    read_config.CONFIG_DATA = None
+
+
+def test_schedule_is_rebuilt_from_disabled_at_after_a_restart(monkeypatch):
+    disabled_users = DisabledUsers()
+
+    async def run() -> None:
+        await disabled_users.add_user("alice")
+        await disabled_users.add_user("bob")
+        await disabled_users.remove_user("bob")
+
+    asyncio.run(run())
+    disabled_at = handel_dis_users.DISABLED_AT["alice"]
+
+    restart(monkeypatch)
+    scheduler = ReEnableScheduler()
+    scheduler.load()
+    # TIME_TO_ACTIVE_USERS is 900 in the test config
+    assert scheduler.heap == [(disabled_at + 900, "alice", disabled_at)]
+    assert scheduler.next_entry() == (disabled_at + 900, "alice", disabled_at)
+
+
+def test_due_users_are_enabled_once_at_the_reenable_rate(monkeypatch):
+    write_config(REENABLE_RATE=20)
+    now = time.time()
+    for number in range(3):
+        handel_dis_users.DISABLED_AT[f"user{number}"] = now - 1000 - number
+    scheduler = ReEnableScheduler()
+    enabled = []
+
+    async def enable(username: str) -> None:
+        enabled.append((username, time.monotonic()))
+        del handel_dis_users.DISABLED_AT[username]
+
+    async def run() -> None:
+        task = asyncio.create_task(scheduler.run(enable))
+        while len(enabled) < 3:
+            await asyncio.sleep(0.01)
+        # Nothing else is due
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(enabled) == 3
+    # Overdue users first, the oldest deadline first
+    assert [username for username, _ in enabled] == ["user2", "user1", "user0"]
+    gaps = [later - earlier for (_, earlier), (_, later) in zip(enabled, enabled[1:])]
+    assert all(gap >= 1 / 20 for gap in gaps)
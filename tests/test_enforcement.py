@@ -0,0 +1,184 @@
+"""
+Tests of the enforcement queue (utils/enforcement.py).
+"""
+
+import asyncio
+import threading
+import time
+
+from utils import enforcement
+from utils.enforcement import DISABLE, ENABLE, EnforcementQueue
+
+
+def test_actions_are_coalesced_per_user(config_dir):
+    queue = EnforcementQueue()
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE)
+        first = queue.pending["alice"]
+        await queue.enqueue("alice", DISABLE)
+        assert queue.pending["alice"] is first
+        await queue.enqueue("alice", ENABLE)
+
+    asyncio.run(run())
+    assert queue.pending["alice"].kind == ENABLE
+    assert queue.ready.qsize() == 1
+
+
+def test_pending_actions_survive_a_restart(config_dir):
+    queue = EnforcementQueue()
+    restarted = EnforcementQueue()
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE, "too many IPs")
+        await queue.enqueue("bob", ENABLE)
+        await restarted.load()
+
+    asyncio.run(run())
+    assert {user: action.kind for user, action in restarted.pending.items()} == {
+        "alice": DISABLE,
+        "bob": ENABLE,
+    }
+    assert restarted.pending["alice"].reason == "too many IPs"
+    assert restarted.ready.qsize() == 2
+
+
+def test_worker_executes_and_forgets_the_action(config_dir, monkeypatch):
+    queue = EnforcementQueue()
+    executed = []
+
+    async def execute(panel_data, action):  # pylint: disable=unused-argument
+        executed.append((action.user, action.kind))
+
+    monkeypatch.setattr(queue, "execute", execute)
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE)
+        worker = asyncio.create_task(queue.worker(None))
+        while queue.processed < 1:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+
+    asyncio.run(run())
+    assert executed == [("alice", DISABLE)]
+    assert not queue.pending
+
+    restarted = EnforcementQueue()
+    asyncio.run(restarted.load())
+    assert not restarted.pending
+
+
+def test_action_is_dropped_after_the_last_attempt(config_dir, monkeypatch):
+    with open("config.json", encoding="utf-8") as f:
+        config = f.read()
+    with open("config.json", "w", encoding="utf-8") as f:
+        f.write(config[:-1] + ', "ENFORCEMENT_MAX_ATTEMPTS": 2}')
+    queue = EnforcementQueue()
+    messages = []
+
+    async def execute(panel_data, action):  # pylint: disable=unused-argument
+        raise ConnectionError("panel is down")
+
+    async def send_logs(message, **kwargs):  # pylint: disable=unused-argument
+        messages.append(message)
+
+    monkeypatch.setattr(queue, "execute", execute)
+    def retry_later(action, delay):  # pylint: disable=unused-argument
+        # Right away instead of after the backoff
+        asyncio.get_running_loop().call_soon(queue.wake, action.user)
+
+    monkeypatch.setattr(queue, "retry_later", retry_later)
+    monkeypatch.setattr(enforcement, "send_logs", send_logs)
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE)
+        worker = asyncio.create_task(queue.worker(None))
+        while queue.failed < 1:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+
+    asyncio.run(run())
+    assert queue.retries == 1
+    assert not queue.pending
+    assert messages == ["Failed to disable alice after 2 attempts: panel is down"]
+
+
+def test_journal_survives_a_restart(config_dir):
+    queue = EnforcementQueue()
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE, "too many IPs")
+        await queue.enqueue("bob", DISABLE)
+        await queue.enqueue("bob", ENABLE)
+        done = queue.pending.pop("alice")
+        await queue.persist(done, done=True)
+
+    asyncio.run(run())
+    # A crash in the middle of an append leaves a torn last line
+    with open(queue.journal_filename, "a", encoding="utf-8") as file:
+        file.write('{"op": "put", "act')
+
+    restarted = EnforcementQueue()
+    asyncio.run(restarted.load())
+    assert {user: action.kind for user, action in restarted.pending.items()} == {"bob": ENABLE}
+    assert restarted.ready.qsize() == 1
+    # The journal was compacted into the snapshot on load
+    assert (config_dir / queue.journal_filename).read_text() == ""
+
+
+def test_done_entry_keeps_a_newer_action(config_dir):
+    queue = EnforcementQueue()
+
+    async def run() -> None:
+        await queue.enqueue("alice", DISABLE)
+        old = queue.pending["alice"]
+        await queue.enqueue("alice", ENABLE)
+        await queue.persist(old, done=True)
+
+    asyncio.run(run())
+    restarted = EnforcementQueue()
+    asyncio.run(restarted.load())
+    assert restarted.pending["alice"].kind == ENABLE
+
+
+def test_persisting_many_actions_is_cheap(config_dir):
+    queue = EnforcementQueue()
+
+    async def run() -> None:
+        for number in range(2000):
+            await queue.enqueue(f"user{number}", DISABLE)
+        for number in range(2000):
+            await queue.persist(queue.pending.pop(f"user{number}"), done=True)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    # One full rewrite per action took tens of seconds for 2000 users
+    assert time.perf_counter() - start < 5
+
+    restarted = EnforcementQueue()
+    asyncio.run(restarted.load())
+    assert not restarted.pending
+
+
+def test_writes_run_off_the_event_loop_in_call_order(config_dir, monkeypatch):
+    queue = EnforcementQueue()
+    threads = []
+    write_change = queue.write_change
+
+    def recorded_write_change(*args):
+        threads.append(threading.get_ident())
+        write_change(*args)
+
+    monkeypatch.setattr(queue, "write_change", recorded_write_change)
+
+    async def run() -> None:
+        await asyncio.gather(
+            *(queue.enqueue("alice", DISABLE if number % 2 else ENABLE) for number in range(50))
+        )
+
+    asyncio.run(run())
+    assert threads and threading.get_ident() not in threads
+
+    restarted = EnforcementQueue()
+    asyncio.run(restarted.load())
+    assert restarted.pending["alice"].kind == queue.pending["alice"].kind == DISABLE
@@ -0,0 +1,24 @@
+"""
+Tests of the evaluator selection (utils/evaluator.py).
+"""
+
+from utils import evaluator
+
+ACTIVE_USERS = {"alice": ["1.1.1.1"] * 3 + ["2.2.2.2"], "bob": ["3.3.3.3"] * 2}
+
+
+def test_numpy_is_only_used_when_asked_for(monkeypatch):
+    calls = []
+    monkeypatch.setattr(evaluator, "load_numpy", lambda: True)
+    monkeypatch.setattr(
+        evaluator, "evaluate_numpy", lambda users, min_hits: calls.append(users) or {}
+    )
+    for value in (None, "python", "auto"):
+        config_data = {} if value is None else {"EVALUATOR": value}
+        assert evaluator.evaluate(ACTIVE_USERS, config_data) == {
+            "alice": ["1.1.1.1"],
+            "bob": [],
+        }
+    assert not calls
+    evaluator.evaluate(ACTIVE_USERS, {"EVALUATOR": "numpy"})
+    assert calls == [ACTIVE_USERS]
@@ -0,0 +1,87 @@
+"""
+Tests of the event bus of the '/events' stream (utils/event_bus.py).
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("jose")
+
+# pylint: disable=wrong-import-position
+from jose import jwt
+
+from utils import api_server
+from utils.event_bus import EventBus
+from utils.http_server import Request, StreamResponse
+
+
+def write_config(**changes) -> None:
+    """Change config.json before the bus reads it."""
+    with open("config.json", encoding="utf-8") as f:
+        config_data = {**json.load(f), **changes}
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+
+
+def event_ids(frames: list[bytes]) -> list[int | str]:
+    """The id of each frame, or its event name when it has no id."""
+    ids = []
+    for frame in frames:
+        lines = frame.decode().splitlines()
+        if lines[0].startswith("id: "):
+            ids.append(int(lines[0][4:]))
+        else:
+            ids.append(lines[0].removeprefix("event: "))
+    return ids
+
+
+async def read_frames(stream, count: int) -> list[bytes]:
+    return [await asyncio.wait_for(anext(stream), 1) for _ in range(count)]
+
+
+def test_resume_after_the_buffer_wrapped(config_dir):
+    write_config(EVENT_BUFFER_SIZE=5)
+    bus = EventBus()
+
+    async def run() -> tuple[list[bytes], list[bytes]]:
+        for number in range(12):
+            bus.publish("disable", {"user": f"user{number}"})
+        # The client received up to event 3, events 4 to 7 left the buffer
+        stream = bus.subscribe(3)
+        resumed = await read_frames(stream, 6)
+        bus.publish("enable", {"user": "user0"})
+        live = await read_frames(stream, 1)
+        await stream.aclose()
+        return resumed, live
+
+    resumed, live = asyncio.run(run())
+    assert event_ids(resumed) == ["gap", 8, 9, 10, 11, 12]
+    assert json.loads(resumed[0].decode().split("data: ", 1)[1]) == {"from": 4, "to": 7}
+    assert event_ids(live) == [13]
+
+
+def test_last_event_id_header_resumes_the_stream(config_dir, monkeypatch):
+    write_config(EVENT_BUFFER_SIZE=3)
+    bus = EventBus()
+    monkeypatch.setattr(api_server, "EVENTS", bus)
+    token = jwt.encode({"sub": "api"}, "test-secret", algorithm=api_server.ALGORITHM)
+
+    async def run() -> list[bytes]:
+        for number in range(6):
+            bus.publish("disable", {"user": f"user{number}"})
+        request = Request(
+            "GET",
+            "/events",
+            headers={"authorization": f"Bearer {token}", "last-event-id": "2"},
+        )
+        response = await api_server.events_endpoint(request)
+        assert isinstance(response, StreamResponse)
+        frames = await read_frames(response.body, 4)
+        await response.body.aclose()
+        return frames
+
+    frames = asyncio.run(run())
+    assert event_ids(frames) == ["gap", 4, 5, 6]
+    assert json.loads(frames[0].decode().split("data: ", 1)[1]) == {"from": 3, "to": 3}
@@ -0,0 +1,64 @@
+"""
+Tests of the in-process HTTP server (utils/http_server.py).
+"""
+
+import asyncio
+
+import pytest
+
+from utils.http_server import HTTPServer, Request, Response
+
+
+async def echo(request: Request) -> Response:
+    return Response(200, request.body)
+
+
+async def send(raw: bytes) -> bytes:
+    """Send a raw request to a new server and return the raw response."""
+    server = HTTPServer("127.0.0.1", 0)
+    server.route("POST", "/echo", echo)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        server.server.close()
+
+
+def test_body_is_read():
+    response = asyncio.run(
+        send(b"POST /echo HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello")
+    )
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b"\r\n\r\nhello")
+
+
+def test_unknown_path_and_method():
+    response = asyncio.run(send(b"GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 404 Not Found")
+    response = asyncio.run(send(b"GET /echo HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 405 Method Not Allowed")
+
+
+def test_keep_alive_serves_several_requests():
+    response = asyncio.run(
+        send(
+            b"POST /echo HTTP/1.1\r\nContent-Length: 3\r\n\r\none"
+            b"POST /echo HTTP/1.1\r\nContent-Length: 3\r\nConnection: close\r\n\r\ntwo"
+        )
+    )
+    assert response.count(b"HTTP/1.1 200 OK") == 2
+    assert response.endswith(b"two")
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"1e3"])
+def test_invalid_content_length_is_rejected(length):
+    response = asyncio.run(
+        send(b"POST /echo HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\nhello")
+    )
+    assert response.startswith(b"HTTP/1.1 400 Bad Request")
@@ -0,0 +1,142 @@
+"""
+Tests of the pushed log listeners (utils/log_ingest.py).
+"""
+
+import asyncio
+
+import pytest
+
+from utils import log_ingest
+from utils.log_ingest import INGEST_QUEUE, MAX_LINE_SIZE, LogTCPProtocol, resolve_node
+from utils.types import NodeType, PanelType
+
+NODE = NodeType(node_id=1, node_name="de-1", node_ip="10.0.0.1", status="healthy", message=None)
+PANEL = PanelType("admin", "admin", "panel.example.com")
+LINE = b"<14>Jan  1 00:00:00 de-1 xray: 2024/01/01 00:00:00 1.2.3.4:5 accepted tcp:x:443 email: 1.alice\n"
+
+
+@pytest.fixture(autouse=True)
+def ingest_nodes(monkeypatch):
+    """Register one node, with the default (strict) source checks."""
+    monkeypatch.setattr(log_ingest, "INGEST_NODES", {NODE.node_ip: NODE})
+    monkeypatch.setattr(log_ingest, "INGEST_NODES_BY_NAME", {NODE.node_name: NODE})
+    monkeypatch.setattr(log_ingest, "INGEST_ALLOWED_SOURCES", set())
+    monkeypatch.setattr(log_ingest, "INGEST_TRUST_HOSTNAME", False)
+    while not INGEST_QUEUE.empty():
+        INGEST_QUEUE.get_nowait()
+
+
+def test_node_is_resolved_by_its_address():
+    assert resolve_node("10.0.0.1", None) is NODE
+    assert resolve_node("10.0.0.1", "other") is NODE
+
+
+def test_hostname_from_an_unknown_source_is_rejected():
+    assert resolve_node("203.0.113.9", "de-1") is None
+
+
+def test_hostname_from_an_allowed_source(monkeypatch):
+    monkeypatch.setattr(log_ingest, "INGEST_ALLOWED_SOURCES", {"10.0.0.100"})
+    assert resolve_node("10.0.0.100", "de-1") is NODE
+    assert resolve_node("10.0.0.100", "unknown") is None
+    assert resolve_node("203.0.113.9", "de-1") is None
+
+
+def test_hostname_trusted_when_enabled(monkeypatch):
+    monkeypatch.setattr(log_ingest, "INGEST_TRUST_HOSTNAME", True)
+    assert resolve_node("203.0.113.9", "de-1") is NODE
+
+
+class FakeTransport:
+    """Records whether the protocol closed the connection."""
+
+    def __init__(self, peer: str):
+        self.peer = peer
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return (self.peer, 12345) if name == "peername" else None
+
+    def close(self):
+        self.closed = True
+
+
+def test_tcp_lines_are_queued():
+    protocol = LogTCPProtocol()
+    transport = FakeTransport("10.0.0.1")
+    protocol.connection_made(transport)
+    protocol.data_received(LINE[:20])
+    assert INGEST_QUEUE.empty()
+    protocol.data_received(LINE[20:] + LINE)
+    node, messages = INGEST_QUEUE.get_nowait()
+    assert node is NODE and len(messages) == 2
+    assert not transport.closed
+
+
+def test_tcp_line_without_newline_is_capped():
+    protocol = LogTCPProtocol()
+    transport = FakeTransport("10.0.0.1")
+    protocol.connection_made(transport)
+    for _ in range(MAX_LINE_SIZE // 4096 + 1):
+        protocol.data_received(b"x" * 4096)
+    assert transport.closed
+    assert protocol.buffer == b""
+
+
+def test_pushed_lines_mark_the_node_as_pushing(monkeypatch):
+    monkeypatch.setattr(log_ingest, "INGEST_LAST_PUSH", {})
+    assert not log_ingest.node_is_pushing(NODE.node_id)
+    log_ingest.enqueue_lines("10.0.0.1", [LINE])
+    assert log_ingest.node_is_pushing(NODE.node_id)
+    log_ingest.INGEST_LAST_PUSH[NODE.node_id] -= log_ingest.PUSH_TIMEOUT
+    assert not log_ingest.node_is_pushing(NODE.node_id)
+
+
+async def fake_get_token(_panel_data):
+    return PanelType("admin", "admin", "panel.example.com", "token")
+
+
+async def fake_send_logs(*_args, **_kwargs):
+    return None
+
+
+def test_pushing_node_is_not_pulled_over_the_websocket(config_dir, monkeypatch):
+    get_logs = pytest.importorskip("utils.get_logs")
+    monkeypatch.setattr(log_ingest, "INGEST_LAST_PUSH", {})
+    parsed, connections = [], []
+
+    class FakeWebsocket:
+        """Sends frames, the node starts pushing after the first one."""
+
+        async def __aenter__(self):
+            connections.append(self)
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def recv(self, decode=False):  # pylint: disable=unused-argument
+            if parsed:
+                log_ingest.enqueue_lines("10.0.0.1", [LINE])
+            return LINE
+
+    async def fake_parse_logs(log, node_id):
+        parsed.append((log, node_id))
+
+    class Stop(BaseException):
+        """Ends the pull loop at its first wait."""
+
+    async def stop(_seconds):
+        raise Stop
+
+    monkeypatch.setattr(
+        get_logs.websockets.asyncio.client, "connect", lambda *_args, **_kwargs: FakeWebsocket()
+    )
+    monkeypatch.setattr(get_logs, "get_token", fake_get_token)
+    monkeypatch.setattr(get_logs, "send_logs", fake_send_logs)
+    monkeypatch.setattr(get_logs, "parse_logs", fake_parse_logs)
+    monkeypatch.setattr(get_logs.asyncio, "sleep", stop)
+    with pytest.raises(Stop):
+        asyncio.run(get_logs.get_nodes_logs(PANEL, NODE))
+    # The frame received once the node pushes is dropped, no reconnection
+    assert len(parsed) == 1 and len(connections) == 1
@@ -0,0 +1,39 @@
+"""
+Tests of the log parser (utils/parse_logs.py).
+"""
+
+import asyncio
+
+import pytest
+
+from utils import parse_logs as parse_logs_module
+from utils.detector import IncrementalDetector
+from utils.parse_logs import parse_logs
+
+FRAME = (
+    b"2024/01/01 00:00:00 5.160.0.7:5000 accepted tcp:example.com:443 email: 12.geo_user\n"
+    b"2024/01/01 00:00:01 5.160.0.7:5001 accepted tcp:example.com:443 email: 12.geo_user\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def parser_state(config_dir, monkeypatch):
+    """Run the parser on empty module state, restored after the test."""
+    for name in ("ACTIVE_USERS", "SEEN_ENTRIES", "SEEN_STATS", "CACHE", "GEO_LOOKUP_SECONDS"):
+        monkeypatch.setattr(parse_logs_module, name, {})
+    monkeypatch.setattr(parse_logs_module, "VALID_IPS", [])
+    monkeypatch.setattr(parse_logs_module, "DETECTOR", IncrementalDetector())
+
+
+def test_geolocation_wait_is_recorded_per_node(monkeypatch):
+    async def slow_check_ip(ip_address: str) -> str:  # pylint: disable=unused-argument
+        await asyncio.sleep(0.2)
+        return "IR"
+
+    monkeypatch.setattr(parse_logs_module, "check_ip", slow_check_ip)
+
+    asyncio.run(parse_logs(FRAME, 7))
+    assert parse_logs_module.ACTIVE_USERS["geo_user"].ip == ["5.160.0.7", "5.160.0.7"]
+    assert parse_logs_module.DETECTOR.hits["geo_user"]["5.160.0.7"][0] == 2
+    # One lookup, the second line uses the validated IP
+    assert 0.2 <= parse_logs_module.GEO_LOOKUP_SECONDS[7] < 0.4
@@ -0,0 +1,52 @@
+"""
+Tests of the message splitting (telegram_bot/send_message.py).
+"""
+
+import re
+
+import pytest
+
+pytest.importorskip("telegram")
+
+# pylint: disable=wrong-import-position
+from telegram_bot.send_message import split_message
+
+TAG_REGEX = re.compile(r"<(/?)(\w+)[^>]*>")
+
+
+def assert_balanced(part: str) -> None:
+    """Every tag of the part is closed in the part, in order."""
+    open_tags = []
+    for closing, name in TAG_REGEX.findall(part):
+        if closing:
+            assert open_tags.pop() == name, part
+        else:
+            open_tags.append(name)
+    assert not open_tags, part
+
+
+def text_of(html: str) -> str:
+    return TAG_REGEX.sub("", html)
+
+
+def test_long_line_of_tagged_ips_keeps_the_tags_balanced():
+    ips = ", ".join(f"<code>10.0.{number // 256}.{number % 256}</code>" for number in range(400))
+    line = f"<b>alice</b> with <b>400</b> active ips: <i>{ips}</i>"
+    text = f"first line\n{line}\nlast line"
+    parts = split_message(text, limit=1000)
+
+    assert len(parts) > 2
+    for part in parts:
+        assert len(part) <= 1000
+        assert_balanced(part)
+    # Only tags were added at the cuts, no IP is cut in two
+    assert text_of("".join(parts)).replace("\n", "") == text_of(text).replace("\n", "")
+    assert all(
+        re.fullmatch(r"10\.0\.\d+\.\d+", ip)
+        for part in parts
+        for ip in re.findall(r"<code>([^<]*)</code>", part)
+    )
+
+
+def test_short_lines_are_grouped():
+    assert split_message("a\nb\nc", limit=3) == ["a\nb", "c"]
@@ -0,0 +1,70 @@
+"""
+Tests of the special limit updates (utils/special_limits.py and both APIs).
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from utils.special_limits import (
+    parse_rows,
+    save_special_limits,
+    set_row_statuses,
+    update_special_limits,
+    validate_rows,
+)
+
+
+def saved_limits(path) -> dict[str, int]:
+    """Return the special limits saved in a config file."""
+    with open(path, encoding="utf-8") as f:
+        return dict(json.load(f)["SPECIAL_LIMIT"])
+
+
+def test_validate_rows_last_row_wins():
+    rows = parse_rows("user,limit\nalice,3\nbob,x\nalice,4\n", "text/csv")
+    limits, results = validate_rows(rows)
+    assert limits == {"alice": 4}
+    summary = set_row_statuses(results, {"alice": 5})
+    assert summary == {"added": 0, "updated": 1, "skipped": 1, "invalid": 1}
+
+
+def test_save_special_limits_merges(config_dir):
+    with open("config.json", encoding="utf-8") as f:
+        config_data = json.load(f)
+    previous = save_special_limits(config_data, {"bob": 3, "alice": 1})
+    assert previous == {"alice": 5}
+    assert saved_limits("config.json") == {"alice": 1, "bob": 3}
+
+
+def test_bulk_import_persists_on_bind_mounted_config(bind_mounted_config):
+    inode = os.stat("config.json").st_ino
+    previous = asyncio.run(update_special_limits({"bob": 3, "carol": 4}))
+    assert previous == {"alice": 5}
+    # The file was rewritten in place, not replaced
+    assert os.stat("config.json").st_ino == inode
+    assert saved_limits(bind_mounted_config) == {"alice": 5, "bob": 3, "carol": 4}
+
+
+def test_flask_api_persists_on_bind_mounted_config(bind_mounted_config):
+    pytest.importorskip("flask")
+    api = pytest.importorskip("api")
+    client = api.app.test_client()
+    token = client.post(
+        "/login", json={"username": api.API_USERNAME, "password": api.API_PASSWORD}
+    ).json["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post(
+        "/update_special_limits", data="bob,3\ncarol,x\n", headers=headers, content_type="text/csv"
+    )
+    assert response.status_code == 200
+    assert response.json["added"] == 1 and response.json["invalid"] == 1
+
+    response = client.post(
+        "/update_special_limit", json={"user": "alice", "limit": 7}, headers=headers
+    )
+    assert response.status_code == 200 and response.json["status"] == "updated"
+    assert saved_limits(bind_mounted_config) == {"alice": 7, "bob": 3}
@@ -0,0 +1,52 @@
+"""
+Tests of the adaptive websocket interval (utils/stream_interval.py).
+"""
+
+import asyncio
+
+import pytest
+
+from utils import stream_interval
+from utils.stream_interval import MIN_FRAMES, next_interval, record_frame
+from utils.types import NodeStreamStats
+
+
+@pytest.fixture(autouse=True)
+def stream_stats(config_dir, monkeypatch):
+    """Start without any node statistics."""
+    stats: dict[int, NodeStreamStats] = {}
+    monkeypatch.setattr(stream_interval, "STREAM_STATS", stats)
+    return stats
+
+
+def test_first_connection_uses_a_spread_interval(stream_stats):
+    assert float(asyncio.run(next_interval(1))) in (0.9, 1.3, 1.5, 1.7)
+    assert 1 in stream_stats
+
+
+def test_frames_of_unknown_nodes_are_ignored(stream_stats):
+    record_frame(1, 1024, 0.01)
+    assert not stream_stats
+
+
+def test_large_frames_shorten_the_interval(stream_stats):
+    stream_stats[1] = NodeStreamStats(interval=2.0)
+    for _ in range(MIN_FRAMES):
+        # Twice the default frame target, half the parse time target
+        record_frame(1, 128 * 1024, 0.025)
+    # The frame size wins: proposed 1.0s, damped with the current 2.0s
+    assert asyncio.run(next_interval(1)) == "1.4"
+    assert stream_stats[1].frames == 0
+
+
+def test_interval_is_kept_without_enough_frames(stream_stats):
+    stream_stats[1] = NodeStreamStats(interval=2.0)
+    record_frame(1, 128 * 1024, 0.025)
+    assert asyncio.run(next_interval(1)) == "2.0"
+
+
+def test_interval_stays_within_the_bounds(stream_stats):
+    stream_stats[1] = NodeStreamStats(interval=5.0)
+    for _ in range(MIN_FRAMES):
+        record_frame(1, 10, 0.0001)
+    assert asyncio.run(next_interval(1)) == "5.0"
@@ -0,0 +1,144 @@
+"""
+Tests of the Telegram webhook (run_telegram.start_webhook) against a local
+fake Bot API server.
+"""
+
+import asyncio
+import json
+import socket
+from urllib.parse import parse_qsl
+
+import pytest
+
+pytest.importorskip("telegram")
+
+# pylint: disable=wrong-import-position
+from telegram.ext import CommandHandler
+
+import run_telegram
+from telegram_bot import bot
+from utils import http_server, read_config
+from utils.http_server import HTTPServer, Request, Response, json_response
+
+SECRET = "webhook-secret"
+BASE_TOKEN = "123456:TEST"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 5,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "admin"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+def free_port() -> int:
+    """Return a TCP port nobody listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeBotAPI:
+    """Answers the Bot API methods the webhook needs and records the calls."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.calls: list[tuple[str, dict]] = []
+        self.server = HTTPServer("127.0.0.1", free_port())
+        for method in ("getMe", "setWebhook", "deleteWebhook"):
+            self.server.route("POST", f"/bot{token}/{method}", self.handle)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.port}"
+
+    async def handle(self, request: Request) -> Response:
+        method = request.path.rsplit("/", 1)[-1]
+        # The parameters are form encoded
+        body = dict(parse_qsl(request.body.decode()))
+        self.calls.append((method, body))
+        if method == "getMe":
+            return json_response(
+                {
+                    "ok": True,
+                    "result": {"id": 42, "is_bot": True, "first_name": "bot", "username": "bot"},
+                }
+            )
+        return json_response({"ok": True, "result": True})
+
+
+async def post(port: int, path: str, body: bytes, secret: str) -> bytes:
+    """Post a body to the webhook and return the status line."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    return response.split(b"\r\n", 1)[0]
+
+
+def write_config(**changes) -> dict:
+    """Change config.json, it is read again on the next 'read_config'."""
+    with open("config.json", encoding="utf-8") as f:
+        config_data = {**json.load(f), **changes}
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+    read_config.CONFIG_DATA = None
+    return config_data
+
+
+def test_update_is_delivered_through_the_webhook(config_dir, monkeypatch):
+    monkeypatch.setattr(bot, "application", None)
+    monkeypatch.setattr(http_server, "HTTP_SERVERS", {})
+    fake_api = FakeBotAPI(BASE_TOKEN)
+    webhook_port = free_port()
+    config_data = write_config(
+        TELEGRAM_API_BASE_URL=fake_api.url,
+        TELEGRAM_WEBHOOK_URL="https://bot.example.com/tg-hook",
+        TELEGRAM_WEBHOOK_PORT=webhook_port,
+        TELEGRAM_WEBHOOK_SECRET=SECRET,
+    )
+
+    async def run() -> tuple[list, list]:
+        await fake_api.server.start()
+        received = []
+        handled = asyncio.Event()
+
+        async def start(update, context):  # pylint: disable=unused-argument
+            received.append(update.message.text)
+            handled.set()
+
+        application = await bot.get_application()
+        application.add_handler(CommandHandler("start", start))
+        statuses = []
+        try:
+            async with application:
+                await application.start()
+                server = await run_telegram.start_webhook(application, config_data)
+                body = json.dumps(UPDATE).encode()
+                statuses.append(await post(webhook_port, "/tg-hook", body, "wrong"))
+                statuses.append(await post(webhook_port, "/tg-hook", body, SECRET))
+                statuses.append(await post(webhook_port, "/tg-hook", b"{", SECRET))
+                await asyncio.wait_for(handled.wait(), 5)
+                await application.stop()
+                server.server.close()
+        finally:
+            fake_api.server.server.close()
+        return statuses, received
+
+    statuses, received = asyncio.run(run())
+    assert statuses == [b"HTTP/1.1 403 Forbidden", b"HTTP/1.1 200 OK", b"HTTP/1.1 400 Bad Request"]
+    assert received == ["/start"]
+    set_webhook = [body for method, body in fake_api.calls if method == "setWebhook"]
+    assert len(set_webhook) == 1
+    assert set_webhook[0]["url"] == "https://bot.example.com/tg-hook"
+    assert set_webhook[0]["secret_token"] == SECRET
@@ -0,0 +1,124 @@
+"""
+Tests of the webhook dispatcher (utils/webhook.py), the endpoints are served
+by an 'httpx.MockTransport'.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from utils.webhook import WebhookDispatcher
+
+GOOD = "http://good.example.com/hook"
+DOWN = "http://down.example.com/hook"
+
+
+def write_config(**changes) -> None:
+    """Change config.json, it is read again on the next 'read_config'."""
+    with open("config.json", encoding="utf-8") as f:
+        config_data = {**json.load(f), **changes}
+    with open("config.json", "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+
+
+@pytest.fixture
+def received(config_dir):
+    """Requests received by the endpoints, DOWN always answers 503."""
+    return []
+
+
+@pytest.fixture
+def dispatcher(received):
+    """A dispatcher whose client talks to the mock endpoints."""
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        received.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(503 if str(request.url) == DOWN else 200)
+
+    instance = WebhookDispatcher()
+    instance.client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    return instance
+
+
+def test_events_are_sent_one_by_one(dispatcher, received):
+    events = [{"username": "alice", "status": "disabled"}, {"username": "bob", "status": "enabled"}]
+    asyncio.run(dispatcher.deliver(GOOD, events, batch=False))
+    assert received == [(GOOD, events[0]), (GOOD, events[1])]
+    assert dispatcher.stats[GOOD]["sent"] == 2
+
+
+def test_events_are_sent_as_one_batch(dispatcher, received):
+    events = [{"username": "alice", "status": "disabled"}, {"username": "bob", "status": "enabled"}]
+    asyncio.run(dispatcher.deliver(GOOD, events, batch=True))
+    assert received == [(GOOD, events)]
+    assert dispatcher.stats[GOOD]["sent"] == 2
+
+
+def test_failed_events_are_spooled_and_replayed(dispatcher, received):
+    write_config(WEBHOOK_MAX_ATTEMPTS=2)
+    events = [{"username": "alice", "status": "disabled"}]
+    asyncio.run(dispatcher.deliver(DOWN, events, batch=False))
+    assert len(received) == 2
+    assert dispatcher.stats[DOWN]["failed"] == 1
+    assert dispatcher.stats[DOWN]["spooled"] == 1
+    assert dispatcher.read_spool() == [{"url": DOWN, "events": events}]
+
+    # The endpoint is back, the replay sends the spooled events once
+    dispatcher.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            lambda request: received.append(json.loads(request.content)) or httpx.Response(200)
+        )
+    )
+    asyncio.run(dispatcher.replay_spool())
+    assert received[-1] == events[0]
+    assert dispatcher.read_spool() == []
+
+
+def test_overflow_is_spooled_for_every_endpoint(dispatcher):
+    for number in range(dispatcher.queue.maxsize + 1):
+        dispatcher.notify(f"user{number}", "disabled")
+    assert dispatcher.read_spool() == [
+        {"url": None, "events": [{"username": f"user{dispatcher.queue.maxsize}", "status": "disabled"}]}
+    ]
+
+
+def test_slow_endpoint_does_not_delay_the_others(config_dir, received):
+    slow = "http://slow.example.com/hook"
+    write_config(WEBHOOK_URL=[slow, GOOD])
+    release = asyncio.Event()
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        if str(request.url) == slow:
+            await release.wait()
+        received.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(200)
+
+    async def run() -> list:
+        instance = WebhookDispatcher()
+        instance.client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+        task = asyncio.create_task(instance.dispatch())
+        instance.notify("alice", "disabled")
+        instance.notify("bob", "enabled")
+        while len(received) < 2:
+            await asyncio.sleep(0.01)
+        before_release = list(received)
+        release.set()
+        while len(received) < 4:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return before_release
+
+    before_release = asyncio.run(asyncio.wait_for(run(), 5))
+    assert [url for url, _event in before_release] == [GOOD, GOOD]
+
+
+def test_spool_without_endpoints_is_kept(dispatcher, received):
+    write_config(WEBHOOK_URL="")
+    dispatcher.spool(None, [{"username": "bob", "status": "enabled"}])
+    asyncio.run(dispatcher.replay_spool())
+    assert not received
+    assert dispatcher.read_spool() == [
+        {"url": None, "events": [{"username": "bob", "status": "enabled"}]}
+    ]
@@ -0,0 +1,263 @@
+"""
+This module contains the embedded HTTP API ('API_EMBEDDED': true).
+
+It serves the endpoints of 'api.py' from the event loop of the monitor on
+the in-process HTTP server, so no second process is needed: reads are
+answered from memory and updates are pushed to the policy index.
+"""
+
+import os
+from datetime import UTC, datetime, timedelta
+
+from jose import JWTError, jwt
+
+from utils.detector import DETECTOR
+from utils.event_bus import EVENTS
+from utils.http_server import (
+    Request,
+    Response,
+    StreamResponse,
+    get_http_server,
+    json_response,
+)
+from utils.logs import logger
+from utils.policy import get_policy
+from utils.read_config import read_config
+from utils.special_limits import (
+    parse_rows,
+    set_row_statuses,
+    update_special_limit,
+    update_special_limits,
+    validate_rows,
+)
+from utils.top_offenders import TOP_OFFENDERS
+
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+
+
+def create_access_token(config_data: dict, username: str) -> str:
+    """Create access token for user"""
+    expire = datetime.now(UTC) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    payload = {"sub": username, "exp": expire}
+    return jwt.encode(payload, config_data["SECRET_KEY"], algorithm=ALGORITHM)
+
+
+def authorize(request: Request, config_data: dict) -> Response | None:
+    """
+    Check the bearer token of a request, returns the error response
+    or None if the request is authorized. The token can also be given
+    as '?token=' for clients that can't set headers (e.g. EventSource).
+    """
+    token = request.headers.get("authorization")
+    if not token and request.query.get("token"):
+        token = f"Bearer {request.query['token']}"
+    if not token:
+        return json_response({"error": "Token is missing"}, 401)
+    try:
+        token = token.split(" ")[1]  # Bearer token
+    except IndexError:
+        return json_response({"error": "Invalid token format"}, 401)
+    try:
+        payload = jwt.decode(token, config_data["SECRET_KEY"], algorithms=[ALGORITHM])
+    except JWTError:
+        return json_response({"error": "Invalid or expired token"}, 401)
+    if payload.get("sub") != config_data["API_USERNAME"]:
+        return json_response({"error": "Unauthorized"}, 403)
+    return None
+
+
+def read_json(request: Request) -> dict | None:
+    """Return the JSON object of the request body, or None if there is none."""
+    try:
+        data = request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) and data else None
+
+
+async def login(request: Request) -> Response:
+    """User login and access token retrieval"""
+    config_data = await read_config()
+    data = read_json(request)
+    if not data:
+        return json_response({"error": "No data provided"}, 400)
+    username = data.get("username")
+    password = data.get("password")
+    if not username or not password:
+        return json_response({"error": "Username and password are required"}, 400)
+    if username == config_data["API_USERNAME"] and password == config_data["API_PASSWORD"]:
+        token = create_access_token(config_data, username)
+        return json_response({"access_token": token, "token_type": "bearer"})
+    return json_response({"error": "Invalid credentials"}, 401)
+
+
+async def update_special_limit_endpoint(request: Request) -> Response:
+    """Update special limit for user"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    data = read_json(request)
+    if not data:
+        return json_response({"error": "No data provided"}, 400)
+    user = data.get("user")
+    limit = data.get("limit")
+    if not user or not isinstance(limit, int) or isinstance(limit, bool):
+        return json_response(
+            {"error": "Invalid input: user and limit (integer) are required"}, 400
+        )
+    if limit < 0:
+        return json_response({"error": "Limit must be a positive number"}, 400)
+    status = await update_special_limit(user, limit)
+    return json_response(
+        {"status": status, "user": user, "limit": limit}, 201 if status == "added" else 200
+    )
+
+
+async def update_special_limits_endpoint(request: Request) -> Response:
+    """Update the special limits of many users (JSON or CSV body) with one write"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    try:
+        rows = parse_rows(request.body.decode("utf-8"), request.headers.get("content-type", ""))
+    except ValueError as err:
+        return json_response({"error": f"Invalid body: {err}"}, 400)
+    limits, results = validate_rows(rows)
+    previous = await update_special_limits(limits) if limits else {}
+    summary = set_row_statuses(results, previous)
+    return json_response({**summary, "results": results}, 200 if limits else 400)
+
+
+async def special_limits_endpoint(request: Request) -> Response:
+    """Return the special limits (or the limit of '?user='), from memory"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    policy = await get_policy()
+    user = request.query.get("user")
+    if user:
+        return json_response(
+            {
+                "user": user,
+                "limit": policy.limit_for(user),
+                "special": user in policy.special_limits,
+                "excepted": policy.is_excepted(user),
+            }
+        )
+    return json_response(
+        {"general_limit": policy.general_limit, "special_limits": policy.special_limits}
+    )
+
+
+def int_param(request: Request, name: str, default: int) -> int:
+    """
+    Return a positive integer query parameter.
+
+    Raises:
+        ValueError: If the parameter is not a positive integer.
+    """
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ValueError(f"'{name}' must be a positive number")
+    return value
+
+
+async def user_ips_endpoint(request: Request) -> Response:
+    """Return the IPs of '?user=' in the current detection window"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    user = request.query.get("user")
+    if not user:
+        return json_response({"error": "'user' is required"}, 400)
+    policy = await get_policy()
+    return json_response(
+        {"user": user, "ips": DETECTOR.active_ips(user), "limit": policy.limit_for(user)}
+    )
+
+
+async def ip_users_endpoint(request: Request) -> Response:
+    """Return the users behind '?ip=' in the current detection window"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    ip = request.query.get("ip")
+    if not ip:
+        return json_response({"error": "'ip' is required"}, 400)
+    return json_response({"ip": ip, "users": DETECTOR.users_of(ip)})
+
+
+async def top_offenders_endpoint(request: Request) -> Response:
+    """Return the '?n=' users with the most IPs"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    try:
+        n = int_param(request, "n", 20)
+    except ValueError as err:
+        return json_response({"error": str(err)}, 400)
+    return json_response(
+        [{"user": user, "ips": count} for user, count in TOP_OFFENDERS.top(n)]
+    )
+
+
+async def shared_ips_endpoint(request: Request) -> Response:
+    """Return the '?n=' IPs used by the most users (at least '?min_users=')"""
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    try:
+        n = int_param(request, "n", 20)
+        min_users = int_param(request, "min_users", 2)
+    except ValueError as err:
+        return json_response({"error": str(err)}, 400)
+    return json_response(
+        [
+            {"ip": ip, "users": count, "usernames": DETECTOR.users_of(ip)}
+            for ip, count in DETECTOR.shared_ips.top(n)
+            if count >= min_users
+        ]
+    )
+
+
+async def events_endpoint(request: Request) -> Response | StreamResponse:
+    """
+    Stream the detection, disable and enable events as server-sent events,
+    from '?since=' (or the 'Last-Event-ID' header) if given
+    """
+    error = authorize(request, await read_config())
+    if error:
+        return error
+    since = request.query.get("since") or request.headers.get("last-event-id")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return json_response({"error": "'since' must be an event id"}, 400)
+    return StreamResponse(EVENTS.subscribe(since))
+
+
+async def run_api_server() -> None:
+    """
+    Serve the API on 'API_LISTEN' and the 'PORT' environment variable
+    (or 'API_PORT', 6284 by default) until cancelled.
+    """
+    config_data = await read_config()
+    server = get_http_server(
+        config_data.get("API_LISTEN", "0.0.0.0"),
+        int(os.environ.get("PORT", config_data.get("API_PORT", 6284))),
+    )
+    server.route("POST", "/login", login)
+    server.route("POST", "/update_special_limit", update_special_limit_endpoint)
+    server.route("POST", "/update_special_limits", update_special_limits_endpoint)
+    server.route("GET", "/special_limits", special_limits_endpoint)
+    server.route("GET", "/user_ips", user_ips_endpoint)
+    server.route("GET", "/ip_users", ip_users_endpoint)
+    server.route("GET", "/top_offenders", top_offenders_endpoint)
+    server.route("GET", "/shared_ips", shared_ips_endpoint)
+    server.route("GET", "/events", events_endpoint)
+    logger.info("Embedded API enabled")
+    await server.serve_forever()
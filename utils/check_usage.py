@@ -4,20 +4,56 @@ appears more than two times in the ACTIVE_USERS list.
 """
 
 import asyncio
-from collections import Counter
+import sqlite3
 
-from telegram_bot.send_message import send_logs
+from telegram_bot.send_message import NOTIFIER, send_logs, send_report_file, split_message
 from utils.logs import logger
-from utils.panel_api import disable_user
-from utils.panel_api import all_user
 from utils.read_config import read_config
 from utils.read_config import detect_user
 from utils.read_config import add_detected_user
 from utils.read_config import delete_detected_user
-from utils.read_config import get_detected_users
+from utils.read_config import flush_detected_users
+from utils.read_config import get_detected_user
+from utils.detector import DETECTOR
+from utils.enforcement import ENFORCEMENT
+from utils.evaluator import evaluate
+from utils.event_bus import EVENTS
+from utils.policy import get_policy
+from utils.report import build_report_file, save_last_report
+from utils.stream_interval import stream_stats_message
+from utils.top_offenders import top_users
 from utils.types import PanelType, UserType
+from utils.user_directory import USER_DIRECTORY
+from utils.webhook import WEBHOOK
 
 ACTIVE_USERS: dict[str, UserType] | dict = {}
+# Per node cache of the (raw email, raw ip) pairs already classified by the parser
+# in the current window: (user, ip) if it was accepted, None if it was rejected
+SEEN_ENTRIES: dict[int | None, dict[tuple, tuple[UserType, str] | None]] = {}
+# Per node [hits, misses] of SEEN_ENTRIES
+SEEN_STATS: dict[int | None, list[int]] = {}
+
+
+def seen_entries_hit_ratio() -> dict[int | None, float]:
+    """
+    Return the hit ratio of the parser cache of each node in the current window
+    """
+    return {
+        node_id: hits / (hits + misses)
+        for node_id, (hits, misses) in SEEN_STATS.items()
+        if hits + misses
+    }
+
+
+def reset_active_users() -> None:
+    """
+    Clear the active users and the parser cache that points to them
+    """
+    ACTIVE_USERS.clear()
+    # Clear in place, a running parser keeps a reference to its node cache
+    for entries in SEEN_ENTRIES.values():
+        entries.clear()
+    SEEN_STATS.clear()
 
 
 async def check_ip_used(panel_data: PanelType, owner: str = None) -> dict:
@@ -29,25 +65,26 @@ async def check_ip_used(panel_data: PanelType, owner: str = None) -> dict:
     config_data = await read_config()
     servers = config_data.get("SERVERS", [])
     
-    all_users_log = {}
-    all_users = [user.name for user in await all_user(panel_data)]
+    if owner:
+        # Loaded once, then refreshed in the background by 'USER_DIRECTORY.run'
+        await USER_DIRECTORY.ensure_ready(panel_data)
         
-    for email in list(ACTIVE_USERS.keys()):
+    active_users = {
+        email: data.ip
+        for email, data in ACTIVE_USERS.items()
+        if not owner or data.name in USER_DIRECTORY
+    }
+    all_users_log = evaluate(active_users, config_data)
+    for email, ips in all_users_log.items():
         data = ACTIVE_USERS[email]
-        if owner and data.name not in all_users:
-            continue
-        ip_counts = Counter(data.ip)
-        data.ip = list({ip for ip in data.ip if ip_counts[ip] > 2})
-        all_users_log[email] = data.ip
+        data.ip = ips
         logger.info(data)
     total_ips = sum(len(ips) for ips in all_users_log.values())
-    all_users_log = dict(
-        sorted(
-            all_users_log.items(),
-            key=lambda x: len(x[1]),
-            reverse=True,
-        )
-    )
+    for node_id, ratio in seen_entries_hit_ratio().items():
+        logger.info("Parser cache hit ratio of node %s: %.1f%%", node_id, ratio * 100)
+    stream_stats = stream_stats_message()
+    if stream_stats:
+        logger.info("Log stream stats:\n%s", stream_stats)
     
     # ساختن پیام اولیه که نشان می‌دهد از کدام سرورها چک شده
     if servers:
@@ -59,19 +96,41 @@ async def check_ip_used(panel_data: PanelType, owner: str = None) -> dict:
         logger.info("Checking IPs from all servers")
     
     messages = [header_message]
+    # Only the top offenders go inline, the full list is sent with '/full_report'.
+    # They are ranked by the IPs counted in this check, not by 'TOP_OFFENDERS'
+    # (the live window of the detector, without the IP_MIN_HITS rule)
+    save_last_report(all_users_log)
+    top_n = int(config_data.get("TOP_OFFENDERS", 20))
+    top = top_users(all_users_log, top_n if top_n > 0 else len(all_users_log))
     messages.extend([
         f"<code>{email}</code> with <code>{len(ips)}</code> active ip  \n- "
         + "\n- ".join(ips)
-        for email, ips in all_users_log.items()
-        if ips
+        for email, ips in top
     ])
+    report_mode = config_data.get("REPORT_MODE", "inline")
+    if users_with_ips > len(top):
+        messages.append(
+            f"... and {users_with_ips - len(top)} more users "
+            + ("(attached report)" if report_mode == "file" else "(/full_report)")
+        )
+    logger.info("Enforcement queue: %s", ENFORCEMENT.stats_message())
+    logger.info("Telegram notifier: %s", NOTIFIER.stats_message())
+    webhook_stats = WEBHOOK.stats_message()
+    if webhook_stats:
+        logger.info("Webhook stats:\n%s", webhook_stats)
     logger.info("Number of all active ips: %s", str(total_ips))
     messages.append(f"---------\nCount Of All Active IPs: <b>{total_ips}</b>")
-    shorter_messages = [
-        "\n".join(messages[i : i + 100]) for i in range(0, len(messages), 100)
-    ]
-    for message in shorter_messages:
-        await send_logs(message)
+    for message in split_message("\n".join(messages)):
+        await send_logs(message, category="report")
+    if report_mode == "file" and users_with_ips:
+        filename, document = await asyncio.to_thread(
+            build_report_file, all_users_log, config_data.get("REPORT_FORMAT", "txt")
+        )
+        await send_report_file(
+            document,
+            filename,
+            f"Full report: {users_with_ips} users, {total_ips} active ips",
+        )
     return all_users_log
 
 
@@ -88,39 +147,43 @@ async def check_users_usage(panel_data: PanelType):
     else:
         all_users_log = await check_ip_used(panel_data)
     
-    except_users = config_data.get("EXCEPT_USERS", [])
-    special_limit = config_data.get("SPECIAL_LIMIT", {})
-    limit_number = config_data["GENERAL_LIMIT"]
+    if config_data.get("EVENT_DETECTION", False):
+        # Violations are handled by the detector as soon as they happen
+        reset_active_users()
+        all_users_log.clear()
+        return
+
+    policy = await get_policy()
     out_of_limit_number = config_data["outOfLimitNumber"]
-    detected_users = await get_detected_users()
     
     for user_name, user_ip in all_users_log.items():
-        if user_name not in except_users:
-            # Determine user limit (general or special)
-            user_limit_entry = next((u for u in special_limit if u[0] == user_name), None)
-            if user_limit_entry:
-                user_limit_number = int(user_limit_entry[1])
-            else:
-                user_limit_number = limit_number
-            detected_user = next((u for u in detected_users if u["user"] == user_name), None)
+        if not policy.is_excepted(user_name):
+            user_limit_number = policy.limit_for(user_name)
+            detected_user = await get_detected_user(user_name)
             
             if detected_user is not None:
-                ips = list(detected_user["ips"])
+                ips = set(detected_user["ips"])
                 matching_ips_count = sum(1 for i in list(user_ip) if i in ips)
                 
                 if matching_ips_count > user_limit_number:
+                    out_of_limit_count = int(detected_user.get("outOfLimitCount", 0))
                     await detect_user(user_name, list(user_ip))
-                    if int(detected_user.get("outOfLimitCount", 0)) + 1 >= out_of_limit_number:
+                    if out_of_limit_count + 1 >= out_of_limit_number:
                         message = (
                             f"User {user_name} has {len(set(user_ip))}"
                             + f" active ips. {set(user_ip)}"
                         )
                         logger.warning(message)
-                        await send_logs(f"<b>Warning: </b>{message}")
-                        try:
-                            await disable_user(panel_data, UserType(name=user_name, ip=[]))
-                        except ValueError as error:
-                            logger.error(f"Error disabling user {user_name}: {error}")
+                        await send_logs(f"<b>Warning: </b>{message}", category="warning")
+                        EVENTS.publish(
+                            "detection",
+                            {
+                                "user": user_name,
+                                "ips": sorted(set(user_ip)),
+                                "limit": user_limit_number,
+                            },
+                        )
+                        await ENFORCEMENT.disable(user_name, reason=message)
                         await delete_detected_user(user_name)
                 else:
                     # User is no longer out of limit
@@ -130,10 +193,30 @@ async def check_users_usage(panel_data: PanelType):
                 if len(set(user_ip)) > user_limit_number:
                     await add_detected_user(user_name, list(user_ip))
     
-    ACTIVE_USERS.clear()
+    try:
+        await flush_detected_users()
+    except (OSError, sqlite3.Error) as error:
+        logger.error(f"Error saving detected users: {error}")
+    reset_active_users()
     all_users_log.clear()
 
 
+async def run_violation_handler(panel_data: PanelType) -> None:
+    """
+    Handle the violation events emitted by the detector
+    """
+    while True:
+        event = await DETECTOR.events.get()
+        message = (
+            f"User {event.user} has {len(event.ips)}"
+            + f" active ips. {set(event.ips)}"
+        )
+        logger.warning(message)
+        await send_logs(f"<b>Warning: </b>{message}", category="warning")
+        EVENTS.publish("detection", {"user": event.user, "ips": event.ips, "limit": event.limit})
+        await ENFORCEMENT.disable(event.user, reason=message)
+
+
 async def run_check_users_usage(panel_data: PanelType) -> None:
     """
     Run the user usage check function
@@ -0,0 +1,51 @@
+"""
+This module contains the location of the state the script writes
+(detected users, disabled users, pending enforcement actions, the webhook
+spool and the state database).
+
+Everything is kept in 'data/' next to 'logs/', docker-compose.yml mounts
+both so the state survives a recreated container.
+"""
+
+import glob
+import os
+import shutil
+
+from utils.logs import logger
+
+DATA_DIR = "data"
+# The state files older versions kept in the working directory
+LEGACY_STATE_FILES = (
+    "detected_users.json",
+    ".disable_users.json",
+    ".enforcement_queue.json",
+    ".webhook_spool.jsonl",
+    "state.db",
+)
+
+
+def data_path(filename: str) -> str:
+    """
+    Return the path of a state file in the data directory.
+    """
+    return os.path.join(DATA_DIR, filename)
+
+
+def prepare_data_dir() -> None:
+    """
+    Create the data directory and move the state files an older version
+    left in the working directory into it (with their journal, replay and
+    WAL files). A file that already exists in the data directory is kept.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    for filename in LEGACY_STATE_FILES:
+        if os.path.exists(data_path(filename)):
+            continue
+        for legacy in glob.glob(glob.escape(filename) + "*"):
+            if not os.path.isfile(legacy) or os.path.exists(data_path(legacy)):
+                continue
+            try:
+                shutil.move(legacy, data_path(legacy))
+                logger.info(f"Moved {legacy} to {DATA_DIR}/")
+            except OSError as error:
+                logger.error(f"Failed to move {legacy} to {DATA_DIR}/: {error}")
@@ -0,0 +1,220 @@
+"""
+This module contains the incremental detector that keeps the number of
+distinct IPs of each user up to date as the logs are parsed, and emits
+a violation event as soon as a user is confirmed over its limit.
+"""
+
+import asyncio
+import time
+
+from utils.logs import logger
+from utils.policy import POLICY, PolicyIndex, get_policy
+from utils.read_config import read_config
+from utils.top_offenders import TOP_OFFENDERS, TopOffenders
+from utils.types import ViolationEvent
+
+# Same rule as 'check_ip_used': an IP counts once it is seen more than this
+IP_MIN_HITS = 2
+
+
+class IncrementalDetector:
+    """
+    A class used to detect users over their IP limit as observations arrive.
+
+    Observations are always tracked, violation events are only emitted
+    when 'EVENT_DETECTION' is enabled.
+    """
+
+    def __init__(self):
+        # user -> ip -> [hits, last seen]
+        self.hits: dict[str, dict[str, list]] = {}
+        # user -> number of IPs seen more than IP_MIN_HITS times
+        self.distinct: dict[str, int] = {}
+        # ip -> users the IP counts for (the reverse index of 'hits')
+        self.ip_users: dict[str, set[str]] = {}
+        # IPs ranked by the number of users behind them
+        self.shared_ips = TopOffenders()
+        # users over their limit -> number of consecutive confirmations
+        self.over_limit: dict[str, int] = {}
+        # users that already got a violation event
+        self.reported: set[str] = set()
+        # version of the policy index the over-limit set was checked against
+        self.policy_version = None
+        self.events: asyncio.Queue[ViolationEvent] = asyncio.Queue()
+        # Updated every tick, observations don't need their own clock read
+        self.now = time.time()
+
+    def observe(self, user: str, ip: str) -> None:
+        """
+        Record that a user was seen with an IP.
+
+        Args:
+            user (str): The name of the user.
+            ip (str): The IP address.
+        """
+        ips = self.hits.get(user)
+        if ips is None:
+            ips = self.hits[user] = {}
+        entry = ips.get(ip)
+        if entry is None:
+            ips[ip] = [1, self.now]
+            return
+        entry[0] += 1
+        entry[1] = self.now
+        if entry[0] == IP_MIN_HITS + 1:
+            self.on_new_ip(user, ip)
+
+    def on_new_ip(self, user: str, ip: str) -> None:
+        """
+        Called when an IP of the user starts to count toward its limit.
+        """
+        users = self.ip_users.get(ip)
+        if users is None:
+            users = self.ip_users[ip] = set()
+        users.add(user)
+        self.shared_ips.update(ip, len(users))
+        count = self.distinct.get(user, 0) + 1
+        self.distinct[user] = count
+        TOP_OFFENDERS.update(user, count)
+        if user not in self.over_limit and count > self.policy_limit(user):
+            self.over_limit[user] = 0
+
+    def policy_limit(self, user: str) -> float:
+        """
+        Return the limit of the user, excepted users have no limit.
+        """
+        # The index is refreshed by the ticks, before the first one nobody is
+        # flagged here, 'recheck_limits' catches up on the first tick
+        if POLICY.config_data is None or POLICY.is_excepted(user):
+            return float("inf")
+        return POLICY.limit_for(user)
+
+    def expire_user(self, user: str, oldest: float) -> None:
+        """
+        Drop the IPs of the user that were not seen since 'oldest'.
+        """
+        ips = self.hits.get(user)
+        if not ips:
+            return
+        stale = [ip for ip, (_, last_seen) in ips.items() if last_seen < oldest]
+        for ip in stale:
+            if ips.pop(ip)[0] > IP_MIN_HITS:
+                self.distinct[user] -= 1
+                self.drop_ip_user(ip, user)
+        TOP_OFFENDERS.update(user, self.distinct.get(user, 0))
+        if not ips:
+            self.hits.pop(user, None)
+            self.distinct.pop(user, None)
+
+    def drop_ip_user(self, ip: str, user: str) -> None:
+        """
+        Remove a user from the reverse index of an IP.
+        """
+        users = self.ip_users.get(ip)
+        if users is None:
+            return
+        users.discard(user)
+        self.shared_ips.update(ip, len(users))
+        if not users:
+            del self.ip_users[ip]
+
+    def users_of(self, ip: str) -> list[str]:
+        """
+        Return the users an IP counts for.
+        """
+        return sorted(self.ip_users.get(ip, ()))
+
+    def active_ips(self, user: str) -> list[str]:
+        """
+        Return the IPs of the user that count toward its limit.
+        """
+        return [
+            ip for ip, (hits, _) in self.hits.get(user, {}).items() if hits > IP_MIN_HITS
+        ]
+
+    def recheck_limits(self, policy: PolicyIndex) -> None:
+        """
+        Flag the users already over their limit, called when the limits were
+        loaded or changed (a user is flagged by 'on_new_ip' otherwise).
+        """
+        for user, count in self.distinct.items():
+            if (
+                user not in self.over_limit
+                and not policy.is_excepted(user)
+                and count > policy.limit_for(user)
+            ):
+                self.over_limit[user] = 0
+        self.policy_version = policy.version
+
+    def sweep(self, oldest: float) -> None:
+        """
+        Expire the stale IPs of every user.
+        """
+        for user in list(self.hits):
+            self.expire_user(user, oldest)
+
+    async def tick(self, config_data: dict) -> None:
+        """
+        Confirm the users that are over their limit and emit the violation events.
+
+        Only the users over their limit are visited, every user is checked
+        again when the policy changed. A user leaves the over-limit
+        set (and its confirmations are reset) once its distinct IPs drop to
+        its limit minus 'DETECTION_HYSTERESIS'.
+        """
+        self.now = time.time()
+        window = int(config_data.get("DETECTION_WINDOW", config_data["CHECK_INTERVAL"]))
+        hysteresis = int(config_data.get("DETECTION_HYSTERESIS", 1))
+        out_of_limit_number = int(config_data["outOfLimitNumber"])
+        emit = bool(config_data.get("EVENT_DETECTION", False))
+        policy = await get_policy()
+        if policy.version != self.policy_version:
+            self.recheck_limits(policy)
+        for user in list(self.over_limit):
+            self.expire_user(user, self.now - window)
+            count = self.distinct.get(user, 0)
+            if policy.is_excepted(user):
+                self.over_limit.pop(user)
+                self.reported.discard(user)
+                continue
+            limit = policy.limit_for(user)
+            if count > limit:
+                self.over_limit[user] += 1
+                if (
+                    emit
+                    and user not in self.reported
+                    and self.over_limit[user] >= out_of_limit_number
+                ):
+                    self.reported.add(user)
+                    await self.events.put(
+                        ViolationEvent(
+                            user=user,
+                            ips=self.active_ips(user),
+                            limit=limit,
+                            detected_at=self.now,
+                        )
+                    )
+            elif count <= max(limit - hysteresis, 0):
+                self.over_limit.pop(user)
+                self.reported.discard(user)
+
+    async def run(self) -> None:
+        """
+        Run the detector ticks every 'DETECTION_TICK' seconds
+        and expire the stale IPs of all users once per window.
+        """
+        last_sweep = time.time()
+        while True:
+            config_data = await read_config()
+            window = int(config_data.get("DETECTION_WINDOW", config_data["CHECK_INTERVAL"]))
+            try:
+                await self.tick(config_data)
+                if self.now - last_sweep >= window:
+                    self.sweep(self.now - window)
+                    last_sweep = self.now
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Detector error: {error}")
+            await asyncio.sleep(int(config_data.get("DETECTION_TICK", 5)))
+
+
+DETECTOR = IncrementalDetector()
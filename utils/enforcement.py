@@ -0,0 +1,349 @@
+"""
+This module contains the enforcement queue that decouples the disable/enable
+decisions (usage check, detector, re-enable scheduler) from their execution
+on the panel.
+
+Pending actions are coalesced per user (the latest decision wins), executed
+by a pool of workers with retries and persisted so they survive a crash:
+appended to a journal ('data/.enforcement_queue.json.journal') that is compacted
+into 'data/.enforcement_queue.json' like the disabled users, or saved to the state
+database.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from dataclasses import asdict
+
+from telegram_bot.send_message import send_logs
+from utils.data_dir import data_path
+from utils.event_bus import EVENTS
+from utils.handel_dis_users import (
+    COMPACT_EVERY,
+    DISABLED_AT,
+    REENABLE_SCHEDULER,
+    DisabledUsers,
+)
+from utils.logs import logger
+from utils.panel_api import disable_user, enable_selected_users
+from utils.read_config import read_config, read_config_sync, write_json_atomic
+from utils.state_db import StateDB, get_state_db
+from utils.types import EnforcementAction, PanelType, UserType
+
+ENFORCEMENT_FILE = data_path(".enforcement_queue.json")
+DISABLE = "disable"
+ENABLE = "enable"
+# Smoothing factor of the average enqueue -> done latency
+LATENCY_ALPHA = 0.2
+
+
+class EnforcementQueue:
+    """
+    A class used to queue, coalesce, persist and execute the enforcement actions.
+    """
+
+    def __init__(self, filename: str = ENFORCEMENT_FILE):
+        self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self.journal_entries = 0
+        # username -> the latest pending action of the user
+        self.pending: dict[str, EnforcementAction] = {}
+        # usernames ready to be executed, a user is in here at most once
+        self.ready: asyncio.Queue[str] = asyncio.Queue()
+        self.queued: set[str] = set()
+        self.in_flight: set[str] = set()
+        self.loaded = False
+        self.load_lock = asyncio.Lock()
+        # Keeps the file and database writes in call order
+        self.io_lock = asyncio.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.retries = 0
+        self.avg_latency = 0.0
+
+    async def load(self) -> None:
+        """
+        Load the actions left by the previous run and queue them again.
+        """
+        # The callers that arrive while loading wait for it, in order
+        async with self.load_lock:
+            if self.loaded:
+                return
+            state_db = get_state_db(read_config_sync())
+            async with self.io_lock:
+                self.pending.update(await asyncio.to_thread(self.read_actions, state_db))
+            self.loaded = True
+        for username in self.pending:
+            self.wake(username)
+        if self.pending:
+            logger.info(f"Loaded {len(self.pending)} pending enforcement actions")
+
+    def read_actions(self, state_db: StateDB | None) -> dict[str, EnforcementAction]:
+        """
+        Read the saved actions from the state database, or from the JSON
+        snapshot and the journal (runs in a thread).
+        """
+        if state_db:
+            actions = state_db.get_enforcement_actions()
+        else:
+            actions = []
+            try:
+                if os.path.exists(self.filename):
+                    with open(self.filename, "r", encoding="utf-8") as file:
+                        actions = json.load(file).get("actions", [])
+            except (OSError, json.JSONDecodeError) as error:
+                logger.error(f"Failed to load {self.filename}: {error}")
+        pending = {}
+        for action in actions:
+            action = EnforcementAction(**action)
+            pending[action.user] = action
+        if not state_db:
+            journal_entries = self.replay_journal(pending)
+            if journal_entries:
+                # Start with an empty journal, a torn last line must not prefix the next entry
+                self.compact([asdict(action) for action in pending.values()])
+        return pending
+
+    def replay_journal(self, pending: dict[str, EnforcementAction]) -> int:
+        """
+        Apply the journal entries on top of the snapshot and return their number.
+        Entries are idempotent and a torn last line (crash during append) is ignored.
+        """
+        journal_entries = 0
+        if not os.path.exists(self.journal_filename):
+            return journal_entries
+        try:
+            with open(self.journal_filename, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping broken entry in {self.journal_filename}")
+                        continue
+                    if entry["op"] == "put":
+                        action = EnforcementAction(**entry["action"])
+                        pending[action.user] = action
+                    elif entry["op"] == "done":
+                        action = pending.get(entry["user"])
+                        if action is not None and action.enqueued_at == entry["enqueued_at"]:
+                            del pending[entry["user"]]
+                    journal_entries += 1
+        except OSError as error:
+            logger.error(f"Failed to load {self.journal_filename}: {error}")
+        return journal_entries
+
+    def compact(self, actions: list[dict]) -> None:
+        """
+        Write the pending actions to the JSON snapshot and truncate the journal.
+        """
+        write_json_atomic(self.filename, {"actions": actions})
+        with open(self.journal_filename, "w", encoding="utf-8"):
+            pass
+
+    async def persist(self, action: EnforcementAction, done: bool = False) -> None:
+        """
+        Save a change of the pending actions: one row operation with the state
+        database, one appended journal line otherwise (the snapshot is only
+        rewritten every 'COMPACT_EVERY' entries).
+
+        The writes run in a thread, one at a time and in call order.
+        """
+        state_db = get_state_db(read_config_sync())
+        snapshot = None
+        if not state_db:
+            self.journal_entries += 1
+            if self.journal_entries >= COMPACT_EVERY:
+                # Taken now, the changes made after it are appended after the compaction
+                snapshot = [asdict(pending) for pending in self.pending.values()]
+                self.journal_entries = 0
+        async with self.io_lock:
+            try:
+                await asyncio.to_thread(self.write_change, state_db, action, done, snapshot)
+            except (OSError, sqlite3.Error) as error:
+                logger.error(f"Failed to save the enforcement queue: {error}")
+
+    def write_change(
+        self,
+        state_db: StateDB | None,
+        action: EnforcementAction,
+        done: bool,
+        snapshot: list[dict] | None,
+    ) -> None:
+        """
+        Write one change to the state database or to the journal (runs in a thread).
+        """
+        if state_db:
+            if done:
+                state_db.remove_enforcement_action(action.user, action.enqueued_at)
+            else:
+                state_db.save_enforcement_action(asdict(action))
+            return
+        if done:
+            entry = {"op": "done", "user": action.user, "enqueued_at": action.enqueued_at}
+        else:
+            entry = {"op": "put", "action": asdict(action)}
+        with open(self.journal_filename, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+        if snapshot is not None:
+            self.compact(snapshot)
+
+    def wake(self, username: str) -> None:
+        """
+        Put a user in the ready queue unless it is already waiting or running.
+        """
+        if username in self.queued or username in self.in_flight:
+            return
+        self.queued.add(username)
+        self.ready.put_nowait(username)
+
+    async def enqueue(self, username: str, kind: str, reason: str = "") -> None:
+        """
+        Queue an action for a user, replacing the pending action of the user if any.
+
+        Args:
+            username (str): The name of the user.
+            kind (str): "disable" or "enable".
+            reason (str): Shown in the logs when the action is executed.
+        """
+        await self.load()
+        current = self.pending.get(username)
+        if current is not None and current.kind == kind:
+            return
+        action = EnforcementAction(
+            user=username, kind=kind, reason=reason, enqueued_at=time.time()
+        )
+        self.pending[username] = action
+        await self.persist(action)
+        self.wake(username)
+
+    async def disable(self, username: str, reason: str = "") -> None:
+        """Queue a disable action."""
+        await self.enqueue(username, DISABLE, reason)
+
+    async def enable(self, username: str, reason: str = "") -> None:
+        """Queue an enable action."""
+        await self.enqueue(username, ENABLE, reason)
+
+    def retry_later(self, action: EnforcementAction, delay: float) -> None:
+        """
+        Queue the action again after 'delay' seconds if it was not replaced meanwhile.
+        """
+
+        def retry() -> None:
+            if self.pending.get(action.user) is action:
+                self.wake(action.user)
+
+        asyncio.get_running_loop().call_later(delay, retry)
+
+    async def execute(self, panel_data: PanelType, action: EnforcementAction) -> None:
+        """
+        Run an action on the panel.
+        """
+        if action.kind == DISABLE:
+            await disable_user(panel_data, UserType(name=action.user, ip=[]))
+        else:
+            await enable_selected_users(panel_data, {action.user})
+            await DisabledUsers().remove_user(action.user)
+
+    async def worker(self, panel_data: PanelType) -> None:
+        """
+        Execute the ready actions one at a time.
+        """
+        while True:
+            username = await self.ready.get()
+            self.queued.discard(username)
+            action = self.pending.get(username)
+            if action is None:
+                continue
+            self.in_flight.add(username)
+            try:
+                await self.execute(panel_data, action)
+            except Exception as error:  # pylint: disable=broad-except
+                await self.on_failure(action, error)
+            else:
+                self.processed += 1
+                EVENTS.publish(action.kind, {"user": action.user, "reason": action.reason})
+                latency = time.time() - action.enqueued_at
+                self.avg_latency += LATENCY_ALPHA * (latency - self.avg_latency)
+                if self.pending.get(username) is action:
+                    del self.pending[username]
+                    await self.persist(action, done=True)
+            finally:
+                self.in_flight.discard(username)
+            if username in self.pending and self.pending[username] is not action:
+                # A newer decision arrived while this one was running
+                self.wake(username)
+
+    async def on_failure(self, action: EnforcementAction, error: Exception) -> None:
+        """
+        Retry a failed action with an exponential backoff, or drop it after
+        'ENFORCEMENT_MAX_ATTEMPTS' attempts.
+        """
+        config_data = await read_config()
+        max_attempts = int(config_data.get("ENFORCEMENT_MAX_ATTEMPTS", 5))
+        action.attempts += 1
+        if self.pending.get(action.user) is not action:
+            return
+        if action.attempts < max_attempts:
+            self.retries += 1
+            delay = min(2**action.attempts, 300)
+            logger.warning(
+                f"Failed to {action.kind} {action.user} (attempt {action.attempts}), "
+                + f"retrying in {delay} seconds: {error}"
+            )
+            await self.persist(action)
+            self.retry_later(action, delay)
+            return
+        self.failed += 1
+        del self.pending[action.user]
+        await self.persist(action, done=True)
+        message = f"Failed to {action.kind} {action.user} after {action.attempts} attempts: {error}"
+        logger.error(message)
+        await send_logs(message, category="enforcement_error")
+        if action.kind == ENABLE and action.user in DISABLED_AT:
+            # Give the user back to the scheduler instead of leaving it disabled
+            REENABLE_SCHEDULER.schedule(action.user, DISABLED_AT[action.user], time.time() + 60)
+
+    def stats(self) -> dict:
+        """
+        Return the queue depth, the age of the oldest pending action,
+        the average latency and the counters.
+        """
+        now = time.time()
+        oldest = min((action.enqueued_at for action in self.pending.values()), default=now)
+        return {
+            "depth": len(self.pending),
+            "in_flight": len(self.in_flight),
+            "oldest_age": now - oldest,
+            "avg_latency": self.avg_latency,
+            "processed": self.processed,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    def stats_message(self) -> str:
+        """
+        Return the queue metrics as a single line for the logs.
+        """
+        stats = self.stats()
+        return (
+            f"depth={stats['depth']} in_flight={stats['in_flight']} "
+            + f"oldest={stats['oldest_age']:.1f}s avg_latency={stats['avg_latency']:.2f}s "
+            + f"processed={stats['processed']} retries={stats['retries']} failed={stats['failed']}"
+        )
+
+    async def run(self, panel_data: PanelType) -> None:
+        """
+        Start 'ENFORCEMENT_WORKERS' workers.
+        """
+        await self.load()
+        config_data = await read_config()
+        workers = int(config_data.get("ENFORCEMENT_WORKERS", 4))
+        async with asyncio.TaskGroup() as tg:
+            for number in range(max(workers, 1)):
+                tg.create_task(self.worker(panel_data), name=f"enforcement_worker_{number}")
+
+
+ENFORCEMENT = EnforcementQueue()
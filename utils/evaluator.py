@@ -0,0 +1,112 @@
+"""
+This module contains the evaluation step of the usage check: for each user,
+keep the IPs seen more than 'min_hits' times.
+
+The NumPy evaluator ('EVALUATOR': "numpy") encodes the users and the IPs as
+integer ids in flat arrays and does the counting and filtering in a few
+vectorized passes. NumPy is optional ('pip install numpy'), without it
+the pure-Python evaluator is used. It is imported on the first check,
+not at startup.
+
+The pure-Python evaluator is the default and NumPy is only used when it is
+asked for: the NumPy one still builds the per-user lists of the result and
+'benchmarks/evaluator_bench.py' has it slower from 50k observations on
+(205.6 ms vs 188.5 ms at 50k, 1170.8 ms vs 1032.5 ms at 200k), it is only
+slightly faster at 10k.
+"""
+
+import importlib
+from collections import Counter
+from itertools import chain
+
+np = None
+NUMPY_LOADED = False
+
+# Same rule as before: an IP counts once it is seen more than this
+IP_MIN_HITS = 2
+
+
+def evaluate_python(
+    active_users: dict[str, list[str]], min_hits: int = IP_MIN_HITS
+) -> dict[str, list[str]]:
+    """
+    Return the IPs of each user seen more than 'min_hits' times.
+
+    Args:
+        active_users (dict[str, list[str]]): username -> every IP observation.
+        min_hits (int): The number of observations an IP needs to count.
+
+    Returns:
+        dict[str, list[str]]: username -> counted IPs.
+    """
+    users_log = {}
+    for user, ips in active_users.items():
+        ip_counts = Counter(ips)
+        users_log[user] = [ip for ip, count in ip_counts.items() if count > min_hits]
+    return users_log
+
+
+def evaluate_numpy(
+    active_users: dict[str, list[str]], min_hits: int = IP_MIN_HITS
+) -> dict[str, list[str]]:
+    """
+    Same as 'evaluate_python' with columnar NumPy arrays.
+
+    The IPs are dictionary-encoded to integer ids, every observation becomes
+    a (user id, ip id) pair packed in one int64, a single 'np.unique' gives
+    the hits of each pair and the pairs over the threshold are grouped
+    per user with 'np.bincount'.
+    """
+    users = list(active_users)
+    if not users:
+        return {}
+    lengths = np.fromiter(
+        map(len, active_users.values()), dtype=np.int64, count=len(users)
+    )
+    total = int(lengths.sum())
+    # dict.fromkeys / map keep the encoding loops in C
+    ip_values = list(dict.fromkeys(chain.from_iterable(active_users.values())))
+    ip_index = dict(zip(ip_values, range(len(ip_values))))
+    ip_ids = np.fromiter(
+        map(ip_index.__getitem__, chain.from_iterable(active_users.values())),
+        dtype=np.int64,
+        count=total,
+    )
+    user_ids = np.repeat(np.arange(len(users), dtype=np.int64), lengths)
+    unique_pairs, hits = np.unique(user_ids * len(ip_values) + ip_ids, return_counts=True)
+    # Sorted by pair, so the kept pairs are grouped by user
+    kept = unique_pairs[hits > min_hits]
+    kept_users = kept // len(ip_values)
+    kept_ips = list(map(ip_values.__getitem__, (kept % len(ip_values)).tolist()))
+    distinct = np.bincount(kept_users, minlength=len(users))
+    starts = np.concatenate(([0], np.cumsum(distinct))).tolist()
+    return {
+        user: kept_ips[starts[index] : starts[index + 1]] for index, user in enumerate(users)
+    }
+
+
+def load_numpy() -> bool:
+    """
+    Import NumPy on first use, returns False if it is not installed.
+    """
+    global np, NUMPY_LOADED  # pylint: disable=global-statement
+    if not NUMPY_LOADED:
+        NUMPY_LOADED = True
+        try:
+            np = importlib.import_module("numpy")
+        except ImportError:
+            np = None
+    return np is not None
+
+
+def evaluate(
+    active_users: dict[str, list[str]], config_data: dict, min_hits: int = IP_MIN_HITS
+) -> dict[str, list[str]]:
+    """
+    Run the evaluator selected by 'EVALUATOR' ("python" by default or "numpy").
+    Only "numpy" uses NumPy (when it is installed), any other value runs
+    the pure-Python evaluator.
+    """
+    if config_data.get("EVALUATOR", "python") == "numpy" and load_numpy():
+        return evaluate_numpy(active_users, min_hits)
+    return evaluate_python(active_users, min_hits)
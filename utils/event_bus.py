@@ -0,0 +1,101 @@
+"""
+This module contains the event bus of the '/events' stream (server-sent
+events): detections and executed disable/enable actions.
+
+Every event gets a sequence number and is serialized once into its SSE
+frame, which is kept in a ring buffer of 'EVENT_BUFFER_SIZE' events.
+Subscribers read the shared buffer at their own pace, so a client can
+resume after a reconnect from the last sequence number it received.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from itertools import islice
+
+from utils.read_config import read_config_sync
+
+EVENT_BUFFER_SIZE = 1000
+# A comment is sent when nothing happened for this many seconds
+KEEPALIVE_INTERVAL = 15
+
+
+class EventBus:
+    """
+    A class used to publish events to any number of subscribers.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        # (sequence number, SSE frame), sequence numbers are consecutive
+        self.buffer: deque[tuple[int, bytes]] | None = None
+        self.published = asyncio.Event()
+
+    def get_buffer(self) -> deque[tuple[int, bytes]]:
+        """
+        Return the ring buffer, it is created on first use.
+        """
+        if self.buffer is None:
+            size = int(read_config_sync().get("EVENT_BUFFER_SIZE", EVENT_BUFFER_SIZE))
+            self.buffer = deque(maxlen=max(size, 1))
+        return self.buffer
+
+    def publish(self, kind: str, data: dict) -> int:
+        """
+        Publish an event and wake the subscribers, returns its sequence number.
+        """
+        self.seq += 1
+        payload = json.dumps({"seq": self.seq, "type": kind, "time": time.time(), **data})
+        frame = f"id: {self.seq}\nevent: {kind}\ndata: {payload}\n\n".encode()
+        self.get_buffer().append((self.seq, frame))
+        published, self.published = self.published, asyncio.Event()
+        published.set()
+        return self.seq
+
+    def frames_after(self, seq: int) -> tuple[list[bytes], int | None]:
+        """
+        Return the frames of the events after 'seq', and the first missed
+        sequence number if some of them already left the buffer.
+        """
+        buffer = self.get_buffer()
+        if not buffer or seq >= buffer[-1][0]:
+            return [], None
+        first = buffer[0][0]
+        if seq + 1 < first:
+            return [frame for _, frame in buffer], seq + 1
+        return [frame for _, frame in islice(buffer, seq + 1 - first, None)], None
+
+    async def subscribe(self, since: int | None = None) -> AsyncIterator[bytes]:
+        """
+        Yield the SSE frames of the events after 'since' (only the new
+        events if None), then the new ones as they are published. A "gap"
+        event tells the client that some events left the buffer.
+        """
+        if since is None:
+            seq = self.seq
+        elif since > self.seq:
+            # The id comes from before a restart, send every event of this run
+            seq = 0
+        else:
+            seq = since
+        while True:
+            published = self.published
+            frames, missed = self.frames_after(seq)
+            if missed is not None:
+                payload = json.dumps({"from": missed, "to": self.get_buffer()[0][0] - 1})
+                frames.insert(0, f"event: gap\ndata: {payload}\n\n".encode())
+            if frames:
+                # Nothing was yielded yet, so no event was published since 'frames_after'
+                seq = self.seq
+                for frame in frames:
+                    yield frame
+                continue
+            try:
+                await asyncio.wait_for(published.wait(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+
+
+EVENTS = EventBus()
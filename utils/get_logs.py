@@ -3,26 +3,28 @@ This module contains functions to get logs from the panel and nodes.
 """
 
 import asyncio
-import random
 import ssl
 import sys
+import time
 from asyncio import Task
 from ssl import SSLError
 
-from utils.parse_logs import INVALID_IPS
+from utils.parse_logs import GEO_LOOKUP_SECONDS, INVALID_IPS
 
 try:
-    import websockets.client
+    import websockets.asyncio.client
 except ImportError:
     print(
         "Module 'websockets' is not installed use: 'pip install websockets' to install it"
     )
     sys.exit()
 from telegram_bot.send_message import send_logs
+from utils.log_ingest import PUSH_TIMEOUT, node_is_pushing
 from utils.logs import logger  # pylint: disable=ungrouped-imports
 from utils.panel_api import get_nodes, get_token
 from utils.parse_logs import parse_logs
 from utils.read_config import read_config
+from utils.stream_interval import next_interval, record_frame
 from utils.types import NodeType, PanelType
 
 TASKS = []
@@ -36,6 +38,7 @@ ssl_context.verify_mode = ssl.CERT_NONE
 async def get_nodes_logs(panel_data: PanelType, node: NodeType) -> None:
     """
     This function establishes a websocket connection to a specific node and retrieves logs.
+    Nothing is pulled while the node pushes its logs to the ingest listeners.
 
     Args:
         panel_data (PanelType): The credentials for the panel.
@@ -46,26 +49,44 @@ async def get_nodes_logs(panel_data: PanelType, node: NodeType) -> None:
     """
     for scheme in ["wss", "ws"]:
         while True:
-            interval = random.choice(("0.9", "1.3", "1.5", "1.7"))
+            if node_is_pushing(node.node_id):
+                await asyncio.sleep(PUSH_TIMEOUT)
+                continue
+            interval = await next_interval(node.node_id)
             get_panel_token = await get_token(panel_data)
             if isinstance(get_panel_token, ValueError):
                 raise get_panel_token
             token = get_panel_token.panel_token
             try:
                 url = f"{scheme}://{panel_data.panel_domain}/api/nodes/{node.node_id}/xray/logs?interval={interval}&token={token}"  # pylint: disable=line-too-long
-                async with websockets.client.connect(
+                async with websockets.asyncio.client.connect(
                     url,
                     ssl=ssl_context if scheme == "wss" else None,
                 ) as ws:
                     log_message = (
                         f"✓ Checking logs for server: {node.node_name} "
-                        + f"(ID: {node.node_id})"
+                        + f"(ID: {node.node_id}) [interval: {interval}s]"
+                    )
+                    await send_logs(
+                        log_message, category="node_connected", node=node.node_name
                     )
-                    await send_logs(log_message)
                     logger.info(log_message)
                     while True:
-                        new_log = await ws.recv()
-                        await parse_logs(str(new_log))
+                        new_log = await ws.recv(decode=False)
+                        if node_is_pushing(node.node_id):
+                            # The same lines arrive through the ingest listeners
+                            logger.info(
+                                f"Server {node.node_name} pushes its logs, stop pulling them"
+                            )
+                            break
+                        # Only the parsing counts, not the geolocation lookups
+                        geo_seconds = GEO_LOOKUP_SECONDS.get(node.node_id, 0.0)
+                        start = time.perf_counter()
+                        await parse_logs(new_log, node.node_id)
+                        parse_seconds = time.perf_counter() - start - (
+                            GEO_LOOKUP_SECONDS.get(node.node_id, 0.0) - geo_seconds
+                        )
+                        record_frame(node.node_id, len(new_log), parse_seconds)
             except SSLError:
                 break
             except Exception as error:  # pylint: disable=broad-except
@@ -75,7 +96,7 @@ async def get_nodes_logs(panel_data: PanelType, node: NodeType) -> None:
                     + f" [node ip: {node.node_ip}] [node message: {node.message}]"
                     + f" [Error Message: {error}] trying to connect 10 second later!"
                 )
-                await send_logs(log_message)
+                await send_logs(log_message, category="node_error", node=node.node_name)
                 logger.error(log_message)
                 await asyncio.sleep(10)
                 continue
@@ -99,7 +120,9 @@ async def handle_cancel(panel_data: PanelType, tasks: list[Task]) -> None:
         for task in tasks:
             if task.get_name() in deactivate_nodes:
                 log_message = f"Cancelling {task.get_name()}"
-                await send_logs(log_message)
+                await send_logs(
+                    log_message, category="node_cancelled", node=task.get_name()
+                )
                 logger.info(log_message)
                 deactivate_nodes.remove(task.get_name())
                 task.cancel()
@@ -178,7 +201,9 @@ async def check_and_add_new_nodes(panel_data: PanelType, tg: asyncio.TaskGroup)
                             f"Adding new server to check: {node.node_name} "
                             + f"(ID: {node.node_id}, IP: {node.node_ip})"
                         )
-                        await send_logs(log_message)
+                        await send_logs(
+                            log_message, category="node_added", node=node.node_name
+                        )
                         logger.info(log_message)
                         await create_node_task(panel_data, tg, node)
                     else:
@@ -3,67 +3,282 @@ This module contains the DisabledUsers class
 which provides methods for managing disabled users
 """
 
+import asyncio
+import heapq
 import json
 import os
+import time
+from collections.abc import Awaitable, Callable
 
+from utils.data_dir import data_path
 from utils.logs import logger
+from utils.read_config import read_config, read_config_sync, write_json_atomic
+from utils.state_db import get_state_db
 
+# The in-memory disabled users, this is the single authority once loaded
 DISABLED_USERS = set()
+# username -> time (unix timestamp) the user was disabled
+DISABLED_AT: dict[str, float] = {}
+# Rewrite the snapshot and truncate the journal after this many entries
+COMPACT_EVERY = 1000
 
 
 class DisabledUsers:
     """
     A class used to represent the Disabled Users.
+
+    Changes are appended to a journal ('<filename>.journal') and the snapshot
+    ('<filename>') is only rewritten on compaction. On startup the snapshot is
+    loaded and the journal is replayed once, all instances share the same state.
     """
 
-    def __init__(self, filename=".disable_users.json"):
+    loaded = False
+    journal_entries = 0
+    # Keeps the file and database writes of every instance in call order
+    io_lock = asyncio.Lock()
+
+    def __init__(self, filename=data_path(".disable_users.json")):
         self.filename = filename
-        self.disabled_users = self.load_disabled_users()
+        self.journal_filename = f"{filename}.journal"
+        self.state_db = get_state_db(read_config_sync())
+        if not DisabledUsers.loaded:
+            DISABLED_AT.update(self.load_disabled_users())
+            DISABLED_USERS.update(DISABLED_AT)
+            DisabledUsers.loaded = True
+            if DisabledUsers.journal_entries and not self.state_db:
+                # Start with an empty journal, a torn last line must not prefix the next entry
+                self.compact()
+                DisabledUsers.journal_entries = 0
+        self.disabled_users = DISABLED_USERS
 
-    def load_disabled_users(self):
+    def load_disabled_users(self) -> dict[str, float]:
         """
-        Loads the disabled users from the JSON file.
+        Loads the disabled users from the JSON snapshot and replays the journal
+        (or loads them from the state database).
         """
+        if self.state_db:
+            return self.state_db.get_disabled_users()
+        disabled_at = {}
         try:
             if os.path.exists(self.filename):
                 with open(self.filename, "r", encoding="utf-8") as file:
                     data = json.load(file)
-                    return set(data.get("disable_user", []))
-            else:
-                return set()
+                    timestamps = data.get("disabled_at", {})
+                    now = time.time()
+                    disabled_at = {
+                        user: float(timestamps.get(user, now))
+                        for user in data.get("disable_user", [])
+                    }
         except Exception as error:  # pylint: disable=broad-except
             logger.error(error)
             print("Check the error or delete the file :", error)
-            print("Delete the .disable_users.json file? (y/n)")
+            print(f"Delete the {self.filename} file? (y/n)")
             if input().lower() == "y":
                 print("Deleting ...")
-                logger.info("remove .disable_users.json file")
-                os.remove(".disable_users.json")
-            return set()
+                logger.info(f"remove {self.filename} file")
+                os.remove(self.filename)
+        self.replay_journal(disabled_at)
+        return disabled_at
+
+    def replay_journal(self, disabled_at: dict[str, float]) -> None:
+        """
+        Applies the journal entries on top of the snapshot.
+
+        Entries are idempotent, so replaying entries that are already
+        in the snapshot (crash during compaction) is safe. A torn last
+        line (crash during append) is ignored.
+        """
+        if not os.path.exists(self.journal_filename):
+            return
+        with open(self.journal_filename, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping broken entry in {self.journal_filename}")
+                    continue
+                if entry["op"] == "add":
+                    disabled_at[entry["user"]] = float(entry["at"])
+                elif entry["op"] == "remove":
+                    disabled_at.pop(entry["user"], None)
+                elif entry["op"] == "clear":
+                    disabled_at.clear()
+                DisabledUsers.journal_entries += 1
+
+    async def write(self, func: Callable, *args) -> None:
+        """
+        Runs a file or database write in a thread, one at a time and in call order.
+        """
+        async with DisabledUsers.io_lock:
+            await asyncio.to_thread(func, *args)
+
+    async def append_journal(self, entry: dict) -> None:
+        """
+        Appends an entry to the journal and compacts it when it gets too long.
+        """
+        DisabledUsers.journal_entries += 1
+        snapshot = None
+        if DisabledUsers.journal_entries >= COMPACT_EVERY:
+            # Taken now, the changes made after it are appended after the compaction
+            snapshot = self.snapshot()
+            DisabledUsers.journal_entries = 0
+        await self.write(self.write_entry, entry, snapshot)
+
+    def write_entry(self, entry: dict, snapshot: dict | None) -> None:
+        """
+        Appends an entry to the journal, then writes the snapshot if any.
+        """
+        with open(self.journal_filename, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+        if snapshot is not None:
+            self.compact(snapshot)
 
     async def save_disabled_users(self):
         """
-        Saves the disabled users to the JSON file.
+        Compacts the journal: saves the disabled users to the JSON snapshot
+        with an atomic write and truncates the journal.
+        """
+        DisabledUsers.journal_entries = 0
+        await self.write(self.compact, self.snapshot())
+
+    def snapshot(self) -> dict:
+        """
+        Returns the JSON snapshot of the disabled users.
         """
-        with open(self.filename, "w", encoding="utf-8") as file:
-            json.dump({"disable_user": list(self.disabled_users)}, file)
+        return {
+            "disable_user": list(DISABLED_USERS),
+            "disabled_at": {user: DISABLED_AT.get(user) for user in DISABLED_USERS},
+        }
+
+    def compact(self, snapshot: dict | None = None):
+        """
+        Writes the JSON snapshot and truncates the journal.
+        """
+        write_json_atomic(self.filename, self.snapshot() if snapshot is None else snapshot)
+        with open(self.journal_filename, "w", encoding="utf-8"):
+            pass
 
     async def add_user(self, username: str):
         """
         Adds a user to the set of disabled users
-        and saves the updated set to the JSON file.
+        and appends it to the journal.
         """
+        disabled_at = time.time()
         DISABLED_USERS.add(username)
-        self.disabled_users.add(username)
-        await self.save_disabled_users()
+        DISABLED_AT[username] = disabled_at
+        REENABLE_SCHEDULER.schedule(username, disabled_at)
+        if self.state_db:
+            await self.write(self.state_db.add_disabled_user, username, disabled_at)
+            return
+        await self.append_journal({"op": "add", "user": username, "at": disabled_at})
+
+    async def remove_user(self, username: str):
+        """
+        Removes a user from the set of disabled users
+        and appends it to the journal.
+        """
+        if username not in DISABLED_USERS:
+            return
+        DISABLED_USERS.discard(username)
+        DISABLED_AT.pop(username, None)
+        if self.state_db:
+            await self.write(self.state_db.remove_disabled_user, username)
+            return
+        await self.append_journal({"op": "remove", "user": username})
 
     async def read_and_clear_users(self):
         """
         Returns a list of disabled users, clears the set of disabled users
-        and saves the empty set to the JSON file.
+        and appends the clear to the journal.
         """
-        disabled_users = list(self.disabled_users)
-        self.disabled_users.clear()
+        disabled_users = set(DISABLED_USERS)
         DISABLED_USERS.clear()
-        await self.save_disabled_users()
-        return set(disabled_users)
+        DISABLED_AT.clear()
+        if self.state_db:
+            await self.write(self.state_db.clear_disabled_users)
+            return disabled_users
+        await self.append_journal({"op": "clear"})
+        return disabled_users
+
+
+class ReEnableScheduler:
+    """
+    A class used to re-enable each disabled user 'TIME_TO_ACTIVE_USERS'
+    seconds after it was disabled.
+
+    Deadlines are kept in a heap of (deadline, username, disabled_at). Entries
+    of users that were enabled or disabled again in the meantime are skipped
+    when they reach the top. The heap is rebuilt from DISABLED_AT on start,
+    so the schedule survives restarts.
+    """
+
+    def __init__(self):
+        self.heap: list[tuple[float, str, float]] = []
+        self.wakeup = asyncio.Event()
+
+    def schedule(self, username: str, disabled_at: float, deadline: float | None = None):
+        """
+        Adds a deadline for a disabled user.
+        """
+        if deadline is None:
+            ttl = int(read_config_sync().get("TIME_TO_ACTIVE_USERS", 0))
+            deadline = disabled_at + ttl
+        heapq.heappush(self.heap, (deadline, username, disabled_at))
+        self.wakeup.set()
+
+    def load(self):
+        """
+        Schedules every user in DISABLED_AT (overdue users are enabled first).
+        """
+        self.heap.clear()
+        for username, disabled_at in DISABLED_AT.items():
+            self.schedule(username, disabled_at)
+
+    def next_entry(self) -> tuple[float, str, float] | None:
+        """
+        Drops the stale entries and returns the next valid one.
+        """
+        while self.heap:
+            _, username, disabled_at = self.heap[0]
+            if DISABLED_AT.get(username) == disabled_at:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    async def wait(self, timeout: float | None) -> None:
+        """
+        Waits until the timeout or until a new deadline is scheduled.
+        """
+        self.wakeup.clear()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except TimeoutError:
+            pass
+
+    async def run(self, enable: Callable[[str], Awaitable[None]]):
+        """
+        Calls 'enable' for each user when its deadline is reached,
+        at most 'REENABLE_RATE' users per second.
+        """
+        self.load()
+        while True:
+            entry = self.next_entry()
+            if entry is None:
+                await self.wait(None)
+                continue
+            deadline, username, disabled_at = entry
+            delay = deadline - time.time()
+            if delay > 0:
+                await self.wait(delay)
+                continue
+            heapq.heappop(self.heap)
+            try:
+                await enable(username)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Failed to re-enable {username}, retrying in 60 seconds: {error}")
+                self.schedule(username, disabled_at, time.time() + 60)
+            config_data = await read_config()
+            await asyncio.sleep(1 / float(config_data.get("REENABLE_RATE", 2)))
+
+
+REENABLE_SCHEDULER = ReEnableScheduler()
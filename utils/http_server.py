@@ -0,0 +1,269 @@
+"""
+This module contains a minimal asyncio HTTP/1.1 server used inside the main
+process (Telegram webhook, embedded API). It only supports what those need:
+routing on method and path, bodies with 'Content-Length' and keep-alive.
+"""
+
+import asyncio
+import json
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+from utils.logs import logger
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+REASONS = {
+    200: "OK",
+    201: "Created",
+    204: "No Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+@dataclass
+class Request:
+    """
+    Represents an HTTP request.
+
+    Attributes:
+        method (str): The request method.
+        path (str): The path without the query string.
+        query (dict[str, str]): The query parameters (last value wins).
+        headers (dict[str, str]): The headers, names are lower case.
+        body (bytes): The request body.
+    """
+
+    method: str
+    path: str
+    query: dict[str, str] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    def json(self):
+        """Decode the body as JSON, raises ValueError if it is not valid."""
+        return json.loads(self.body or b"null")
+
+
+@dataclass
+class Response:
+    """
+    Represents an HTTP response.
+
+    Attributes:
+        status (int): The status code.
+        body (bytes): The response body.
+        content_type (str): The 'Content-Type' header.
+        headers (dict[str, str]): Extra headers.
+    """
+
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class StreamResponse:
+    """
+    Represents a streamed HTTP response (e.g. server-sent events), the
+    connection is closed when the body ends or the client goes away.
+
+    Attributes:
+        body (AsyncIterator[bytes]): The chunks to send.
+        content_type (str): The 'Content-Type' header.
+        headers (dict[str, str]): Extra headers.
+    """
+
+    body: AsyncIterator[bytes]
+    content_type: str = "text/event-stream"
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+def json_response(data, status: int = 200) -> Response:
+    """Return a JSON response."""
+    return Response(status, json.dumps(data).encode(), "application/json")
+
+
+Handler = Callable[[Request], Awaitable[Response | StreamResponse]]
+
+
+class HTTPServer:
+    """
+    A class used to serve the registered routes on one address.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.routes: dict[tuple[str, str], Handler] = {}
+        self.server: asyncio.Server | None = None
+        # number of running 'serve_forever' calls, the last one closes the server
+        self.users = 0
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        """
+        Register a handler for a method and a path.
+        """
+        self.routes[(method.upper(), path)] = handler
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Request | Response | None:
+        """
+        Read one request, returns None when the client closed the connection
+        or an error response if the request is invalid.
+        """
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            return Response(413, b"Headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return Response(400, b"Bad request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return Response(400, b"Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            return Response(413, b"Body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        return Request(method.upper(), url.path, query, headers, body)
+
+    async def dispatch(self, request: Request) -> Response | StreamResponse:
+        """
+        Call the handler of the request.
+        """
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(405, b"Method not allowed")
+            return Response(404, b"Not found")
+        try:
+            return await handler(request)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f"HTTP handler error on {request.path}: {error}")
+            return Response(500, b"Internal server error")
+
+    async def write_response(
+        self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool
+    ) -> None:
+        """
+        Write a response.
+        """
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+        await writer.drain()
+
+    async def write_stream(self, writer: asyncio.StreamWriter, response: StreamResponse) -> None:
+        """
+        Write a streamed response, each chunk is flushed as soon as it is produced.
+        """
+        headers = {
+            "Content-Type": response.content_type,
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+            **response.headers,
+        }
+        head = "HTTP/1.1 200 OK\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n")
+        await writer.drain()
+        try:
+            async for chunk in response.body:
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            await response.body.aclose()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serve the requests of one connection.
+        """
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                if isinstance(request, Response):
+                    await self.write_response(writer, request, False)
+                    break
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                response = await self.dispatch(request)
+                if isinstance(response, StreamResponse):
+                    await self.write_stream(writer, response)
+                    break
+                await self.write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # the client went away or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        """
+        Start listening, does nothing if the server is already running.
+        """
+        if self.server is None:
+            self.server = await asyncio.start_server(
+                self.handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE
+            )
+            logger.info(f"HTTP server listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        """
+        Start the server and serve until cancelled, several features
+        can call it on the same server.
+        """
+        await self.start()
+        self.users += 1
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.users -= 1
+            if not self.users and self.server is not None:
+                self.server.close()
+                self.server = None
+
+
+# (host, port) -> server, features listening on the same address share a server
+HTTP_SERVERS: dict[tuple[str, int], HTTPServer] = {}
+
+
+def get_http_server(host: str, port: int) -> HTTPServer:
+    """
+    Return the server of an address, it is created on first use.
+    """
+    server = HTTP_SERVERS.get((host, int(port)))
+    if server is None:
+        server = HTTP_SERVERS[(host, int(port))] = HTTPServer(host, int(port))
+    return server
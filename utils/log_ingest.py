@@ -0,0 +1,260 @@
+"""
+This module contains the UDP (syslog) and TCP (newline-delimited) listeners
+that accept xray logs pushed by the nodes instead of pulling them from the panel.
+
+A line is only accepted from the address of a node. The syslog hostname only
+selects the node when the line comes from 'SYSLOG_ALLOWED_SOURCES' (e.g. a
+log relay) or when 'SYSLOG_TRUST_HOSTNAME' is set, anyone who can reach the
+port could forge it otherwise.
+
+A node that pushes its logs is not pulled over the websocket as well
+(see 'node_is_pushing'), its lines would be counted twice.
+"""
+
+import asyncio
+import re
+import time
+
+from utils.logs import logger
+from utils.panel_api import get_nodes
+from utils.parse_logs import INVALID_IPS, parse_logs
+from utils.read_config import read_config
+from utils.types import NodeType, PanelType
+
+# node ip -> node, only contains the nodes allowed by 'SERVERS'
+INGEST_NODES: dict[str, NodeType] = {}
+# node name -> node, used for the lines of trusted sources that aren't nodes
+INGEST_NODES_BY_NAME: dict[str, NodeType] = {}
+# 'SYSLOG_ALLOWED_SOURCES': addresses that may send the lines of any node
+INGEST_ALLOWED_SOURCES: set[str] = set()
+# 'SYSLOG_TRUST_HOSTNAME': accept the syslog hostname from any source
+INGEST_TRUST_HOSTNAME = False
+# node name -> number of received lines ("unknown" for unmatched sources)
+INGEST_STATS: dict[str, int] = {}
+# node id -> time (monotonic) the node last pushed lines
+INGEST_LAST_PUSH: dict[int, float] = {}
+# A node is considered pushing for this many seconds after its last line
+PUSH_TIMEOUT = 60
+INGEST_QUEUE: asyncio.Queue = asyncio.Queue(maxsize=10_000)
+INGEST_BATCH_SIZE = 512
+# A TCP client is disconnected when it sends this many bytes without a newline
+MAX_LINE_SIZE = 64 * 1024
+
+SYSLOG_PRI_REGEX = re.compile(rb"^<\d{1,3}>")
+XRAY_TIMESTAMP_REGEX = re.compile(rb"\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}")
+MONTHS = {
+    b"Jan", b"Feb", b"Mar", b"Apr", b"May", b"Jun",
+    b"Jul", b"Aug", b"Sep", b"Oct", b"Nov", b"Dec",
+}
+
+
+def split_syslog_line(line: bytes) -> tuple[str | None, bytes]:
+    """
+    Split a pushed log line into the syslog hostname and the xray log message.
+
+    Supports RFC 3164 (``<PRI>Mmm dd hh:mm:ss HOST TAG: MSG``),
+    RFC 5424 (``<PRI>1 TIMESTAMP HOST APP ...``) and plain xray lines.
+
+    Args:
+        line (bytes): The raw line received from a node.
+
+    Returns:
+        tuple[str | None, bytes]: The hostname (None if there is no syslog header)
+        and the xray log message.
+    """
+    pri_match = SYSLOG_PRI_REGEX.match(line)
+    if not pri_match:
+        return None, line
+    header = line[pri_match.end() :]
+    tokens = header.split(maxsplit=4)
+    hostname = None
+    if len(tokens) >= 3 and tokens[0] == b"1":
+        hostname = tokens[2].decode("utf-8", "replace")
+    elif len(tokens) >= 4 and tokens[0] in MONTHS:
+        hostname = tokens[3].decode("utf-8", "replace")
+    # The header may contain an IP (e.g. as hostname) so cut it before parsing
+    message_match = XRAY_TIMESTAMP_REGEX.search(header)
+    message = header[message_match.start() :] if message_match else header
+    return hostname, message
+
+
+def resolve_node(peer_host: str | None, hostname: str | None) -> NodeType | None:
+    """
+    Find the node that sent a log line, by its source address, or by its syslog
+    hostname if the source is allowed to send the lines of other nodes.
+
+    Args:
+        peer_host (str | None): The source IP address of the connection or datagram.
+        hostname (str | None): The hostname from the syslog header.
+
+    Returns:
+        NodeType | None: The matching node or None if it is unknown or filtered out.
+    """
+    if peer_host and peer_host in INGEST_NODES:
+        return INGEST_NODES[peer_host]
+    if hostname and (INGEST_TRUST_HOSTNAME or peer_host in INGEST_ALLOWED_SOURCES):
+        return INGEST_NODES_BY_NAME.get(hostname)
+    return None
+
+
+def node_is_pushing(node_id: int) -> bool:
+    """
+    Return True if the node pushed lines in the last 'PUSH_TIMEOUT' seconds.
+    """
+    last_push = INGEST_LAST_PUSH.get(node_id)
+    return last_push is not None and time.monotonic() - last_push < PUSH_TIMEOUT
+
+
+def enqueue_lines(peer_host: str | None, lines: list[bytes]) -> None:
+    """
+    Tag the received lines with their node and push them to the ingest queue.
+
+    Lines from unknown nodes (or nodes that are not in 'SERVERS') are dropped.
+    """
+    batches: dict[int, tuple[NodeType, list[bytes]]] = {}
+    unknown = 0
+    for line in lines:
+        if not line:
+            continue
+        hostname, message = split_syslog_line(line)
+        node = resolve_node(peer_host, hostname)
+        if node is None:
+            unknown += 1
+            continue
+        batches.setdefault(node.node_id, (node, []))[1].append(message)
+    if unknown:
+        INGEST_STATS["unknown"] = INGEST_STATS.get("unknown", 0) + unknown
+    now = time.monotonic()
+    for node, messages in batches.values():
+        INGEST_LAST_PUSH[node.node_id] = now
+        INGEST_STATS[node.node_name] = INGEST_STATS.get(node.node_name, 0) + len(messages)
+        try:
+            INGEST_QUEUE.put_nowait((node, messages))
+        except asyncio.QueueFull:
+            INGEST_STATS["dropped"] = INGEST_STATS.get("dropped", 0) + len(messages)
+
+
+class SyslogUDPProtocol(asyncio.DatagramProtocol):
+    """
+    Receive syslog datagrams, each datagram may contain one or more lines.
+    """
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        enqueue_lines(addr[0], data.splitlines())
+
+    def error_received(self, exc: Exception) -> None:
+        logger.error(f"Syslog UDP listener error: {exc}")
+
+
+class LogTCPProtocol(asyncio.Protocol):
+    """
+    Receive newline-delimited (optionally syslog formatted) logs over TCP.
+    The connection is closed if a line is longer than 'MAX_LINE_SIZE'.
+    """
+
+    def __init__(self):
+        self.peer_host = None
+        self.transport: asyncio.BaseTransport | None = None
+        self.buffer = b""
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        peer = transport.get_extra_info("peername")
+        self.peer_host = peer[0] if peer else None
+        logger.info(f"Log ingest TCP connection from {self.peer_host}")
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        end = self.buffer.rfind(b"\n")
+        if end != -1:
+            chunk, self.buffer = self.buffer[: end + 1], self.buffer[end + 1 :]
+            enqueue_lines(self.peer_host, chunk.splitlines())
+        if len(self.buffer) > MAX_LINE_SIZE:
+            logger.warning(
+                f"Log ingest TCP connection from {self.peer_host} sent a line "
+                + f"longer than {MAX_LINE_SIZE} bytes, closing it"
+            )
+            self.buffer = b""
+            self.transport.close()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if self.buffer:
+            enqueue_lines(self.peer_host, self.buffer.splitlines())
+            self.buffer = b""
+        logger.info(f"Log ingest TCP connection from {self.peer_host} closed")
+
+
+async def refresh_ingest_nodes(panel_data: PanelType) -> None:
+    """
+    Keep the node lookup tables of the listeners in sync with the panel,
+    'SERVERS', 'SYSLOG_ALLOWED_SOURCES' and 'SYSLOG_TRUST_HOSTNAME'.
+    """
+    global INGEST_TRUST_HOSTNAME  # pylint: disable=global-statement
+    while True:
+        try:
+            nodes_list = await get_nodes(panel_data)
+        except ValueError as error:
+            logger.error(f"Log ingest could not refresh nodes: {error}")
+            nodes_list = None
+        if nodes_list and not isinstance(nodes_list, ValueError):
+            config_data = await read_config()
+            servers = config_data.get("SERVERS", [])
+            nodes, nodes_by_name = {}, {}
+            for node in nodes_list:
+                if servers and node.node_name not in servers:
+                    continue
+                INVALID_IPS.add(node.node_ip)
+                nodes[node.node_ip] = node
+                nodes_by_name[node.node_name] = node
+            INGEST_NODES.clear()
+            INGEST_NODES.update(nodes)
+            INGEST_NODES_BY_NAME.clear()
+            INGEST_NODES_BY_NAME.update(nodes_by_name)
+            INGEST_ALLOWED_SOURCES.clear()
+            INGEST_ALLOWED_SOURCES.update(config_data.get("SYSLOG_ALLOWED_SOURCES", []))
+            INGEST_TRUST_HOSTNAME = bool(config_data.get("SYSLOG_TRUST_HOSTNAME", False))
+        await asyncio.sleep(25)
+
+
+async def consume_ingest_queue() -> None:
+    """
+    Read the queued lines in batches and feed them to the parser.
+    """
+    while True:
+        batches = [await INGEST_QUEUE.get()]
+        lines = len(batches[0][1])
+        while lines < INGEST_BATCH_SIZE and not INGEST_QUEUE.empty():
+            batch = INGEST_QUEUE.get_nowait()
+            batches.append(batch)
+            lines += len(batch[1])
+        grouped: dict[int, list[bytes]] = {}
+        for node, messages in batches:
+            grouped.setdefault(node.node_id, []).extend(messages)
+        for node_id, messages in grouped.items():
+            try:
+                await parse_logs(b"\n".join(messages), node_id)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Failed to parse pushed logs: {error}")
+
+
+async def run_log_ingest(panel_data: PanelType) -> None:
+    """
+    Start the UDP and TCP listeners configured with 'SYSLOG_UDP_PORT' and 'SYSLOG_TCP_PORT'.
+    """
+    config_data = await read_config()
+    listen = config_data.get("SYSLOG_LISTEN", "127.0.0.1")
+    udp_port = config_data.get("SYSLOG_UDP_PORT")
+    tcp_port = config_data.get("SYSLOG_TCP_PORT")
+    loop = asyncio.get_running_loop()
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(refresh_ingest_nodes(panel_data), name="ingest_nodes")
+        tg.create_task(consume_ingest_queue(), name="ingest_consumer")
+        if udp_port:
+            await loop.create_datagram_endpoint(
+                SyslogUDPProtocol, local_addr=(listen, int(udp_port))
+            )
+            logger.info(f"Listening for syslog logs on udp://{listen}:{udp_port}")
+        if tcp_port:
+            server = await loop.create_server(LogTCPProtocol, listen, int(tcp_port))
+            tg.create_task(server.serve_forever(), name="ingest_tcp")
+            logger.info(f"Listening for logs on tcp://{listen}:{tcp_port}")
@@ -0,0 +1,75 @@
+"""
+This module contains the in-process node cache. Every successful 'get_nodes'
+call updates it and a background task keeps it fresh, so the bot can show
+the nodes without logging in to the panel on every button tap.
+"""
+
+import asyncio
+import time
+
+from utils.logs import logger
+from utils.read_config import read_config
+from utils.types import NodeType, PanelType
+
+
+class NodeCache:
+    """
+    A class used to keep the last node list of the panel.
+    """
+
+    def __init__(self):
+        self.nodes: list[NodeType] = []
+        self.updated_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def update(self, nodes: list[NodeType]) -> None:
+        """
+        Replace the cached nodes (called by 'get_nodes').
+        """
+        self.nodes = list(nodes)
+        self.updated_at = time.time()
+
+    def age(self) -> float:
+        """
+        Return the seconds since the last update.
+        """
+        return time.time() - self.updated_at
+
+    async def refresh(self, panel_data: PanelType) -> list[NodeType]:
+        """
+        Fetch the nodes from the panel, concurrent callers share one request.
+        """
+        updated_at = self.updated_at
+        async with self.lock:
+            if self.updated_at != updated_at:
+                return self.nodes
+            # Imported here to handel 'circular import' error
+            from utils.panel_api import get_nodes  # pylint: disable=import-outside-toplevel
+
+            await get_nodes(panel_data)
+        return self.nodes
+
+    async def get(self, panel_data: PanelType) -> list[NodeType]:
+        """
+        Return the cached nodes, they are only fetched if the cache was never filled.
+        """
+        if not self.updated_at:
+            await self.refresh(panel_data)
+        return self.nodes
+
+    async def run(self, panel_data: PanelType) -> None:
+        """
+        Refresh the nodes when they are older than 'NODE_CACHE_REFRESH' seconds.
+        """
+        while True:
+            config_data = await read_config()
+            interval = int(config_data.get("NODE_CACHE_REFRESH", 60))
+            if self.age() >= interval:
+                try:
+                    await self.refresh(panel_data)
+                except ValueError as error:
+                    logger.error(f"Failed to refresh the node cache: {error}")
+            await asyncio.sleep(max(interval - self.age(), 1))
+
+
+NODE_CACHE = NodeCache()
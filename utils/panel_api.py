@@ -5,6 +5,8 @@ This module contains functions to interact with the panel API
 import asyncio
 import random
 import sys
+from collections import deque
+from collections.abc import AsyncIterator
 from ssl import SSLError
 
 try:
@@ -14,10 +16,12 @@ except ImportError:
     sys.exit()
 from telegram_bot.send_message import send_logs
 
-from utils.handel_dis_users import DISABLED_USERS, DisabledUsers
+from utils.handel_dis_users import REENABLE_SCHEDULER, DisabledUsers
 from utils.logs import logger
+from utils.node_cache import NODE_CACHE
 from utils.read_config import read_config
 from utils.types import NodeType, PanelType, UserType
+from utils.webhook import WEBHOOK
 
 # Use tuple instead of list for schemes (better for performance)
 SCHEMES = ("https", "http")
@@ -53,7 +57,7 @@ async def get_token(panel_data: PanelType) -> PanelType | ValueError:
                 return panel_data
             except httpx.HTTPStatusError:
                 message = f"[{response.status_code}] {response.text}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
             except SSLError:
@@ -62,7 +66,7 @@ async def get_token(panel_data: PanelType) -> PanelType | ValueError:
                 if scheme == "https":
                     continue
                 message = f"Unexpected error: {error}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
         
@@ -73,7 +77,7 @@ async def get_token(panel_data: PanelType) -> PanelType | ValueError:
         "Failed to get token after 20 attempts. Make sure the panel is running "
         "and the username and password are correct."
     )
-    await send_logs(message)
+    await send_logs(message, category="panel_error")
     logger.error(message)
     raise ValueError(message)
 
@@ -82,6 +86,8 @@ async def all_user(panel_data: PanelType) -> list[UserType] | ValueError:
     """
     Get the list of all users from the panel API
 
+    Prefer 'iter_users' when the users can be processed page by page.
+
     Args:
         panel_data (PanelType): PanelType object containing panel information
 
@@ -95,50 +101,123 @@ async def all_user(panel_data: PanelType) -> list[UserType] | ValueError:
         get_panel_token = await get_token(panel_data)
         if isinstance(get_panel_token, ValueError):
             raise get_panel_token
-        
-        token = get_panel_token.panel_token
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        config_data = await read_config()
-        owner = config_data.get("OWNER_USERNAME", None)
-        
-        for scheme in SCHEMES:
-            # Determine URL based on owner existence
-            if owner is not None:
-                url = f"{scheme}://{panel_data.panel_domain}/api/users?owner_username={owner}"
-            else:
-                url = f"{scheme}://{panel_data.panel_domain}/api/users"
-            
-            try:
-                async with httpx.AsyncClient(verify=False) as client:
-                    response = await client.get(url, headers=headers, timeout=10)
-                    response.raise_for_status()
-                user_inform = response.json()
-                return [UserType(name=user["username"]) for user in user_inform["items"]]
-            except SSLError:
-                continue
-            except httpx.HTTPStatusError:
-                message = f"[{response.status_code}] {response.text}"
-                await send_logs(message)
-                logger.error(message)
-                continue
-            except Exception as error:  # pylint: disable=broad-except
-                if scheme == "https":
-                    continue
-                message = f"Unexpected error: {error}"
-                await send_logs(message)
-                logger.error(message)
-                continue
+        try:
+            users = []
+            async for page in iter_users(panel_data):
+                users.extend(page)
+            return users
+        except ValueError as error:
+            await send_logs(str(error), category="panel_error")
         
         if attempt < 19:
             await asyncio.sleep(random.randint(2, 5) * (attempt + 1))
     
     message = "Failed to get users after 20 attempts. Make sure the panel is running."
-    await send_logs(message)
+    await send_logs(message, category="panel_error")
     logger.error(message)
     raise ValueError(message)
 
 
+async def get_users_page(
+    panel_data: PanelType, page: int, size: int, owner: str | None = None
+) -> dict:
+    """
+    Get one page of users from the panel API
+
+    Args:
+        panel_data (PanelType): PanelType object containing panel information
+        page (int): The page number (starts at 1)
+        size (int): The number of users per page
+        owner (str | None): Only return the users of this admin
+
+    Returns:
+        dict: The page, with the users in "items" and the number of pages in "pages"
+
+    Raises:
+        ValueError: If failed to get the page on both the HTTP and HTTPS endpoints
+    """
+    get_panel_token = await get_token(panel_data)
+    if isinstance(get_panel_token, ValueError):
+        raise get_panel_token
+    headers = {"Authorization": f"Bearer {get_panel_token.panel_token}"}
+    params = {"page": page, "size": size}
+    if owner is not None:
+        params["owner_username"] = owner
+    error_message = ""
+    for scheme in SCHEMES:
+        url = f"{scheme}://{panel_data.panel_domain}/api/users"
+        try:
+            async with httpx.AsyncClient(verify=False) as client:
+                response = await client.get(url, headers=headers, params=params, timeout=10)
+                response.raise_for_status()
+            return response.json()
+        except SSLError:
+            continue
+        except httpx.HTTPStatusError:
+            error_message = f"[{response.status_code}] {response.text}"
+            continue
+        except Exception as error:  # pylint: disable=broad-except
+            error_message = f"Unexpected error: {error}"
+            continue
+    message = f"Failed to get page {page} of users. {error_message}"
+    logger.error(message)
+    raise ValueError(message)
+
+
+async def iter_users(
+    panel_data: PanelType, page_size: int | None = None, concurrency: int | None = None
+) -> AsyncIterator[list[UserType]]:
+    """
+    Get the users from the panel API page by page
+    (only the users of 'OWNER_USERNAME' if it is set)
+
+    The first page gives the number of pages, then up to 'concurrency'
+    pages are requested at the same time and yielded in order.
+
+    Args:
+        panel_data (PanelType): PanelType object containing panel information
+        page_size (int | None): Users per page, default 'USERS_PAGE_SIZE' (100)
+        concurrency (int | None): Pages requested at the same time,
+        default 'USERS_PAGE_CONCURRENCY' (3)
+
+    Yields:
+        list[UserType]: The users of each page
+
+    Raises:
+        ValueError: If failed to get a page
+    """
+    config_data = await read_config()
+    owner = config_data.get("OWNER_USERNAME", None)
+    size = page_size or int(config_data.get("USERS_PAGE_SIZE", 100))
+    concurrency = concurrency or int(config_data.get("USERS_PAGE_CONCURRENCY", 3))
+    data = await get_users_page(panel_data, 1, size, owner)
+    items = data.get("items", [])
+    yield [UserType(name=user["username"]) for user in items]
+    pages = data.get("pages")
+    if pages is None:
+        # The panel didn't return the number of pages, read until a short page
+        page = 1
+        while len(items) == size:
+            page += 1
+            items = (await get_users_page(panel_data, page, size, owner)).get("items", [])
+            yield [UserType(name=user["username"]) for user in items]
+        return
+    next_page = 2
+    in_flight: deque[asyncio.Task] = deque()
+    try:
+        while next_page <= pages or in_flight:
+            while next_page <= pages and len(in_flight) < concurrency:
+                in_flight.append(
+                    asyncio.create_task(get_users_page(panel_data, next_page, size, owner))
+                )
+                next_page += 1
+            items = (await in_flight.popleft()).get("items", [])
+            yield [UserType(name=user["username"]) for user in items]
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
 async def enable_all_user(panel_data: PanelType) -> None | ValueError:
     """
     Enable all users on the panel.
@@ -161,36 +240,34 @@ async def enable_all_user(panel_data: PanelType) -> None | ValueError:
     headers = {
         "Authorization": f"Bearer {token}",
     }
-    users = await all_user(panel_data)
-    if isinstance(users, ValueError):
-        raise users
-    for username in users:
-        for scheme in ["https","http"]:  # add this later: save what scheme is used
-            url = f"{scheme}://{panel_data.panel_domain}/api/users/{username.name}/enable"
-            status = {}
-            try:
-                async with httpx.AsyncClient(verify=False) as client:
-                    response = await client.post(
-                        url, json=status, headers=headers, timeout=5
-                    )
-                    response.raise_for_status()
-                message = f"Enabled user: {username.name}"
-                await send_logs(message)
-                logger.info(message)
-                break
-            except SSLError:
-                continue
-            except httpx.HTTPStatusError:
-                message = f"[{response.status_code}] {response.text}"
-                await send_logs(message)
-                logger.error(message)
-                continue
-            except Exception as error:  # pylint: disable=broad-except
-                if scheme == "https":
+    async for users in iter_users(panel_data):
+        for username in users:
+            for scheme in ["https","http"]:  # add this later: save what scheme is used
+                url = f"{scheme}://{panel_data.panel_domain}/api/users/{username.name}/enable"
+                status = {}
+                try:
+                    async with httpx.AsyncClient(verify=False) as client:
+                        response = await client.post(
+                            url, json=status, headers=headers, timeout=5
+                        )
+                        response.raise_for_status()
+                    message = f"Enabled user: {username.name}"
+                    await send_logs(message, category="enabled")
+                    logger.info(message)
+                    break
+                except SSLError:
                     continue
-                message = f"An unexpected error occurred: {error}"
-                await send_logs(message)
-                logger.error(message)
+                except httpx.HTTPStatusError:
+                    message = f"[{response.status_code}] {response.text}"
+                    await send_logs(message, category="panel_error")
+                    logger.error(message)
+                    continue
+                except Exception as error:  # pylint: disable=broad-except
+                    if scheme == "https":
+                        continue
+                    message = f"An unexpected error occurred: {error}"
+                    await send_logs(message, category="panel_error")
+                    logger.error(message)
     logger.info("Enabled all users")
 
 
@@ -232,12 +309,8 @@ async def enable_selected_users(
                         )
                         response.raise_for_status()
                     message = f"Enabled user: {username}"
-                    await send_logs(message)
-                    config_data = await read_config()
-                    webhook_url = config_data.get("WEBHOOK_URL", "")
-                    if webhook_url:
-                        async with httpx.AsyncClient() as client:
-                            await client.post(webhook_url, json={"username": username, "status": "enabled"})
+                    await send_logs(message, category="enabled")
+                    WEBHOOK.notify(username, "enabled")
                     logger.info(message)
                     success = True
                     break
@@ -248,14 +321,14 @@ async def enable_selected_users(
                         success = True
                         break
                     message = f"[{response.status_code}] {response.text}"
-                    await send_logs(message)
+                    await send_logs(message, category="panel_error")
                     logger.error(message)
                     continue
                 except Exception as error:  # pylint: disable=broad-except
                     if scheme == "https":
                         continue
                     message = f"An unexpected error occurred: {error}"
-                    await send_logs(message)
+                    await send_logs(message, category="panel_error")
                     logger.error(message)
                     continue
             if success:
@@ -266,7 +339,7 @@ async def enable_selected_users(
                 f"Failed enable user: {username} after 20 attempts. Make sure the panel is running "
                 + "and the username and password are correct."
             )
-            await send_logs(message)
+            await send_logs(message, category="panel_error")
             logger.error(message)
             raise ValueError(message)
     logger.info("Enabled selected users")
@@ -292,7 +365,7 @@ async def disable_user(panel_data: PanelType, username: UserType) -> None | Valu
     message = f"🚫 کاربر محدود شده شناسایی شد: {username.name} (فقط اطلاع‌رسانی - بدون غیرفعال‌سازی)"
     
     # ارسال پیام به تلگرام
-    await send_logs(message, on_ban=True)
+    await send_logs(message, on_ban=True, category="disabled")
     
     # چاپ در کنسول
     print(message)
@@ -335,13 +408,8 @@ async def disable_user2(panel_data: PanelType, username: UserType) -> None | Val
                     )
                     response.raise_for_status()
                 message = f"Disabled user: {username.name}"
-                await send_logs(message,on_ban=True)
-                config_data = await read_config()
-                webhook_url = config_data.get("WEBHOOK_URL", "")
-                if webhook_url:
-                    async with httpx.AsyncClient() as client:
-                        await client.post(webhook_url, json={"username": username.name, "status": "disabled"})
-
+                await send_logs(message, on_ban=True, category="disabled")
+                WEBHOOK.notify(username.name, "disabled")
                 logger.info(message)
                 dis_obj = DisabledUsers()
                 await dis_obj.add_user(username.name)
@@ -350,14 +418,14 @@ async def disable_user2(panel_data: PanelType, username: UserType) -> None | Val
                 continue
             except httpx.HTTPStatusError:
                 message = f"[{response.status_code}] {response.text}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
             except Exception as error:  # pylint: disable=broad-except
                 if scheme == "https":
                     continue
                 message = f"An unexpected error occurred: {error}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
         await asyncio.sleep(random.randint(2, 5) * attempt)
@@ -365,7 +433,7 @@ async def disable_user2(panel_data: PanelType, username: UserType) -> None | Val
         f"Failed disable user: {username.name} after 20 attempts. Make sure the panel is running "
         + "and the username and password are correct."
     )
-    await send_logs(message)
+    await send_logs(message, category="panel_error")
     logger.error(message)
     raise ValueError(message)
 
@@ -410,19 +478,20 @@ async def get_nodes(panel_data: PanelType) -> list[NodeType] | ValueError:
                             message=node["message"],
                         )
                     )
+                NODE_CACHE.update(all_nodes)
                 return all_nodes
             except SSLError:
                 continue
             except httpx.HTTPStatusError:
                 message = f"[{response.status_code}] {response.text}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
             except Exception as error:  # pylint: disable=broad-except
                 if scheme == "https":
                     continue
                 message = f"An unexpected error occurred: {error}"
-                await send_logs(message)
+                await send_logs(message, category="panel_error")
                 logger.error(message)
                 continue
         await asyncio.sleep(random.randint(2, 5) * attempt)
@@ -430,19 +499,17 @@ async def get_nodes(panel_data: PanelType) -> list[NodeType] | ValueError:
         "Failed to get nodes after 20 attempts. make sure the panel is running "
         + "and the username and password are correct."
     )
-    await send_logs(message)
+    await send_logs(message, category="panel_error")
     logger.error(message)
     raise ValueError(message)
 
 
 async def enable_dis_user(panel_data: PanelType):
     """
-    Enable disabled users every 'TIME_TO_ACTIVE_USERS' seconds.
+    Queue an enable action for each disabled user
+    'TIME_TO_ACTIVE_USERS' seconds after it was disabled.
     """
-    dis_obj = DisabledUsers()
-    while True:
-        data = await read_config()
-        await asyncio.sleep(int(data["TIME_TO_ACTIVE_USERS"]))
-        if DISABLED_USERS:
-            await enable_selected_users(panel_data, DISABLED_USERS)
-            await dis_obj.read_and_clear_users()
+    # Imported here to handel 'circular import' error
+    from utils.enforcement import ENFORCEMENT  # pylint: disable=import-outside-toplevel
+
+    await REENABLE_SCHEDULER.run(ENFORCEMENT.enable)
@@ -5,18 +5,14 @@ This module contains functions to parse and validate logs.
 import ipaddress
 import random
 import re
-import sys
+import time
+from collections.abc import Iterator
 
-from utils.check_usage import ACTIVE_USERS
+from utils.check_usage import ACTIVE_USERS, SEEN_ENTRIES, SEEN_STATS
+from utils.detector import DETECTOR
 from utils.read_config import read_config
 from utils.types import UserType
 
-try:
-    import httpx
-except ImportError:
-    print("Module 'httpx' is not installed use: 'pip install httpx' to install it")
-    sys.exit()
-
 INVALID_EMAILS = [
     "API]",
     "Found",
@@ -33,6 +29,9 @@ INVALID_IPS = {
 }
 VALID_IPS = []
 CACHE = {}
+SEEN_ENTRIES_SIZE = 8192
+# node id -> seconds spent waiting for IP geolocation lookups, kept out of the parse time
+GEO_LOOKUP_SECONDS: dict[int | None, float] = {}
 
 # List of API endpoints for IP geolocation checking
 API_ENDPOINTS = [
@@ -75,6 +74,9 @@ async def check_ip(ip_address: str) -> None | str:
     if "ipapi.co" in endpoint:
         url += "/country"
     
+    # Imported here so 'httpx' is only loaded when an IP has to be looked up
+    import httpx  # pylint: disable=import-outside-toplevel
+
     try:
         async with httpx.AsyncClient(verify=False) as client:
             resp = await client.get(url, timeout=2)
@@ -114,23 +116,22 @@ async def is_valid_ip(ip: str) -> bool:
 IP_V6_REGEX = re.compile(r"\[([0-9a-fA-F:]+)\]:\d+\s+accepted")
 IP_V4_REGEX = re.compile(r"(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})")
 EMAIL_REGEX = re.compile(r"email:\s*([A-Za-z0-9._%+-]+)")
+IP_V6_BYTES_REGEX = re.compile(rb"\[([0-9a-fA-F:]+)\]:\d+\s+accepted")
+IP_V4_BYTES_REGEX = re.compile(rb"(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})")
+EMAIL_BYTES_REGEX = re.compile(rb"email:\s*([A-Za-z0-9._%+-]+)")
 
 
-async def parse_logs(log: str) -> dict[str, UserType] | dict:  # pylint: disable=too-many-branches
+def extract_log_entries(log: str) -> Iterator[tuple[str, str]]:
     """
-    Asynchronously parse logs to extract and validate IP addresses and emails
+    Extract the (ip, email) pairs of the accepted connections from a text log
 
     Args:
         log (str): Log to parse
 
-    Returns:
-        dict[str, UserType]: Dictionary of active users
+    Yields:
+        tuple[str, str]: IP address and raw email of each accepted line
     """
-    data = await read_config()
-    if data.get("INVALID_IPS"):
-        INVALID_IPS.update(data.get("INVALID_IPS"))
-    lines = log.splitlines()
-    for line in lines:
+    for line in log.splitlines():
         if "accepted" not in line:
             continue
         if "BLOCK]" in line:
@@ -144,33 +145,138 @@ async def parse_logs(log: str) -> dict[str, UserType] | dict:  # pylint: disable
             ip = ip_v4_match.group(1)
         else:
             continue
-        if ip not in VALID_IPS:
-            is_valid_ip_test = await is_valid_ip(ip)
-            if is_valid_ip_test and ip not in INVALID_IPS:
-                if data["IP_LOCATION"] != "None":
-                    country = await check_ip(ip)
-                    if country and country == data["IP_LOCATION"]:
-                        VALID_IPS.append(ip)
-                    elif country and country != data["IP_LOCATION"]:
-                        INVALID_IPS.add(ip)
-                        continue
-            else:
-                continue
-        if email_match:
-            email = email_match.group(1)
-            email = await remove_id_from_username(email)
-            if email in INVALID_EMAILS:
-                continue
-        else:
+        if not email_match:
             continue
+        yield ip, email_match.group(1)
+
+
+def extract_log_entries_bytes(frame: bytes) -> Iterator[tuple[bytes, bytes]]:
+    """
+    Extract the (ip, email) pairs of the accepted connections from a raw frame
+
+    The frame is never decoded or split into lines, lines without
+    'accepted' are skipped with 'bytes.find' and the patterns are matched
+    in place against a memoryview, so only the ip and email fragments are copied.
+
+    Args:
+        frame (bytes): Raw websocket frame or pushed log batch
+
+    Yields:
+        tuple[bytes, bytes]: IP address and raw email of each accepted line
+    """
+    view = memoryview(frame)
+    pos = frame.find(b"accepted")
+    while pos != -1:
+        start = frame.rfind(b"\n", 0, pos) + 1
+        end = frame.find(b"\n", pos)
+        if end == -1:
+            end = len(frame)
+        pos = frame.find(b"accepted", end)
+        if frame.find(b"BLOCK]", start, end) != -1:
+            continue
+        ip_match = IP_V6_BYTES_REGEX.search(view, start, end) or IP_V4_BYTES_REGEX.search(
+            view, start, end
+        )
+        if not ip_match:
+            continue
+        email_match = EMAIL_BYTES_REGEX.search(view, start, end)
+        if not email_match:
+            continue
+        yield ip_match.group(1), email_match.group(1)
+
+
+async def add_log_entry(
+    ip: str, email: str, data: dict, node_id: int | None = None
+) -> tuple[UserType, str] | None:
+    """
+    Validate an accepted (ip, email) pair and add it to the active users
 
-        user = ACTIVE_USERS.get(email)
-        if user:
-            user.ip.append(ip)
+    Args:
+        ip (str): IP address of the connection
+        email (str): Email (username with ID) of the connection
+        data (dict): Config data
+        node_id (int | None): ID of the node, the geolocation wait is added
+            to its 'GEO_LOOKUP_SECONDS'
+
+    Returns:
+        tuple[UserType, str] | None: The user and the ip that was added, None if rejected
+    """
+    if ip not in VALID_IPS:
+        is_valid_ip_test = await is_valid_ip(ip)
+        if is_valid_ip_test and ip not in INVALID_IPS:
+            if data["IP_LOCATION"] != "None":
+                start = time.perf_counter()
+                country = await check_ip(ip)
+                GEO_LOOKUP_SECONDS[node_id] = (
+                    GEO_LOOKUP_SECONDS.get(node_id, 0.0) + time.perf_counter() - start
+                )
+                if country and country == data["IP_LOCATION"]:
+                    VALID_IPS.append(ip)
+                elif country and country != data["IP_LOCATION"]:
+                    INVALID_IPS.add(ip)
+                    return None
         else:
-            user = ACTIVE_USERS.setdefault(
-                email,
-                UserType(name=email, ip=[ip]),
+            return None
+    email = await remove_id_from_username(email)
+    if email in INVALID_EMAILS:
+        return None
+
+    user = ACTIVE_USERS.get(email)
+    if user:
+        user.ip.append(ip)
+    else:
+        user = ACTIVE_USERS.setdefault(
+            email,
+            UserType(name=email, ip=[ip]),
+        )
+    return user, ip
+
+
+async def parse_logs(
+    log: str | bytes, node_id: int | None = None
+) -> dict[str, UserType] | dict:
+    """
+    Asynchronously parse logs to extract and validate IP addresses and emails
+
+    Pairs of (email, ip) already classified in the current window are served
+    from the node cache: they only append the ip again, without validation.
+
+    Args:
+        log (str | bytes): Log to parse, bytes are parsed without decoding the whole log
+        node_id (int | None): ID of the node that sent the log
+
+    Returns:
+        dict[str, UserType]: Dictionary of active users
+    """
+    data = await read_config()
+    if data.get("INVALID_IPS"):
+        INVALID_IPS.update(data.get("INVALID_IPS"))
+    seen = SEEN_ENTRIES.setdefault(node_id, {})
+    stats = SEEN_STATS.setdefault(node_id, [0, 0])
+    if isinstance(log, bytes):
+        entries = extract_log_entries_bytes(log)
+    else:
+        entries = extract_log_entries(log)
+    for ip, email in entries:
+        key = (email, ip)
+        if key in seen:
+            stats[0] += 1
+            entry = seen[key]
+            if entry:
+                entry[0].ip.append(entry[1])
+                DETECTOR.observe(entry[0].name, entry[1])
+            continue
+        stats[1] += 1
+        if isinstance(ip, bytes):
+            entry = await add_log_entry(
+                ip.decode("ascii"), email.decode("ascii"), data, node_id
             )
+        else:
+            entry = await add_log_entry(ip, email, data, node_id)
+        if entry:
+            DETECTOR.observe(entry[0].name, entry[1])
+        if len(seen) >= SEEN_ENTRIES_SIZE:
+            seen.clear()
+        seen[key] = entry
 
     return ACTIVE_USERS
@@ -0,0 +1,68 @@
+"""
+This module contains the index of the per-user limits ('GENERAL_LIMIT',
+'SPECIAL_LIMIT' and 'EXCEPT_USERS') used by the checkers.
+"""
+
+from utils.read_config import read_config
+from utils.state_db import get_state_db
+
+
+class PolicyIndex:
+    """
+    A class used to look up the limit of a user in O(1).
+
+    The index is rebuilt only when the config data (or the state database) changes,
+    'version' is increased on every change of the limits.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.config_data = None
+        self.state_version = None
+        self.general_limit = 0
+        self.special_limits: dict[str, int] = {}
+        self.except_users: set[str] = set()
+
+    def refresh(self, config_data: dict) -> None:
+        """
+        Rebuild the index if the config data was reloaded.
+        """
+        state_db = get_state_db(config_data)
+        state_version = state_db.version() if state_db else None
+        if config_data is self.config_data and state_version == self.state_version:
+            return
+        self.config_data = config_data
+        self.state_version = state_version
+        self.version += 1
+        self.general_limit = int(config_data.get("GENERAL_LIMIT", 0))
+        if state_db:
+            self.special_limits = state_db.get_special_limits()
+            self.except_users = set(state_db.get_except_users())
+            return
+        self.special_limits = {
+            user: int(limit) for user, limit in config_data.get("SPECIAL_LIMIT", [])
+        }
+        self.except_users = set(config_data.get("EXCEPT_USERS", []))
+
+    def limit_for(self, user: str) -> int:
+        """
+        Return the special limit of the user or the general limit.
+        """
+        return self.special_limits.get(user, self.general_limit)
+
+    def is_excepted(self, user: str) -> bool:
+        """
+        Return True if the user is in 'EXCEPT_USERS'.
+        """
+        return user in self.except_users
+
+
+POLICY = PolicyIndex()
+
+
+async def get_policy() -> PolicyIndex:
+    """
+    Return the policy index, refreshed from the current config.
+    """
+    POLICY.refresh(await read_config())
+    return POLICY
@@ -3,13 +3,24 @@ Read config file and return data.
 """
 # pylint: disable=global-statement
 
+import asyncio
 import json
 import os
+import sqlite3
 import sys
+import tempfile
 import time
 
+from utils.data_dir import data_path
+from utils.state_db import get_state_db
+
 CONFIG_DATA = None
 LAST_READ_TIME = 0
+DETECTED_USERS_FILE = data_path("detected_users.json")
+# username -> detected user, loaded once from DETECTED_USERS_FILE (or the state database)
+DETECTED_USERS: dict[str, dict] | None = None
+# usernames changed since the last flush
+DETECTED_USERS_CHANGED: set[str] = set()
 
 
 async def read_config(
@@ -18,6 +29,15 @@ async def read_config(
     """
     read and return data from a JSON file.
     """
+    return read_config_sync(check_required_elements)
+
+
+def read_config_sync(
+    check_required_elements=None,
+) -> dict:
+    """
+    read and return data from a JSON file (for code that runs outside the event loop).
+    """
     global CONFIG_DATA
     global LAST_READ_TIME
     config_file = "config.json"
@@ -66,7 +86,7 @@ async def read_detected_users_config(
     """
     Read and return data from detected_users.json file
     """
-    config_file = "detected_users.json"
+    config_file = DETECTED_USERS_FILE
 
     if not os.path.exists(config_file):
         # Create file if it doesn't exist
@@ -93,95 +113,170 @@ async def read_detected_users_config(
                 )
     return data
 
-async def detect_user(detectedUser: str, ips: list) -> str | None:
+async def load_detected_users() -> dict[str, dict]:
     """
-    Add user to detected users list
-    Creates config file if it doesn't exist
-    """
-    if os.path.exists("detected_users.json"):
-        data = await read_d_json_file()
-        users = data.get("detectedUsers", [])
-        user_found = next((y for y in users if y["user"] == detectedUser), None)
-        
-        if user_found:
-            # Update out of limit count
-            user_found["outOfLimitCount"] = int(user_found.get("outOfLimitCount", 0)) + 1
-            user_found["ips"] = ips
-            with open("detected_users.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-            return detectedUser
+    Load detected_users.json once and return the in-memory store indexed by username
+    """
+    global DETECTED_USERS
+    if DETECTED_USERS is None:
+        state_db = get_state_db(await read_config())
+        if state_db:
+            DETECTED_USERS = await asyncio.to_thread(state_db.get_detected_users)
         else:
-            # Add new user
-            users.append({"user": detectedUser, "ips": ips, "outOfLimitCount": 1})
-            data["detectedUsers"] = users
-            with open("detected_users.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-            return detectedUser
+            data = await asyncio.to_thread(read_detected_users_file)
+            DETECTED_USERS = {user["user"]: user for user in data.get("detectedUsers", [])}
+    return DETECTED_USERS
+
+
+async def detect_user(detectedUser: str, ips: list) -> str | None:
+    """
+    Add user to detected users list or increase its out of limit count
+    Changes are persisted by 'flush_detected_users'
+    """
+    users = await load_detected_users()
+    user_found = users.get(detectedUser)
+    if user_found:
+        # Update out of limit count
+        user_found["outOfLimitCount"] = int(user_found.get("outOfLimitCount", 0)) + 1
+        user_found["ips"] = ips
     else:
-        # Create file with initial user
-        data = {"detectedUsers": [{"user": detectedUser, "ips": ips, "outOfLimitCount": 1}]}
-        with open("detected_users.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        return detectedUser
+        users[detectedUser] = {"user": detectedUser, "ips": ips, "outOfLimitCount": 1}
+    DETECTED_USERS_CHANGED.add(detectedUser)
+    return detectedUser
+
 
 async def add_detected_user(detectedUser: str, ips: list) -> str | None:
     """
     Add user to detected users list
-    Creates config file if it doesn't exist
-    """
-    if os.path.exists("detected_users.json"):
-        data = await read_d_json_file()
-        users = data.get("detectedUsers", [])
-        # Check if user exists
-        if any(user["user"] == detectedUser for user in users):
-            return detectedUser
-        
-        # Add new user
-        users.append({"user": detectedUser, "ips": ips, "outOfLimitCount": 1})
-        data["detectedUsers"] = users
-        with open("detected_users.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        return detectedUser
-    else:
-        # Create file with initial user
-        data = {"detectedUsers": [{"user": detectedUser, "ips": ips, "outOfLimitCount": 1}]}
-        with open("detected_users.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        return detectedUser
+    Changes are persisted by 'flush_detected_users'
+    """
+    users = await load_detected_users()
+    if detectedUser not in users:
+        users[detectedUser] = {"user": detectedUser, "ips": ips, "outOfLimitCount": 1}
+        DETECTED_USERS_CHANGED.add(detectedUser)
+    return detectedUser
+
 
 async def delete_detected_user(detectedUser: str) -> str | None:
     """
     Remove user from detected users list
+    Changes are persisted by 'flush_detected_users'
     """
-    if not os.path.exists("detected_users.json"):
+    users = await load_detected_users()
+    if users.pop(detectedUser, None) is None:
         return None
-    
-    data = await read_d_json_file()
-    users = data.get("detectedUsers", [])
-    user_to_remove = next((user for user in users if user["user"] == detectedUser), None)
-    
-    if user_to_remove:
-        users.remove(user_to_remove)
-        data["detectedUsers"] = users
-        with open("detected_users.json", "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        return detectedUser
-    return None
+    DETECTED_USERS_CHANGED.add(detectedUser)
+    return detectedUser
+
+
+async def get_detected_user(detectedUser: str) -> dict | None:
+    """
+    Get a detected user by username
+    """
+    users = await load_detected_users()
+    return users.get(detectedUser)
 
 
 async def get_detected_users() -> list:
     """
     Get list of detected users
     """
-    if os.path.exists("detected_users.json"):
-        data = await read_d_json_file()
-        return data.get("detectedUsers", [])
-    
-    # Create file if it doesn't exist
-    data = {"detectedUsers": []}
-    with open("detected_users.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-    return []
+    users = await load_detected_users()
+    return list(users.values())
+
+
+async def flush_detected_users() -> None:
+    """
+    Persist the detected users with one atomic write (or one transaction
+    of row upserts with the state database) if they changed
+    """
+    if DETECTED_USERS is None or not DETECTED_USERS_CHANGED:
+        return
+    changed = set(DETECTED_USERS_CHANGED)
+    DETECTED_USERS_CHANGED.clear()
+    try:
+        state_db = get_state_db(await read_config())
+        if state_db:
+            upserts = [dict(DETECTED_USERS[user]) for user in changed if user in DETECTED_USERS]
+            deletes = [user for user in changed if user not in DETECTED_USERS]
+            await asyncio.to_thread(state_db.save_detected_users, upserts, deletes)
+        else:
+            data = {"detectedUsers": [dict(user) for user in DETECTED_USERS.values()]}
+            await asyncio.to_thread(write_json_atomic, DETECTED_USERS_FILE, data)
+    except (OSError, sqlite3.Error):
+        DETECTED_USERS_CHANGED.update(changed)
+        raise
+
+
+def read_detected_users_file() -> dict:
+    """
+    Read detected_users.json, returns an empty list if it doesn't exist
+    """
+    if not os.path.exists(DETECTED_USERS_FILE):
+        return {"detectedUsers": []}
+    try:
+        with open(DETECTED_USERS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError as error:
+        print(
+            "Error decoding the detected_users.json file. Please check its syntax.", error
+        )
+        return {"detectedUsers": []}
+
+
+def save_config(data: dict) -> None:
+    """
+    Write config.json in place and keep 'data' as the loaded config,
+    so the change is used right away without reading the file again
+    """
+    global CONFIG_DATA
+    global LAST_READ_TIME
+    last_read_time = LAST_READ_TIME
+    # Don't read the file back while it is being rewritten
+    LAST_READ_TIME = float("inf")
+    try:
+        write_json_in_place("config.json", data)
+    except BaseException:
+        LAST_READ_TIME = last_read_time
+        raise
+    CONFIG_DATA = data
+    LAST_READ_TIME = time.time()
+
+
+def write_json_in_place(path: str, data) -> None:
+    """
+    Overwrite a file in place (truncate, write, fsync). Used for config.json:
+    it can be bind-mounted on its own (docker-compose.yml), and renaming
+    over a bind-mounted file fails with EBUSY
+    """
+    text = json.dumps(data, indent=2)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    Write JSON data to a temp file and rename it over 'path'
+    so readers never see a partially written file (only for the files
+    the app owns, see 'write_json_in_place' for config.json)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        # mkstemp creates the file with 0600, keep the mode of the replaced file
+        mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 async def read_d_json_file() -> dict:
@@ -191,5 +286,5 @@ async def read_d_json_file() -> dict:
     Returns:
         Contents of detected_users.json file
     """
-    with open("detected_users.json", "r", encoding="utf-8") as f:
+    with open(DETECTED_USERS_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
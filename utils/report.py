@@ -0,0 +1,57 @@
+"""
+This module contains the full usage report of the last check,
+sent as a compressed file ('REPORT_MODE': "file" or '/full_report')
+instead of inline messages.
+"""
+
+import csv
+import gzip
+import io
+from collections.abc import Iterator
+
+# The users and their IPs of the last check
+LAST_REPORT: dict[str, list[str]] = {}
+
+
+def save_last_report(users_log: dict[str, list[str]]) -> None:
+    """
+    Keep the result of a check for the '/full_report' command.
+    """
+    LAST_REPORT.clear()
+    LAST_REPORT.update(users_log)
+
+
+def render_report(users_log: dict[str, list[str]]) -> Iterator[str]:
+    """
+    Yield the report line by line: one line per user with its IPs.
+    """
+    for user, ips in users_log.items():
+        if ips:
+            yield f"{user}\t{len(ips)}\t{' '.join(ips)}\n"
+
+
+def build_report_file(users_log: dict[str, list[str]], fmt: str = "txt") -> tuple[str, bytes]:
+    """
+    Write the report of a check into a gzip compressed text or CSV file.
+
+    Args:
+        users_log (dict[str, list[str]]): username -> IPs.
+        fmt (str): "txt" (user, number of ips, ips separated by tabs) or "csv".
+
+    Returns:
+        tuple[str, bytes]: The file name and the compressed content.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+        text = io.TextIOWrapper(gzip_file, encoding="utf-8", newline="")
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(["user", "ip_count", "ips"])
+            writer.writerows(
+                (user, len(ips), " ".join(ips)) for user, ips in users_log.items() if ips
+            )
+        else:
+            text.writelines(render_report(users_log))
+        text.flush()
+        text.detach()
+    return f"report.{'csv' if fmt == 'csv' else 'txt'}.gz", buffer.getvalue()
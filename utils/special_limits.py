@@ -0,0 +1,174 @@
+"""
+This module contains the special limit updates of the APIs.
+
+Updates (one user or a bulk import) are merged with a dict index and saved
+once: one write of config.json, or one transaction with the state
+database. The embedded API also pushes them straight to the policy index,
+so the checkers use the new limits without reading the config again.
+"""
+
+import asyncio
+import csv
+import io
+import json
+
+from utils.policy import POLICY
+from utils.read_config import read_config, read_config_sync, save_config
+from utils.state_db import get_state_db
+
+# Serializes the updates, each one rewrites the whole special limit list
+UPDATE_LOCK = asyncio.Lock()
+
+
+def parse_rows(body: str, content_type: str = "") -> list:
+    """
+    Parse the rows of a bulk import: a CSV of 'user,limit' lines (the header
+    line is optional) or a JSON array of {"user": ..., "limit": ...} objects
+    or [user, limit] pairs.
+
+    Raises:
+        ValueError: If the body is not valid CSV or JSON.
+    """
+    if "csv" in content_type:
+        rows = [row for row in csv.reader(io.StringIO(body)) if any(cell.strip() for cell in row)]
+        if rows and [cell.strip().lower() for cell in rows[0]] == ["user", "limit"]:
+            rows = rows[1:]
+        return rows
+    data = json.loads(body or "null")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of {user, limit} objects")
+    return data
+
+
+def validate_row(row) -> tuple[str, int]:
+    """
+    Return the user and the limit of a row.
+
+    Raises:
+        ValueError: If the row has no user name or no positive integer limit.
+    """
+    if isinstance(row, dict):
+        user, limit = row.get("user"), row.get("limit")
+    elif isinstance(row, (list, tuple)) and len(row) == 2:
+        user, limit = row
+    else:
+        raise ValueError("expected a user and a limit")
+    if isinstance(user, str):
+        user = user.strip()
+    if not user or not isinstance(user, str):
+        raise ValueError("user is required")
+    if isinstance(limit, str):
+        try:
+            limit = int(limit.strip())
+        except ValueError:
+            raise ValueError("limit must be an integer") from None
+    if not isinstance(limit, int) or isinstance(limit, bool):
+        raise ValueError("limit must be an integer")
+    if limit < 0:
+        raise ValueError("limit must be a positive number")
+    return user, limit
+
+
+def validate_rows(rows: list) -> tuple[dict[str, int], list[dict]]:
+    """
+    Validate the rows of a bulk import.
+
+    Returns:
+        tuple[dict[str, int], list[dict]]: The valid limits (the last row of
+        a user wins) and one result per row, the status of the valid rows
+        is filled by 'set_row_statuses'.
+    """
+    limits: dict[str, int] = {}
+    results = []
+    last_row: dict[str, dict] = {}
+    for number, row in enumerate(rows, start=1):
+        try:
+            user, limit = validate_row(row)
+        except ValueError as error:
+            results.append({"row": number, "status": "invalid", "error": str(error)})
+            continue
+        result = {"row": number, "user": user, "limit": limit, "status": None}
+        if user in last_row:
+            last_row[user].update(status="skipped", error="a later row sets this user")
+        last_row[user] = result
+        limits[user] = limit
+        results.append(result)
+    return limits, results
+
+
+def set_row_statuses(results: list[dict], previous: dict[str, int]) -> dict[str, int]:
+    """
+    Mark the saved rows "added" or "updated" and return the number of rows by status.
+    """
+    summary = {"added": 0, "updated": 0, "skipped": 0, "invalid": 0}
+    for result in results:
+        if result["status"] is None:
+            result["status"] = "updated" if result["user"] in previous else "added"
+        summary[result["status"]] += 1
+    return summary
+
+
+def save_special_limits(
+    config_data: dict, limits: dict[str, int], previous: dict[str, int] | None = None
+) -> dict[str, int]:
+    """
+    Merge limits into the special limits and save them once.
+
+    Args:
+        config_data (dict): The loaded config.
+        limits (dict[str, int]): username -> new limit.
+        previous (dict[str, int] | None): The current special limits if they
+            are already indexed, they are read otherwise.
+
+    Returns:
+        dict[str, int]: The special limits before the merge.
+    """
+    state_db = get_state_db(config_data)
+    if previous is None:
+        if state_db:
+            previous = state_db.get_special_limits()
+        else:
+            previous = {
+                user: int(limit) for user, limit in config_data.get("SPECIAL_LIMIT", [])
+            }
+    if state_db:
+        state_db.set_special_limits(limits)
+        return previous
+    merged = {**previous, **limits}
+    data = dict(config_data)
+    data["SPECIAL_LIMIT"] = [[user, limit] for user, limit in merged.items()]
+    save_config(data)
+    return previous
+
+
+async def update_special_limits(limits: dict[str, int]) -> dict[str, int]:
+    """
+    Set the special limit of several users and push them to the policy index.
+
+    Returns:
+        dict[str, int]: The special limits before the update.
+    """
+    async with UPDATE_LOCK:
+        config_data = await read_config()
+        POLICY.refresh(config_data)
+        previous = dict(POLICY.special_limits)
+        await asyncio.to_thread(save_special_limits, config_data, limits, previous)
+        POLICY.special_limits = {**previous, **limits}
+        POLICY.version += 1
+        state_db = get_state_db(config_data)
+        if state_db:
+            POLICY.state_version = state_db.version()
+        else:
+            POLICY.config_data = read_config_sync()
+        return previous
+
+
+async def update_special_limit(user: str, limit: int) -> str:
+    """
+    Set the special limit of a user.
+
+    Returns:
+        str: "added" if the user had no special limit, "updated" otherwise.
+    """
+    previous = await update_special_limits({user: limit})
+    return "updated" if user in previous else "added"
@@ -0,0 +1,56 @@
+"""
+This module contains the '--profile-startup' report: the import time of the
+program grouped by top-level package, measured with 'python -X importtime'
+in a fresh interpreter so the modules loaded by this process do not hide it.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules loaded later, when the bot starts (they are not part of the cold start)
+DEFERRED_MODULES = ["telegram_bot.main", "telegram.ext"]
+
+
+def import_times(module: str) -> dict[str, int]:
+    """
+    Import a module in a new interpreter and return the import time
+    (microseconds, self time summed) of every top-level package it loaded.
+
+    Raises:
+        ValueError: If the module can not be imported.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR, env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+        env=env,
+    )
+    if result.returncode:
+        raise ValueError(f"Failed to import {module}: {result.stderr.splitlines()[-1:]}")
+    times: dict[str, int] = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        times[name.strip().split(".")[0]] += int(self_us)
+    return times
+
+
+def print_startup_profile(module: str, top: int = 15) -> None:
+    """
+    Print the import time of a module and of the deferred modules.
+    """
+    times = import_times(module)
+    total = sum(times.values())
+    print(f"Import time of '{module}': {total / 1000:.1f} ms")
+    for name, us in sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:<24} {us / 1000:8.1f} ms  {us * 100 / max(total, 1):5.1f}%")
+    for deferred in DEFERRED_MODULES:
+        deferred_total = sum(import_times(deferred).values())
+        print(f"Deferred '{deferred}': {deferred_total / 1000:.1f} ms (loaded when the bot starts)")
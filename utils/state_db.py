@@ -0,0 +1,327 @@
+"""
+This module contains the optional SQLite state backend ('STATE_BACKEND': "sqlite")
+for the special limits, except users, detected users, disabled users
+and pending enforcement actions.
+
+The database runs in WAL mode so the monitor, the bot and the API
+can read and write it at the same time without rewriting whole files.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.data_dir import data_path, prepare_data_dir
+from utils.logs import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS special_limits (
+    user TEXT PRIMARY KEY,
+    ip_limit INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS except_users (
+    user TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS detected_users (
+    user TEXT PRIMARY KEY,
+    ips TEXT NOT NULL,
+    out_of_limit_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS disabled_users (
+    user TEXT PRIMARY KEY,
+    disabled_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS disabled_users_disabled_at ON disabled_users (disabled_at);
+CREATE TABLE IF NOT EXISTS enforcement_actions (
+    user TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+STATE_DBS: dict[str, "StateDB"] = {}
+
+
+class StateDB:
+    """
+    A class used to read and write the state tables with row operations.
+    """
+
+    def __init__(self, path: str = data_path("state.db")):
+        self.path = path
+        self.lock = threading.Lock()
+        self.local_writes = 0
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def write(self, query: str, params=()) -> sqlite3.Cursor:
+        """
+        Run one write statement in its own transaction.
+        """
+        with self.lock, self.conn:
+            self.local_writes += 1
+            return self.conn.execute(query, params)
+
+    def write_many(self, statements: list[tuple[str, list]]) -> None:
+        """
+        Run several 'executemany' statements in a single transaction.
+        """
+        with self.lock, self.conn:
+            self.local_writes += 1
+            for query, rows in statements:
+                if rows:
+                    self.conn.executemany(query, rows)
+
+    def read(self, query: str, params=()) -> list:
+        """
+        Run a read query and return all rows.
+        """
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def dump(self) -> bytes:
+        """
+        Return a consistent copy of the whole database (for the backup).
+        """
+        with self.lock:
+            return self.conn.serialize()
+
+    def version(self) -> tuple[int, int]:
+        """
+        Return a value that changes whenever any process commits a write.
+        """
+        with self.lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self.local_writes
+
+    # Special limits
+    def get_special_limits(self) -> dict[str, int]:
+        """Return the special limits indexed by username."""
+        return dict(self.read("SELECT user, ip_limit FROM special_limits"))
+
+    def get_special_limit(self, user: str) -> int | None:
+        """Return the special limit of a user or None."""
+        rows = self.read("SELECT ip_limit FROM special_limits WHERE user = ?", (user,))
+        return rows[0][0] if rows else None
+
+    def set_special_limit(self, user: str, limit: int) -> None:
+        """Insert or update the special limit of a user."""
+        self.write(
+            "INSERT INTO special_limits (user, ip_limit) VALUES (?, ?) "
+            + "ON CONFLICT(user) DO UPDATE SET ip_limit = excluded.ip_limit",
+            (user, limit),
+        )
+
+    def set_special_limits(self, limits: dict[str, int]) -> None:
+        """Insert or update the special limits of several users in one transaction."""
+        self.write_many(
+            [
+                (
+                    "INSERT INTO special_limits (user, ip_limit) VALUES (?, ?) "
+                    + "ON CONFLICT(user) DO UPDATE SET ip_limit = excluded.ip_limit",
+                    list(limits.items()),
+                )
+            ]
+        )
+
+    # Except users
+    def get_except_users(self) -> list[str]:
+        """Return the except users."""
+        rows = self.read("SELECT user FROM except_users ORDER BY rowid")
+        return [row[0] for row in rows]
+
+    def add_except_user(self, user: str) -> bool:
+        """Add an except user, returns False if it already exists."""
+        cursor = self.write("INSERT OR IGNORE INTO except_users (user) VALUES (?)", (user,))
+        return cursor.rowcount > 0
+
+    def remove_except_user(self, user: str) -> bool:
+        """Remove an except user, returns False if it doesn't exist."""
+        return self.write("DELETE FROM except_users WHERE user = ?", (user,)).rowcount > 0
+
+    # Detected users
+    def get_detected_users(self) -> dict[str, dict]:
+        """Return the detected users indexed by username."""
+        return {
+            user: {"user": user, "ips": json.loads(ips), "outOfLimitCount": count}
+            for user, ips, count in self.read(
+                "SELECT user, ips, out_of_limit_count FROM detected_users"
+            )
+        }
+
+    def save_detected_users(self, upserts: list[dict], deletes: list[str]) -> None:
+        """Upsert and delete detected users in one transaction."""
+        self.write_many(
+            [
+                (
+                    "INSERT INTO detected_users (user, ips, out_of_limit_count) "
+                    + "VALUES (?, ?, ?) ON CONFLICT(user) DO UPDATE SET ips = excluded.ips, "
+                    + "out_of_limit_count = excluded.out_of_limit_count",
+                    [
+                        (user["user"], json.dumps(user["ips"]), int(user["outOfLimitCount"]))
+                        for user in upserts
+                    ],
+                ),
+                ("DELETE FROM detected_users WHERE user = ?", [(user,) for user in deletes]),
+            ]
+        )
+
+    # Disabled users
+    def get_disabled_users(self) -> dict[str, float]:
+        """Return the disabled users and the time they were disabled."""
+        return dict(self.read("SELECT user, disabled_at FROM disabled_users"))
+
+    def add_disabled_user(self, user: str, disabled_at: float) -> None:
+        """Insert or update a disabled user."""
+        self.write(
+            "INSERT INTO disabled_users (user, disabled_at) VALUES (?, ?) "
+            + "ON CONFLICT(user) DO UPDATE SET disabled_at = excluded.disabled_at",
+            (user, disabled_at),
+        )
+
+    def remove_disabled_user(self, user: str) -> None:
+        """Remove a disabled user."""
+        self.write("DELETE FROM disabled_users WHERE user = ?", (user,))
+
+    def clear_disabled_users(self) -> None:
+        """Remove all disabled users."""
+        self.write("DELETE FROM disabled_users")
+
+    # Enforcement actions
+    def get_enforcement_actions(self) -> list[dict]:
+        """Return the pending enforcement actions."""
+        return [
+            {
+                "user": user,
+                "kind": kind,
+                "reason": reason,
+                "enqueued_at": enqueued_at,
+                "attempts": attempts,
+            }
+            for user, kind, reason, enqueued_at, attempts in self.read(
+                "SELECT user, kind, reason, enqueued_at, attempts FROM enforcement_actions"
+            )
+        ]
+
+    def save_enforcement_action(self, action: dict) -> None:
+        """Insert or replace the pending enforcement action of a user."""
+        self.write(
+            "INSERT OR REPLACE INTO enforcement_actions "
+            + "(user, kind, reason, enqueued_at, attempts) VALUES (?, ?, ?, ?, ?)",
+            (
+                action["user"],
+                action["kind"],
+                action["reason"],
+                action["enqueued_at"],
+                action["attempts"],
+            ),
+        )
+
+    def remove_enforcement_action(self, user: str, enqueued_at: float) -> None:
+        """Remove an enforcement action unless it was replaced by a newer one."""
+        self.write(
+            "DELETE FROM enforcement_actions WHERE user = ? AND enqueued_at = ?",
+            (user, enqueued_at),
+        )
+
+    def import_json_state(self, config_data: dict) -> None:
+        """
+        Import the existing JSON state the first time the database is used.
+        """
+        if self.read("SELECT value FROM meta WHERE key = 'json_imported'"):
+            return
+        detected = []
+        if os.path.exists(data_path("detected_users.json")):
+            with open(data_path("detected_users.json"), "r", encoding="utf-8") as f:
+                detected = json.load(f).get("detectedUsers", [])
+        disabled = []
+        if os.path.exists(data_path(".disable_users.json")):
+            with open(data_path(".disable_users.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            disabled_at = data.get("disabled_at", {})
+            now = time.time()
+            disabled_at = {
+                user: float(disabled_at.get(user, now)) for user in data.get("disable_user", [])
+            }
+            if os.path.exists(data_path(".disable_users.json.journal")):
+                with open(data_path(".disable_users.json.journal"), "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if entry["op"] == "add":
+                            disabled_at[entry["user"]] = float(entry["at"])
+                        elif entry["op"] == "remove":
+                            disabled_at.pop(entry["user"], None)
+                        elif entry["op"] == "clear":
+                            disabled_at.clear()
+            disabled = list(disabled_at.items())
+        if config_data.get("SPECIAL_LIMIT"):
+            # The bot and the API only change the database from now on,
+            # config.json keeps the limits it had at this point
+            logger.warning(
+                f"Imported {len(config_data['SPECIAL_LIMIT'])} special limits "
+                + f"from config.json into the new state database {self.path}"
+            )
+        self.write_many(
+            [
+                (
+                    "INSERT OR IGNORE INTO special_limits (user, ip_limit) VALUES (?, ?)",
+                    [
+                        (user, int(limit))
+                        for user, limit in config_data.get("SPECIAL_LIMIT", [])
+                    ],
+                ),
+                (
+                    "INSERT OR IGNORE INTO except_users (user) VALUES (?)",
+                    [(user,) for user in config_data.get("EXCEPT_USERS", [])],
+                ),
+                (
+                    "INSERT OR IGNORE INTO detected_users (user, ips, out_of_limit_count) "
+                    + "VALUES (?, ?, ?)",
+                    [
+                        (
+                            user["user"],
+                            json.dumps(user["ips"]),
+                            int(user.get("outOfLimitCount", 1)),
+                        )
+                        for user in detected
+                    ],
+                ),
+                (
+                    "INSERT OR IGNORE INTO disabled_users (user, disabled_at) VALUES (?, ?)",
+                    disabled,
+                ),
+                ("INSERT OR IGNORE INTO meta (key, value) VALUES ('json_imported', '1')", [()]),
+            ]
+        )
+
+
+def get_state_db(config_data: dict) -> StateDB | None:
+    """
+    Return the state database if 'STATE_BACKEND' is "sqlite", None otherwise.
+
+    The database is opened once per process and filled from the JSON files
+    the first time it is created.
+    """
+    if config_data.get("STATE_BACKEND", "json") != "sqlite":
+        return None
+    path = config_data.get("STATE_DB_PATH", data_path("state.db"))
+    state_db = STATE_DBS.get(path)
+    if state_db is None:
+        prepare_data_dir()
+        state_db = STATE_DBS[path] = StateDB(path)
+        state_db.import_json_state(config_data)
+    return state_db
@@ -0,0 +1,92 @@
+"""
+This module tunes the websocket log interval of each node
+toward a target frame size and parse latency.
+"""
+
+import math
+import random
+
+from utils.read_config import read_config
+from utils.types import NodeStreamStats
+
+STREAM_STATS: dict[int, NodeStreamStats] = {}
+# Weight of the last frame in the moving averages
+EWMA_ALPHA = 0.2
+# Frames needed before the interval of a node is changed
+MIN_FRAMES = 5
+
+
+def record_frame(node_id: int, size: int, parse_seconds: float) -> None:
+    """
+    Record the size and parse time of a frame received from a node.
+
+    Args:
+        node_id (int): The ID of the node.
+        size (int): The size of the frame in bytes.
+        parse_seconds (float): The time spent to parse the frame.
+    """
+    stats = STREAM_STATS.get(node_id)
+    if stats is None:
+        return
+    parse_ms = parse_seconds * 1000
+    if stats.frames == 0 and stats.avg_frame_bytes == 0:
+        stats.avg_frame_bytes = size
+        stats.avg_parse_ms = parse_ms
+    else:
+        stats.avg_frame_bytes += EWMA_ALPHA * (size - stats.avg_frame_bytes)
+        stats.avg_parse_ms += EWMA_ALPHA * (parse_ms - stats.avg_parse_ms)
+    stats.frames += 1
+    stats.total_bytes += size
+
+
+async def next_interval(node_id: int) -> str:
+    """
+    Choose the websocket interval of a node for its next connection.
+
+    The interval is scaled by the ratio between the targets
+    ('STREAM_TARGET_FRAME_BYTES' and 'STREAM_TARGET_PARSE_MS') and the observed
+    averages, damped and kept between 'STREAM_INTERVAL_MIN' and 'STREAM_INTERVAL_MAX'.
+
+    Args:
+        node_id (int): The ID of the node.
+
+    Returns:
+        str: The interval to use in the websocket url.
+    """
+    config_data = await read_config()
+    min_interval = float(config_data.get("STREAM_INTERVAL_MIN", 0.5))
+    max_interval = float(config_data.get("STREAM_INTERVAL_MAX", 5.0))
+    target_bytes = float(config_data.get("STREAM_TARGET_FRAME_BYTES", 64 * 1024))
+    target_ms = float(config_data.get("STREAM_TARGET_PARSE_MS", 50))
+
+    stats = STREAM_STATS.get(node_id)
+    if stats is None:
+        # Spread the first connections like before
+        interval = random.choice((0.9, 1.3, 1.5, 1.7))
+        stats = STREAM_STATS[node_id] = NodeStreamStats(interval=interval)
+    elif stats.frames >= MIN_FRAMES:
+        ratios = []
+        if stats.avg_frame_bytes > 0:
+            ratios.append(target_bytes / stats.avg_frame_bytes)
+        if stats.avg_parse_ms > 0:
+            ratios.append(target_ms / stats.avg_parse_ms)
+        if ratios:
+            proposed = stats.interval * min(ratios)
+            # Geometric mean with the current interval to avoid oscillation
+            stats.interval = math.sqrt(stats.interval * proposed)
+    stats.interval = round(min(max(stats.interval, min_interval), max_interval), 1)
+    stats.frames = 0
+    stats.total_bytes = 0
+    return str(stats.interval)
+
+
+def stream_stats_message() -> str:
+    """
+    Return a summary of the chosen interval and frame sizes of every node.
+    """
+    return "\n".join(
+        f"node {node_id}: interval {stats.interval}s, {stats.frames} frames, "
+        + f"avg frame {stats.avg_frame_bytes / 1024:.1f} KiB, "
+        + f"avg parse {stats.avg_parse_ms:.1f} ms"
+        for node_id, stats in sorted(STREAM_STATS.items())
+    )
@@ -0,0 +1,77 @@
+"""
+This module contains the top-K tracking of the users with the most IPs.
+
+'TOP_OFFENDERS' follows the live window of the detector, '/top_offenders'
+and the API read it without sorting every user. The check report ranks
+the IPs counted by the check itself with 'top_users' (one pass over the
+users of the check, never a full sort).
+"""
+
+import heapq
+
+
+class TopOffenders:
+    """
+    A class used to keep the users with the most distinct IPs as the counts change.
+
+    Every update pushes (-count, user) on a heap, outdated entries are
+    dropped lazily when they reach the top, so 'top(n)' only touches
+    about n entries. The heap is rebuilt when outdated entries pile up.
+    The keys can be anything hashable, the detector also ranks the IPs
+    by their number of users with it.
+    """
+
+    def __init__(self):
+        self.counts: dict[str, int] = {}
+        self.heap: list[tuple[int, str]] = []
+
+    def update(self, user: str, count: int) -> None:
+        """
+        Set the number of distinct IPs of a user (0 removes the user).
+        """
+        if count <= 0:
+            self.counts.pop(user, None)
+            return
+        if self.counts.get(user) == count:
+            return
+        self.counts[user] = count
+        heapq.heappush(self.heap, (-count, user))
+        if len(self.heap) > 2 * len(self.counts) + 64:
+            self.heap = [(-count, user) for user, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        """
+        Return the n users with the most IPs as (user, count), most IPs first.
+        """
+        result = []
+        seen = set()
+        valid = []
+        while self.heap and len(result) < n:
+            entry = heapq.heappop(self.heap)
+            count, user = -entry[0], entry[1]
+            if self.counts.get(user) != count or user in seen:
+                continue
+            seen.add(user)
+            valid.append(entry)
+            result.append((user, count))
+        for entry in valid:
+            heapq.heappush(self.heap, entry)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+def top_users(users_log: dict[str, list[str]], n: int) -> list[tuple[str, list[str]]]:
+    """
+    Return the n users of a check with the most IPs, most IPs first.
+    It keeps a heap of n users while it scans the check, the users are not all sorted.
+    """
+    return heapq.nlargest(
+        n, (item for item in users_log.items() if item[1]), key=lambda item: len(item[1])
+    )
+
+
+# Fed by the detector, the users of the current window
+TOP_OFFENDERS = TopOffenders()
@@ -44,6 +44,65 @@ class NodeType:
     message: str | None = None
 
 
+@dataclass
+class NodeStreamStats:
+    """
+    A class used to represent the log stream statistics of a node.
+
+    Attributes:
+        interval (float): The websocket interval (seconds) of the current connection.
+        frames (int): The number of frames received with the current interval.
+        total_bytes (int): The number of bytes received with the current interval.
+        avg_frame_bytes (float): Moving average of the frame size.
+        avg_parse_ms (float): Moving average of the parse time of a frame,
+            without the IP geolocation lookups.
+    """
+
+    interval: float
+    frames: int = 0
+    total_bytes: int = 0
+    avg_frame_bytes: float = 0.0
+    avg_parse_ms: float = 0.0
+
+
+@dataclass
+class ViolationEvent:
+    """
+    A class used to represent a user that crossed its IP limit.
+
+    Attributes:
+        user (str): The name of the user.
+        ips (list[str]): The active IPs of the user.
+        limit (int): The IP limit of the user.
+        detected_at (float): The time (unix timestamp) of the detection.
+    """
+
+    user: str
+    ips: list[str]
+    limit: int
+    detected_at: float
+
+
+@dataclass
+class EnforcementAction:
+    """
+    Represents a pending disable or enable action of the enforcement queue.
+
+    Attributes:
+        user (str): The name of the user.
+        kind (str): "disable" or "enable".
+        reason (str): Why the action was queued.
+        enqueued_at (float): When the action was queued (unix timestamp).
+        attempts (int): The number of failed attempts.
+    """
+
+    user: str
+    kind: str
+    reason: str = ""
+    enqueued_at: float = 0.0
+    attempts: int = 0
+
+
 class UserStatus(Enum):
     """
     Enum representing the type of UserStatus.
@@ -0,0 +1,78 @@
+"""
+This module contains the user directory, a cached set of the panel usernames
+(of 'OWNER_USERNAME' if it is set) that is refreshed in the background,
+so the usage check never downloads the user list itself.
+"""
+
+import asyncio
+import time
+
+from utils.logs import logger
+from utils.panel_api import iter_users
+from utils.read_config import read_config
+from utils.types import PanelType
+
+
+class UserDirectory:
+    """
+    A class used to keep the usernames of the panel in a set.
+
+    The users are streamed page by page ('USERS_PAGE_SIZE' per page) into
+    a new set that replaces the current one once the last page is read,
+    so lookups always see a complete list.
+    """
+
+    def __init__(self):
+        self.users: set[str] = set()
+        self.owner: str | None = None
+        self.updated_at = 0.0
+        self.ready = False
+        self.lock = asyncio.Lock()
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.users
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    async def refresh(self, panel_data: PanelType) -> None:
+        """
+        Fetch all users from the panel and replace the cached set.
+        """
+        config_data = await read_config()
+        owner = config_data.get("OWNER_USERNAME", None)
+        async with self.lock:
+            users = set()
+            async for page in iter_users(panel_data):
+                users.update(user.name for user in page)
+            self.users = users
+            self.owner = owner
+            self.updated_at = time.time()
+            self.ready = True
+        logger.info(f"User directory refreshed: {len(users)} users")
+
+    async def ensure_ready(self, panel_data: PanelType) -> None:
+        """
+        Refresh the directory now if it was never loaded or 'OWNER_USERNAME' changed.
+        """
+        config_data = await read_config()
+        if self.ready and self.owner == config_data.get("OWNER_USERNAME", None):
+            return
+        await self.refresh(panel_data)
+
+    async def run(self, panel_data: PanelType) -> None:
+        """
+        Refresh the directory every 'USER_DIRECTORY_REFRESH' seconds,
+        the directory is only used when 'OWNER_USERNAME' is set.
+        """
+        while True:
+            config_data = await read_config()
+            if config_data.get("OWNER_USERNAME", None) is not None:
+                try:
+                    await self.refresh(panel_data)
+                except ValueError as error:
+                    logger.error(f"Failed to refresh the user directory: {error}")
+            await asyncio.sleep(int(config_data.get("USER_DIRECTORY_REFRESH", 300)))
+
+
+USER_DIRECTORY = UserDirectory()
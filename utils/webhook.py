@@ -0,0 +1,271 @@
+"""
+This module contains the webhook dispatcher that sends the user status
+changes to 'WEBHOOK_URL' in the background.
+
+Events are queued in memory (the overflow and the events that could not be
+delivered are spooled to 'data/.webhook_spool.jsonl'), handed to one worker per
+endpoint, sent with a shared client and retried with an exponential backoff. With 'WEBHOOK_BATCH_MS' the events
+are sent as a JSON array every 'WEBHOOK_BATCH_MS' milliseconds.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import TYPE_CHECKING
+
+from utils.data_dir import data_path
+from utils.logs import logger
+from utils.read_config import read_config
+
+if TYPE_CHECKING:
+    import httpx
+
+WEBHOOK_SPOOL_FILE = data_path(".webhook_spool.jsonl")
+WEBHOOK_QUEUE_SIZE = 1000
+# Max number of events sent in one batch
+WEBHOOK_BATCH_LIMIT = 500
+# Smoothing factor of the average delivery latency
+LATENCY_ALPHA = 0.2
+
+
+def webhook_urls(config_data: dict) -> list[str]:
+    """
+    Return the configured webhook endpoints, 'WEBHOOK_URL' can be a string or a list.
+    """
+    urls = config_data.get("WEBHOOK_URL", "")
+    if isinstance(urls, str):
+        urls = [urls]
+    return [url for url in urls if url]
+
+
+class WebhookDispatcher:
+    """
+    A class used to deliver the webhook events in the background.
+    """
+
+    def __init__(self, spool_filename: str = WEBHOOK_SPOOL_FILE):
+        self.spool_filename = spool_filename
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self.client: "httpx.AsyncClient | None" = None
+        # url -> sent, failed, retries, spooled, avg_latency_ms
+        self.stats: dict[str, dict] = {}
+        # url -> (events, batch) waiting for the worker of the endpoint
+        self.endpoint_queues: dict[str, asyncio.Queue[tuple[list[dict], bool]]] = {}
+
+    def notify(self, username: str, status: str) -> None:
+        """
+        Queue a status change of a user, never blocks.
+
+        Args:
+            username (str): The name of the user.
+            status (str): "enabled" or "disabled".
+        """
+        event = {"username": username, "status": status}
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.spool(None, [event])
+
+    def spool(self, url: str | None, events: list[dict]) -> None:
+        """
+        Append events to the spool file, 'url' is None for events
+        that must be sent to every endpoint.
+        """
+        try:
+            with open(self.spool_filename, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"url": url, "events": events}) + "\n")
+        except OSError as error:
+            logger.error(f"Failed to spool {len(events)} webhook events: {error}")
+            return
+        if url is not None:
+            self.endpoint_stats(url)["spooled"] += len(events)
+
+    def read_spool(self) -> list[dict]:
+        """
+        Move the spool file aside and read it. The moved file is only removed
+        once its events were sent (or spooled again), a crash in between
+        replays them on the next start.
+        """
+        replay_filename = f"{self.spool_filename}.replay"
+        if not os.path.exists(replay_filename):
+            if not os.path.exists(self.spool_filename):
+                return []
+            os.replace(self.spool_filename, replay_filename)
+        entries = []
+        with open(replay_filename, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping broken entry in {replay_filename}")
+        return entries
+
+    def endpoint_stats(self, url: str) -> dict:
+        """
+        Return the metrics of an endpoint.
+        """
+        stats = self.stats.get(url)
+        if stats is None:
+            stats = self.stats[url] = {
+                "sent": 0,
+                "failed": 0,
+                "retries": 0,
+                "spooled": 0,
+                "avg_latency_ms": 0.0,
+            }
+        return stats
+
+    async def get_client(self, config_data: dict) -> "httpx.AsyncClient":
+        """
+        Return the shared client, it is created on first use.
+        """
+        if self.client is None:
+            # Imported here so 'httpx' is only loaded when a webhook is configured
+            import httpx  # pylint: disable=import-outside-toplevel,redefined-outer-name
+
+            self.client = httpx.AsyncClient(
+                timeout=float(config_data.get("WEBHOOK_TIMEOUT", 5))
+            )
+        return self.client
+
+    async def deliver(self, url: str, events: list[dict], batch: bool) -> None:
+        """
+        Send events to an endpoint, retrying with an exponential backoff.
+        Events that still fail after 'WEBHOOK_MAX_ATTEMPTS' attempts are spooled.
+        """
+        config_data = await read_config()
+        max_attempts = int(config_data.get("WEBHOOK_MAX_ATTEMPTS", 5))
+        client = await self.get_client(config_data)
+        import httpx  # pylint: disable=import-outside-toplevel,redefined-outer-name
+
+        stats = self.endpoint_stats(url)
+        payloads = [events] if batch else events
+        for index, payload in enumerate(payloads):
+            for attempt in range(max_attempts):
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    response.raise_for_status()
+                except (httpx.HTTPError, OSError) as error:
+                    if attempt + 1 < max_attempts:
+                        stats["retries"] += 1
+                        await asyncio.sleep(min(2**attempt, 60))
+                        continue
+                    stats["failed"] += 1
+                    logger.error(f"Failed to send webhook to {url}: {error}")
+                    self.spool(url, events if batch else events[index:])
+                    return
+                latency = (time.perf_counter() - start) * 1000
+                stats["avg_latency_ms"] += LATENCY_ALPHA * (latency - stats["avg_latency_ms"])
+                stats["sent"] += len(payload) if batch else 1
+                break
+
+    async def collect(self, batch_ms: int) -> list[dict]:
+        """
+        Wait for the next event, in batch mode also collect the events
+        that arrive in the next 'batch_ms' milliseconds.
+        """
+        events = [await self.queue.get()]
+        if batch_ms <= 0:
+            return events
+        deadline = time.monotonic() + batch_ms / 1000
+        while len(events) < WEBHOOK_BATCH_LIMIT:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return events
+
+    async def replay_spool(self) -> None:
+        """
+        Send the spooled events again.
+        """
+        config_data = await read_config()
+        urls = webhook_urls(config_data)
+        batch = int(config_data.get("WEBHOOK_BATCH_MS", 0)) > 0
+        entries = await asyncio.to_thread(self.read_spool)
+        for entry in entries:
+            if entry["url"] is None and not urls:
+                # Kept for the endpoints configured later
+                self.spool(None, entry["events"])
+                continue
+            targets = urls if entry["url"] is None else [entry["url"]]
+            await asyncio.gather(
+                *(self.deliver(url, entry["events"], batch) for url in targets)
+            )
+        if os.path.exists(f"{self.spool_filename}.replay"):
+            os.remove(f"{self.spool_filename}.replay")
+
+    async def run_spool(self) -> None:
+        """
+        Replay the spool every 'WEBHOOK_SPOOL_INTERVAL' seconds.
+        """
+        while True:
+            try:
+                await self.replay_spool()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Failed to replay the webhook spool: {error}")
+            config_data = await read_config()
+            await asyncio.sleep(int(config_data.get("WEBHOOK_SPOOL_INTERVAL", 60)))
+
+    async def endpoint_worker(
+        self, url: str, queue: asyncio.Queue[tuple[list[dict], bool]]
+    ) -> None:
+        """
+        Send the events queued for one endpoint, a slow or failing endpoint
+        only delays its own events.
+        """
+        while True:
+            events, batch = await queue.get()
+            try:
+                await self.deliver(url, events, batch)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(f"Failed to send webhook to {url}: {error}")
+                self.spool(url, events)
+
+    async def dispatch(self) -> None:
+        """
+        Hand the queued events to the worker of every endpoint.
+        """
+        async with asyncio.TaskGroup() as tg:
+            while True:
+                config_data = await read_config()
+                batch_ms = int(config_data.get("WEBHOOK_BATCH_MS", 0))
+                events = await self.collect(batch_ms)
+                for url in webhook_urls(config_data):
+                    queue = self.endpoint_queues.get(url)
+                    if queue is None:
+                        queue = self.endpoint_queues[url] = asyncio.Queue(
+                            maxsize=WEBHOOK_QUEUE_SIZE
+                        )
+                        tg.create_task(self.endpoint_worker(url, queue), name=f"webhook_{url}")
+                    try:
+                        queue.put_nowait((events, batch_ms > 0))
+                    except asyncio.QueueFull:
+                        self.spool(url, events)
+
+    async def run(self) -> None:
+        """
+        Run the dispatcher and the spool replay.
+        """
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self.dispatch(), name="webhook_dispatch")
+            tg.create_task(self.run_spool(), name="webhook_spool")
+
+    def stats_message(self) -> str:
+        """
+        Return the metrics of every endpoint, one line per endpoint.
+        """
+        return "\n".join(
+            f"{url}: sent={stats['sent']} failed={stats['failed']} "
+            + f"retries={stats['retries']} spooled={stats['spooled']} "
+            + f"avg_latency={stats['avg_latency_ms']:.0f}ms"
+            for url, stats in self.stats.items()
+        )
+
+
+WEBHOOK = WebhookDispatcher()